@@ -0,0 +1,8 @@
+-- job queue: class of the queued job, and worker executing it
+ALTER TABLE "ncpp_job" ADD COLUMN "job_class" varchar(200);
+ALTER TABLE "ncpp_job" ADD COLUMN "worker" varchar(200);
+-- class of the existing jobs, read by the views and the workers
+UPDATE "ncpp_job" SET "job_class" = 'ncpp.models.open_climate_gis.OpenClimateGisJob'
+    WHERE "id" IN (SELECT "job_ptr_id" FROM "ncpp_openclimategisjob");
+UPDATE "ncpp_job" SET "job_class" = 'ncpp.models.climate_indexes.ClimateIndexJob'
+    WHERE "id" IN (SELECT "job_ptr_id" FROM "ncpp_climateindexjob");
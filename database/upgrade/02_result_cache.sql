@@ -0,0 +1,3 @@
+-- result cache: hits and misses of each job
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "cache_hits" integer NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "cache_misses" integer NOT NULL DEFAULT 0;
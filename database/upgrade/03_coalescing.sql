@@ -0,0 +1,5 @@
+-- coalescing of identical jobs: request key, and job whose result is shared
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "cache_key" varchar(64);
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "leader_id" integer REFERENCES "ncpp_openclimategisjob" ("job_ptr_id");
+CREATE INDEX "ncpp_openclimategisjob_b9263cc4" ON "ncpp_openclimategisjob" ("cache_key");
+CREATE INDEX "ncpp_openclimategisjob_dacdec91" ON "ncpp_openclimategisjob" ("leader_id");
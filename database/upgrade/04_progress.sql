@@ -0,0 +1,4 @@
+-- progress of the running jobs
+ALTER TABLE "ncpp_job" ADD COLUMN "progress" real NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_job" ADD COLUMN "phase" varchar(200);
+ALTER TABLE "ncpp_job" ADD COLUMN "bytes_read" bigint NOT NULL DEFAULT 0;
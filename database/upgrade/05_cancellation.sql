@@ -0,0 +1,2 @@
+-- cancellation of the running jobs
+ALTER TABLE "ncpp_job" ADD COLUMN "cancel_requested" bool NOT NULL DEFAULT 0;
@@ -0,0 +1,9 @@
+-- scheduling: priority class and earliest start of the queued jobs, and submission rate of each user
+ALTER TABLE "ncpp_job" ADD COLUMN "priority" integer NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_job" ADD COLUMN "not_before" datetime;
+CREATE TABLE IF NOT EXISTS "ncpp_submissionbucket" (
+    "id" integer NOT NULL PRIMARY KEY,
+    "user_id" integer NOT NULL UNIQUE REFERENCES "auth_user" ("id"),
+    "tokens" real NOT NULL,
+    "updated" datetime NOT NULL
+);
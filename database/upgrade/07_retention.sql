@@ -0,0 +1,3 @@
+-- retention of the job outputs: size and last access
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "output_size" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "last_access" datetime;
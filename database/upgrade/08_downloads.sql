@@ -0,0 +1,3 @@
+-- downloads of the job outputs
+ALTER TABLE "ncpp_job" ADD COLUMN "download_count" integer NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_job" ADD COLUMN "bytes_downloaded" bigint NOT NULL DEFAULT 0;
@@ -0,0 +1,3 @@
+-- previews, and summary of their output
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "preview" bool NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_openclimategisjob" ADD COLUMN "summary" text;
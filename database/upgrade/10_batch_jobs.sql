@@ -0,0 +1,13 @@
+-- batch jobs
+CREATE TABLE IF NOT EXISTS "ncpp_openclimategisbatchjob" (
+    "job_ptr_id" integer NOT NULL PRIMARY KEY REFERENCES "ncpp_job" ("id"),
+    "template" text NOT NULL,
+    "geometry_ids" text,
+    "datasets" text,
+    "members" text,
+    "output_size" bigint NOT NULL,
+    "last_access" datetime
+);
+-- retention of the outputs split for the climate index jobs
+ALTER TABLE "ncpp_climateindexjob" ADD COLUMN "output_size" bigint NOT NULL DEFAULT 0;
+ALTER TABLE "ncpp_climateindexjob" ADD COLUMN "last_access" datetime;
@@ -0,0 +1,2 @@
+-- climate index jobs computed together by a single remote execution
+ALTER TABLE "ncpp_climateindexjob" ADD COLUMN "group_size" integer NOT NULL DEFAULT 1;
@@ -0,0 +1,51 @@
+# module containing the authentication of the scripted clients of the JSON API
+from django.contrib.auth import authenticate
+from django.http import HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import simplejson
+from django.views.decorators.csrf import csrf_exempt
+from functools import wraps
+import base64
+
+# realm announced to the clients that did not send their credentials
+API_REALM = 'NCPP'
+
+def get_basic_credentials(request):
+    """Returns the (username, password) of the HTTP Basic 'Authorization' header, or None if not present or invalid."""
+
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not header.lower().startswith('basic '):
+        return None
+    try:
+        username, password = base64.b64decode( header.split(' ', 1)[1].strip() ).split(':', 1)
+    except (TypeError, ValueError):
+        return None
+    return (username, password)
+
+def _unauthorized():
+    response = HttpResponse(simplejson.dumps({'error':'Authentication required'}), mimetype='application/json', status=401)
+    response['WWW-Authenticate'] = 'Basic realm="%s"' % API_REALM
+    return response
+
+def api_login_required(view):
+    """Decorator of the API views: the user is authenticated on each request by HTTP Basic credentials,
+       so that scripted clients need no session, or by the session of a logged in user.
+       Requests authenticated by the session are checked against cross-site request forgery as any other view."""
+
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        if 'HTTP_AUTHORIZATION' in request.META:
+            credentials = get_basic_credentials(request)
+            user = authenticate(username=credentials[0], password=credentials[1]) if credentials is not None else None
+            if user is None or not user.is_active:
+                return _unauthorized()
+            request.user = user
+        elif request.user.is_authenticated():
+            response = CsrfViewMiddleware().process_view(request, view, args, kwargs)
+            if response is not None:
+                return response
+        else:
+            return _unauthorized()
+        return view(request, *args, **kwargs)
+
+    return csrf_exempt(_view)
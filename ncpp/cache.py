@@ -0,0 +1,178 @@
+# module containing the content-addressed store of Open Climate GIS results
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+# version of the key encoding: increment to invalidate all cached results
+CACHE_VERSION = 1
+# arguments that do not affect the content of the output
+EXCLUDED_ARGS = ['dir_output']
+# arguments whose values are unordered collections
+UNORDERED_ARGS = ['select_ugid', 'calc_grouping']
+
+def _normalize(value):
+    """Converts an argument value into a canonical form that can be serialized to JSON."""
+
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    elif isinstance(value, dict):
+        return dict( (str(k), _normalize(v)) for k, v in value.items() )
+    elif isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    elif isinstance(value, unicode):
+        return value.encode('utf8')
+    else:
+        return value
+
+def encode_key(args):
+    """Returns the canonical hash of the arguments of an Open Climate GIS job,
+       identical for all jobs that produce the same output."""
+
+    canonical = {'version': CACHE_VERSION}
+    for key, value in args.items():
+        if key not in EXCLUDED_ARGS:
+            value = _normalize(value)
+            if key in UNORDERED_ARGS and value is not None:
+                value = sorted(value)
+            elif key == 'time_region' and value is not None:
+                value = dict( (k, sorted(v) if v is not None else None) for k, v in value.items() )
+            canonical[key] = value
+    return hashlib.sha256( json.dumps(canonical, sort_keys=True) ).hexdigest()
+
+def get_size(path):
+    """Returns the total size in bytes of a file or directory tree."""
+
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            size += os.path.getsize( os.path.join(dirpath, filename) )
+    return size
+
+def get_unlinked_size(paths):
+    """Returns the number of bytes freed by removing the given files or directory trees:
+       the files that remain hard linked from elsewhere are not counted."""
+
+    # (links removed, total links, size) of each file
+    files = {}
+    for path in paths:
+        if os.path.isdir(path):
+            filepaths = [os.path.join(dirpath, filename) for dirpath, dirnames, filenames in os.walk(path) for filename in filenames]
+        elif os.path.isfile(path):
+            filepaths = [path]
+        else:
+            filepaths = []
+        for filepath in filepaths:
+            stat = os.lstat(filepath)
+            removed, nlink, size = files.get( (stat.st_dev, stat.st_ino), (0, stat.st_nlink, stat.st_size) )
+            files[(stat.st_dev, stat.st_ino)] = (removed+1, nlink, size)
+    return sum([size for removed, nlink, size in files.values() if removed >= nlink])
+
+def _link(src, dst):
+    """Populates 'dst' with hard links to the file or directory tree 'src', copying when linking is not possible."""
+
+    if os.path.isdir(src):
+        os.makedirs(dst)
+        for name in os.listdir(src):
+            _link(os.path.join(src, name), os.path.join(dst, name))
+    else:
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+
+class ResultCache(object):
+    """Content-addressed store of job outputs, with a bounded size and least-recently-used eviction.
+       Each entry is a directory <cacheDir>/<key[0:2]>/<key>/ containing the single output returned to the user."""
+
+    def __init__(self, cacheDir, maxSize):
+        # root directory of the store
+        self.cacheDir = cacheDir
+        # maximum size of the store in bytes
+        self.maxSize = maxSize
+
+    def getKey(self, args):
+        return encode_key(args)
+
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, key[0:2], key)
+
+    def lookup(self, key):
+        """Returns the path of the output stored for 'key', or None if not found."""
+
+        entryDir = self.getEntryDir(key)
+        try:
+            names = os.listdir(entryDir)
+        except OSError:
+            return None
+        if len(names) != 1:
+            return None
+        # mark the entry as recently used
+        try:
+            os.utime(entryDir, None)
+        except OSError:
+            pass
+        return os.path.join(entryDir, names[0])
+
+    def store(self, key, path):
+        """Stores the output file or directory 'path' for 'key', and returns the path of the stored copy."""
+
+        entryDir = self.getEntryDir(key)
+        if not os.path.exists(entryDir):
+            # populate a temporary directory first, so that concurrent workers never see partial entries
+            tmpDir = "%s.tmp.%s" % (entryDir, os.getpid())
+            if os.path.exists(tmpDir):
+                shutil.rmtree(tmpDir)
+            os.makedirs(tmpDir)
+            _link(path, os.path.join(tmpDir, os.path.basename(path.rstrip(os.sep))))
+            try:
+                os.rename(tmpDir, entryDir)
+            except OSError:
+                # another worker stored the same result first
+                shutil.rmtree(tmpDir)
+        self.evict()
+        # the output may have been evicted right away if larger than the whole store
+        return self.lookup(key) or path
+
+    def getEntries(self):
+        """Returns the list of (last access time, size, entry directory) of all entries, least recently used first."""
+
+        entries = []
+        if not os.path.exists(self.cacheDir):
+            return entries
+        for shard in os.listdir(self.cacheDir):
+            shardDir = os.path.join(self.cacheDir, shard)
+            if not os.path.isdir(shardDir):
+                continue
+            for key in os.listdir(shardDir):
+                entryDir = os.path.join(shardDir, key)
+                if '.tmp.' not in key:
+                    try:
+                        entries.append( (os.path.getmtime(entryDir), get_size(entryDir), entryDir) )
+                    except OSError:
+                        pass
+        return sorted(entries)
+
+    def remove(self, key):
+        """Removes the entry stored for 'key', if any."""
+
+        entryDir = self.getEntryDir(key)
+        if os.path.exists(entryDir):
+            print 'Removing cached result: %s' % entryDir
+            shutil.rmtree(entryDir, ignore_errors=True)
+
+    def evict(self):
+        """Removes the least recently used entries until the store fits within its maximum size."""
+
+        entries = self.getEntries()
+        size = sum([entry[1] for entry in entries])
+        for mtime, entrySize, entryDir in entries:
+            if size <= self.maxSize:
+                break
+            print 'Evicting cached result: %s' % entryDir
+            shutil.rmtree(entryDir, ignore_errors=True)
+            size -= entrySize
@@ -0,0 +1,230 @@
+# module containing the local cache of the data read from remote datasets (OPeNDAP and HTTP URIs),
+# served to ocgis through a proxy so that repeated reads of the same slabs do not go over the network
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import os
+import re
+import threading
+import urllib
+import urllib2
+
+# URI schemes of the remote datasets read through the cache ('dods' is OPeNDAP over HTTP)
+REMOTE_SCHEMES = ['http', 'https', 'dods']
+# response headers kept with the cached data, needed by the OPeNDAP and HTTP clients
+CACHED_HEADERS = ['Content-Type', 'Content-Range', 'Content-Description', 'Last-Modified',
+                  'XDODS-Server', 'XOPeNDAP-Server', 'XDAP']
+# seconds to wait for the remote server
+FETCH_TIMEOUT = 300
+
+def is_remote(uri):
+    """Returns True if the dataset URI points to a remote server."""
+
+    return uri.split('://', 1)[0].lower() in REMOTE_SCHEMES if '://' in uri else False
+
+def parse_request(url):
+    """Returns the (uri, variable, hyperslab, selection) of an OPeNDAP request URL, for example
+       'http://host/data.nc.dods?tas[0:1:9][10:1:20][30:1:40]' for ('http://host/data.nc.dods', 'tas', '[0:1:9][10:1:20][30:1:40]', '').
+       Several projected variables are separated by commas. The selection clauses following the projection are
+       joined by '&' in sorted order, since they all apply. Requests without constraint have empty variable, hyperslab and selection."""
+
+    uri, query = url.split('?', 1) if '?' in url else (url, '')
+    variables = []
+    hyperslabs = []
+    clauses = [urllib.unquote(clause) for clause in query.split('&')]
+    projection = clauses[0]
+    for clause in projection.split(',') if projection else []:
+        variable, hyperslab = re.match(r'^([^\[]*)(.*)$', clause).groups()
+        variables.append(variable)
+        hyperslabs.append(hyperslab)
+    selection = '&'.join( sorted([clause for clause in clauses[1:] if clause]) )
+    return (uri, ','.join(variables), ','.join(hyperslabs), selection)
+
+
+class ChunkCache(object):
+    """Store of the responses of remote servers keyed on (uri, variable, hyperslab), with a bounded size
+       and least-recently-used eviction. The hyperslab of a plain HTTP request is its byte range."""
+
+    def __init__(self, cacheDir, maxSize):
+        # root directory of the store
+        self.cacheDir = cacheDir
+        # maximum total size of the entries in bytes
+        self.maxSize = maxSize
+        # number of requests served from the store/from the remote servers
+        self.hits = 0
+        self.misses = 0
+        # total size of the entries, read from the directory on the first store, then counted as entries are stored:
+        # the directory is only scanned again when the size exceeds the maximum
+        self.size = None
+
+    def getKey(self, uri, variable, hyperslab, selection=''):
+        return hashlib.sha1( json.dumps([uri, variable, hyperslab, selection]) ).hexdigest()
+
+    def _getPath(self, key):
+        return os.path.join(self.cacheDir, key[0:2], key)
+
+    def lookup(self, key):
+        """Returns the (headers, data) stored for 'key', or None if not found."""
+
+        path = self._getPath(key)
+        try:
+            with open(path, 'rb') as f:
+                headers = json.loads( f.readline() )
+                data = f.read()
+        except (IOError, ValueError):
+            return None
+        # mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return (headers, data)
+
+    def store(self, key, headers, data):
+        """Stores the response headers and data for 'key'."""
+
+        path = self._getPath(key)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by another worker
+                pass
+        # write a temporary file first, so that concurrent workers never read partial entries
+        tmpPath = "%s.tmp.%s.%s" % (path, os.getpid(), threading.current_thread().ident)
+        with open(tmpPath, 'wb') as f:
+            f.write( json.dumps(headers) + '\n' )
+            f.write(data)
+        if self.size is None:
+            self.size = sum([entry[1] for entry in self.getEntries()])
+        self.size += os.path.getsize(tmpPath)
+        os.rename(tmpPath, path)
+        if self.size > self.maxSize:
+            self.evict()
+
+    def getEntries(self):
+        """Returns the list of (last access time, size, path) of all entries, least recently used first."""
+
+        entries = []
+        if not os.path.exists(self.cacheDir):
+            return entries
+        for shard in os.listdir(self.cacheDir):
+            shardDir = os.path.join(self.cacheDir, shard)
+            if not os.path.isdir(shardDir):
+                continue
+            for key in os.listdir(shardDir):
+                path = os.path.join(shardDir, key)
+                if '.tmp.' not in key:
+                    try:
+                        entries.append( (os.path.getmtime(path), os.path.getsize(path), path) )
+                    except OSError:
+                        pass
+        return sorted(entries)
+
+    def evict(self):
+        """Removes the least recently used entries until the store fits within its maximum size."""
+
+        entries = self.getEntries()
+        size = sum([entry[1] for entry in entries])
+        for mtime, entrySize, path in entries:
+            if size <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entrySize
+        self.size = size
+
+    def fetch(self, url, byteRange=None):
+        """Returns the (headers, data) of the response to a GET request, from the store if available.
+           Only successful responses are stored; errors raise urllib2.HTTPError or urllib2.URLError."""
+
+        uri, variable, hyperslab, selection = parse_request(url)
+        key = self.getKey(uri, variable, byteRange or hyperslab, selection)
+        entry = self.lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        request = urllib2.Request(url)
+        if byteRange is not None:
+            request.add_header('Range', byteRange)
+        response = urllib2.urlopen(request, timeout=FETCH_TIMEOUT)
+        try:
+            data = response.read()
+            headers = {'status':response.getcode()}
+            for name in CACHED_HEADERS:
+                value = response.info().getheader(name)
+                if value is not None:
+                    headers[name] = value
+        finally:
+            response.close()
+        self.store(key, headers, data)
+        return (headers, data)
+
+
+class _ProxyHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the requests for remote URLs from the chunk cache of the server."""
+
+    def do_GET(self):
+        try:
+            headers, data = self.server.cache.fetch( self.server.getRemoteUrl(self.path), self.headers.getheader('Range') )
+        except urllib2.HTTPError as e:
+            self.send_error(e.code)
+            return
+        except (urllib2.URLError, IOError) as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(headers['status'])
+        for name in CACHED_HEADERS:
+            if name in headers:
+                self.send_header(name, headers[name])
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ProxyServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def getRemoteUrl(self, path):
+        # '/<scheme>/<host>/<path>' -> '<scheme>://<host>/<path>', OPeNDAP being served over HTTP
+        scheme, rest = path.lstrip('/').split('/', 1)
+        return '%s://%s' % ('http' if scheme == 'dods' else scheme, rest)
+
+
+class ChunkCacheProxy(object):
+    """Local HTTP server reading the remote datasets through a chunk cache. The dataset URIs passed to ocgis
+       are rewritten to point to the proxy, so that the OPeNDAP requests of the netCDF library go through the cache."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.server = None
+
+    def start(self):
+        """Starts serving in a background thread, on a free local port."""
+
+        self.server = _ProxyServer(('127.0.0.1', 0), _ProxyHandler)
+        self.server.cache = self.cache
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+
+    def getUrl(self, uri):
+        """Returns the URL of the proxy for a remote dataset URI, or the URI itself for a local dataset."""
+
+        if not is_remote(uri):
+            return uri
+        scheme, rest = uri.split('://', 1)
+        return 'http://127.0.0.1:%s/%s/%s' % (self.server.server_address[1], scheme.lower(), rest)
@@ -0,0 +1,118 @@
+# module containing the use of precomputed climatology cubes in place of the daily datasets
+# (the cubes are computed and catalogued by util.data_scanner.climatology)
+import itertools
+
+# calculations whose result over a single value is the value itself: applying them again to a cube
+# with one value per group returns the values of the cube, so the cube can replace the original dataset
+CLIMATOLOGY_FUNCS = ['mean', 'max', 'min', 'median', 'sum']
+# calculations that commute with the spatial average of an aggregated request
+LINEAR_FUNCS = ['mean', 'sum']
+# calculation groups, from the finest to the coarsest
+GROUP_ORDER = ['hour', 'day', 'month', 'year']
+
+def get_climatology_calcs(calcs):
+    """Returns the functions of the calculations (from ocgis_calc.json) that are precomputed in climatology cubes."""
+
+    return sorted([str(calc['func']) for calc in calcs.values()
+                   if calc['func'] in CLIMATOLOGY_FUNCS and not calc.get('keywords')])
+
+def get_climatology_groupings(groups, time_frequency='day'):
+    """Returns the calculation groupings precomputed for a dataset with the given time frequency:
+       all the combinations of the configured groups not finer than the time frequency, except the combination
+       identifying a single time step, which would not reduce the data."""
+
+    groups = [group for group in GROUP_ORDER if group in groups and GROUP_ORDER.index(group) >= GROUP_ORDER.index(time_frequency)]
+    full = GROUP_ORDER[GROUP_ORDER.index(time_frequency):]
+    groupings = []
+    for n in range(1, len(groups)+1):
+        for grouping in itertools.combinations(groups, n):
+            if list(grouping) != full:
+                groupings.append( list(grouping) )
+    return groupings
+
+def encode_grouping(grouping):
+    """Returns the string identifying a calculation grouping independently of the order of its groups."""
+
+    return ','.join( sorted(grouping) )
+
+def get_climatology_calc(args):
+    """Returns the (function, grouping) of the calculation of a request that could be read from climatology cubes,
+       or None if the request is not eligible."""
+
+    if args['calc'] is None or len(args['calc']) != 1 or args['calc'][0]['kwds'] or args['calc_raw']:
+        return None
+    func = args['calc'][0]['func']
+    grouping = args['calc_grouping']
+    if func not in CLIMATOLOGY_FUNCS or not grouping:
+        return None
+    if args['aggregate'] and func not in LINEAR_FUNCS:
+        return None
+    # a selection of months or years only applies to groups computed within a single month or year
+    time_region = args['time_region'] or {}
+    for group in ['month', 'year']:
+        if time_region.get(group) is not None and group not in grouping:
+            return None
+    return (func, encode_grouping(grouping))
+
+def rewrite_args(args, cubes):
+    """Returns a copy of the ocgis arguments reading the given climatology cubes (one dictionary of catalog metadata
+       for each dataset URI) instead of the original datasets, or None if a cube is missing or does not cover the request."""
+
+    if cubes is None or None in cubes:
+        return None
+    # the cubes hold groups computed over the whole time range of the datasets
+    if args['time_range'] is not None:
+        for cube in cubes:
+            if args['time_range'][0] > cube['time_start'] or args['time_range'][1] < cube['time_stop']:
+                return None
+    args = dict(args)
+    args['uri'] = [cube['uri'] for cube in cubes]
+    args['variable'] = [cube['variable'] for cube in cubes]
+    args['t_units'] = [cube['time_units'] for cube in cubes]
+    args['t_calendar'] = [cube['time_calendar'] for cube in cubes]
+    args['time_range'] = None
+    args['climatology'] = True
+    return args
+
+
+class ClimatologyStore(object):
+    """Looks up the climatology cubes registered in the dataset catalog built by util.data_scanner."""
+
+    def __init__(self, catalogPath):
+        # path of the SQLite catalog
+        self.catalogPath = catalogPath
+
+    def getCubes(self, uris, func, grouping):
+        """Returns the catalog metadata of the cube of each dataset URI for the given calculation,
+           with None for the datasets without cube, or None if the catalog is not available."""
+
+        if self.catalogPath is None:
+            return None
+        # the catalog requires the optional sqlalchemy library
+        try:
+            from util.data_scanner import db
+        except ImportError:
+            return None
+
+        db.connect(self.catalogPath)
+        cubes = []
+        with db.session_scope() as session:
+            for uri in uris:
+                query = session.query(db.Climatology).join(db.Field).join(db.Container).join(db.Uri)
+                cube = query.filter(db.Uri.value == uri, db.Climatology.func == func, db.Climatology.calc_grouping == grouping).first()
+                if cube is None:
+                    cubes.append(None)
+                else:
+                    cubes.append( dict( (key, getattr(cube, key)) for key in
+                                        ['uri', 'variable', 'time_units', 'time_calendar', 'time_start', 'time_stop'] ) )
+        return cubes
+
+    def rewrite(self, args):
+        """Returns the ocgis arguments reading the climatology cubes matching the request, or None if there are none."""
+
+        calc = get_climatology_calc(args)
+        if calc is None:
+            return None
+        # each dataset URI is a list of files: look up the first one
+        uris = [uri[0] if isinstance(uri, list) else uri for uri in args['uri']]
+        return rewrite_args(args, self.getCubes(uris, *calc))
@@ -36,6 +36,13 @@ class Config():
     SPATIAL_OPERATION = 'spatial_operation'
     
     
+def ocgisOption(section, option, default=None):
+    """Returns the value of a configuration option, or the default value if the option is not found."""
+    
+    if ocgisConfig.has_option(section, option):
+        return ocgisConfig.get(section, option)
+    return default
+    
 def ocgisChoices(section, nochoice=False):
     choices = {}
     # add empty choice 
@@ -20,8 +20,20 @@ def enum(**enums):
             raise Exception('Unknown process execution status: %s' % self.status)
 
 
-JOB_STATUS = enum(UNKNOWN='Status Unknown', STARTED='Process Started', RUNNING='Process Running', SUCCESS='Process Succeeded', 
-                  FAILED='Process Failed', ACCEPTED='Process Accepted', PAUSED='ProcessPaused', ERROR='Error')
+JOB_STATUS = enum(UNKNOWN='Status Unknown', QUEUED='Process Queued', ATTACHED='Process Attached', STARTED='Process Started', 
+                  RUNNING='Process Running', SUCCESS='Process Succeeded', FAILED='Process Failed', ACCEPTED='Process Accepted', PAUSED='ProcessPaused', ERROR='Error',
+                  CANCELLED='Process Cancelled', TIMEOUT='Process Timed Out', REJECTED='Process Rejected',
+                  EXPIRED='Output Expired')
+# priority classes of the queued jobs, in order of execution
+JOB_PRIORITY = enum(PREVIEW=-1, INTERACTIVE=0, BULK=1)
+
+# statuses reported by a WPS server for executions that have completed, recorded as is by the climate index jobs
+WPS_FINAL_STATUSES = ['ProcessSucceeded', 'ProcessFailed', 'Exception']
+# statuses of jobs that have completed successfully, with an output to download
+JOB_SUCCESS_STATUSES = [JOB_STATUS.SUCCESS, 'ProcessSucceeded']
+# statuses of jobs that have finished executing, one way or another
+JOB_FINAL_STATUSES = [JOB_STATUS.SUCCESS, JOB_STATUS.FAILED, JOB_STATUS.ERROR, JOB_STATUS.CANCELLED, JOB_STATUS.TIMEOUT,
+                      JOB_STATUS.REJECTED, JOB_STATUS.EXPIRED] + WPS_FINAL_STATUSES
 
 MONTH_CHOICES = ( (1,'Jan'), (2,'Feb'), (3,'Mar'), (4,'Apr'),   (5,'May'),   (6,'Jun'),
                   (7,'Jul'), (8,'Aug'), (9,'Sep'), (10,'Oct'), (11,'Nov'), (12,'Dec'))
@@ -0,0 +1,129 @@
+# module containing the streaming of job outputs over HTTP, with support for byte ranges and front-end server offload
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import http_date
+import mimetypes
+import os
+import re
+
+from ncpp.zipstream import ZipStream
+
+# number of bytes read from disk and sent at once
+DOWNLOAD_CHUNK_SIZE = getattr(settings, "NCPP_DOWNLOAD_CHUNK_SIZE", 64*1024)
+# delegate the transfer to the front-end server: None, 'sendfile' (Apache mod_xsendfile, lighttpd) or 'accel' (nginx)
+DOWNLOAD_OFFLOAD = getattr(settings, "NCPP_DOWNLOAD_OFFLOAD", None)
+# for 'accel': internal nginx location mapped to the output root directory
+DOWNLOAD_ACCEL_PREFIX = getattr(settings, "NCPP_DOWNLOAD_ACCEL_PREFIX", "/protected/ocgis/")
+
+def parse_range(header, size):
+    """Parses the value of a 'Range' header for a file of the given size.
+       Returns the tuple (first byte, last byte) of the requested range, None to send the whole file
+       (no header, unsupported or multiple ranges), or False if the range cannot be satisfied."""
+
+    match = re.match(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        # suffix range: the last N bytes
+        if int(last) == 0:
+            return False
+        return (max(0, size-int(last)), size-1)
+    first = int(first)
+    last = size-1 if last == '' else min(int(last), size-1)
+    if first >= size or first > last:
+        return False
+    return (first, last)
+
+def file_iterator(path, offset, length, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Yields 'length' bytes of the file starting at 'offset', in chunks of at most 'chunk_size' bytes."""
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read( min(chunk_size, length) )
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+def get_archive_files(path):
+    """Returns the list of (file path, name in the archive) of the files under the directory 'path',
+       named relative to the directory and sorted so that the archive content is reproducible."""
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            filepath = os.path.join(dirpath, filename)
+            files.append( (filepath, os.path.relpath(filepath, path)) )
+    return files
+
+def serve_archive(request, path):
+    """Returns the response sending a ZIP archive of the directory at 'path', built while the files are read.
+       The size of the archive is not known in advance, so neither 'Content-Length' nor ranges are supported.
+       Returns the tuple (response, number of bytes of the archived files)."""
+
+    stream = ZipStream( get_archive_files(path), chunk_size=DOWNLOAD_CHUNK_SIZE )
+    content = iter(stream) if request.method != 'HEAD' else ''
+    response = HttpResponse(content, content_type='application/zip')
+    response['Accept-Ranges'] = 'none'
+    response['Content-Disposition'] = 'attachment; filename="%s.zip"' % os.path.basename(path.rstrip(os.sep))
+    return response, stream.getSize() if request.method != 'HEAD' else 0
+
+def serve_file(request, path, rootDir, offload=DOWNLOAD_OFFLOAD):
+    """Returns the response sending the file at 'path' (located under 'rootDir'), honoring 'Range' and 'If-Range' requests.
+       A directory is sent as a ZIP archive streamed on the fly.
+       Returns the tuple (response, number of bytes sent)."""
+
+    if os.path.isdir(path):
+        return serve_archive(request, path)
+
+    stat = os.stat(path)
+    size = stat.st_size
+    filename = os.path.basename(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = '"%x-%x"' % (int(stat.st_mtime), size)
+    last_modified = http_date(stat.st_mtime)
+
+    # the front-end server takes care of the ranges and of the transfer
+    if offload is not None:
+        response = HttpResponse(content_type=content_type)
+        if offload == 'accel':
+            response['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX + os.path.relpath(path, rootDir)
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response, size
+
+    # a range only applies to the version of the file known to the client
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range not in [etag, last_modified]:
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%s' % size
+        return response, 0
+
+    if byte_range is None:
+        first, last = 0, size-1
+        status = 200
+    else:
+        first, last = byte_range
+        status = 206
+    length = last-first+1 if size > 0 else 0
+
+    content = file_iterator(path, first, length) if request.method != 'HEAD' else ''
+    response = HttpResponse(content, status=status, content_type=content_type)
+    response['Content-Length'] = str(length)
+    if status == 206:
+        response['Content-Range'] = 'bytes %s-%s/%s' % (first, last, size)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response, length if request.method != 'HEAD' else 0
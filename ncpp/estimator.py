@@ -0,0 +1,215 @@
+# module containing the estimation of the cost of Open Climate GIS jobs from the metadata of the dataset catalog
+import math
+import re
+
+# size in bytes of one data value read from the datasets
+BYTES_PER_VALUE = 4
+# approximate size in bytes of one data value written in each output format
+OUTPUT_BYTES_PER_VALUE = {'csv':60, 'csv+':80, 'shp':400, 'nc':4}
+DEFAULT_OUTPUT_BYTES_PER_VALUE = 60
+# approximate throughput of reading the datasets, and of writing the output
+READ_BYTES_PER_SECOND = 50*1024*1024
+WRITE_BYTES_PER_SECOND = 5*1024*1024
+# number of groups per enclosing group for each calculation grouping, except 'year' and 'month' which depend on the request
+GROUP_SIZES = {'day':31, 'hour':24}
+
+# bounds of the selected shapefile geometries read by this process, keyed by (shapefile, selected identifiers)
+_bounds = {}
+
+def parse_envelope(wkt):
+    """Returns the bounds [xmin, xmax, ymin, ymax] of a WKT polygon."""
+
+    values = map(float, re.findall(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?', wkt))
+    xs, ys = values[0::2], values[1::2]
+    return [min(xs), max(xs), min(ys), max(ys)]
+
+def parse_shape(field_shape):
+    """Returns the field shape (realizations, times, levels, rows, columns) stored in the catalog as a tuple of integers."""
+
+    return tuple( map(int, re.findall(r'\d+', field_shape)) )
+
+def _count_cells(geom, envelope, resolution, nrows, ncols, bounds=None):
+    """Returns the number of grid cells read for the given geometry argument, or None if not known.
+       The geometries of a shapefile are each read over their bounding box, given in 'bounds'
+       as a list of (xmin, ymin, xmax, ymax), or None if not known."""
+
+    if not isinstance(geom, list):
+        if bounds is None:
+            return None
+        cells = sum([_count_bbox_cells(xmin, xmax, ymin, ymax, envelope, resolution, nrows, ncols)
+                     for xmin, ymin, xmax, ymax in bounds])
+        return min(cells, nrows*ncols)
+    if len(geom) == 2:
+        return 1
+    lonmin, lonmax, latmin, latmax = [float(v) for v in geom]
+    return _count_bbox_cells(lonmin, lonmax, latmin, latmax, envelope, resolution, nrows, ncols)
+
+def _count_bbox_cells(lonmin, lonmax, latmin, latmax, envelope, resolution, nrows, ncols):
+    """Returns the number of grid cells within a bounding box."""
+
+    xmin, xmax, ymin, ymax = envelope
+    # grids using longitudes in [0, 360]
+    if xmax > 180 and lonmin < 0:
+        lonmin, lonmax = lonmin+360, lonmax+360
+    dx = min(lonmax, xmax) - max(lonmin, xmin)
+    dy = min(latmax, ymax) - max(latmin, ymin)
+    if dx < 0 or dy < 0:
+        return 0
+    return max(1, min(ncols, int( math.ceil(dx/resolution) ))) * max(1, min(nrows, int( math.ceil(dy/resolution) )))
+
+def estimate(args, containers, bounds=None):
+    """Estimates the cost of the job described by the ocgis arguments, given the catalog metadata of each of its datasets
+       (a dictionary of Container attributes), and the bounds of the selected shapefile geometries (see _count_cells).
+       Returns None if the number of grid cells read is not known, otherwise a dictionary with:
+       cells, timesteps: the number of grid cells and time steps read from the largest dataset
+       values: the total number of values read
+       bytes_read, output_size: the number of bytes read, and the size of the output in bytes
+       runtime: the expected runtime in seconds"""
+
+    time_region = args['time_region'] or {}
+    months = time_region.get('month')
+    years = time_region.get('year')
+    cells = timesteps = values = output_values = 0
+    for container in containers:
+        shape = parse_shape(container['field_shape'])
+        nlevels, nrows, ncols = shape[-3:]
+        _cells = _count_cells(args['geom'], parse_envelope(container['spatial_envelope']), float(container['spatial_res']), nrows, ncols,
+                              bounds=bounds)
+        if _cells is None:
+            return None
+
+        # time steps within the time range
+        start, stop = container['time_start'], container['time_stop']
+        if args['time_range'] is not None:
+            start, stop = max(start, args['time_range'][0]), min(stop, args['time_range'][1])
+        _years = range(start.year, stop.year+1) if start <= stop else []
+        _timesteps = 0
+        if start <= stop:
+            _timesteps = min(shape[-4], int( math.ceil( ((stop-start).days+1)/float(container['time_res_days']) ) ))
+        # fraction of the time steps selected by the time region
+        if years is not None and len(_years) > 0:
+            _years = [year for year in _years if year in years]
+            _timesteps = _timesteps*len(_years)/(stop.year-start.year+1)
+        if months is not None:
+            _timesteps = _timesteps*len(months)/12
+
+        # values written to the output, after calculation and aggregation
+        _outputsteps = _timesteps
+        if args['calc'] is not None and args['calc_grouping']:
+            ngroups = 1
+            for group in args['calc_grouping']:
+                if group == 'year':
+                    ngroups *= len(_years)
+                elif group == 'month':
+                    ngroups *= len(months) if months is not None else 12
+                else:
+                    ngroups *= GROUP_SIZES.get(group, 1)
+            _outputsteps = min(_timesteps, ngroups)
+        # a snippet reads the first time step, or the time steps of the first group
+        if args.get('snippet'):
+            _timesteps = int( math.ceil(_timesteps/float( max(1, _outputsteps) )) )
+            _outputsteps = min(1, _outputsteps)
+        if args['aggregate']:
+            _outcells = len(args['select_ugid']) if args['select_ugid'] else 1
+        else:
+            _outcells = _cells
+
+        if _cells*_timesteps > cells*timesteps:
+            cells, timesteps = _cells, _timesteps
+        values += _cells*_timesteps*nlevels
+        output_values += _outcells*_outputsteps*nlevels
+
+    bytes_read = values*BYTES_PER_VALUE
+    output_size = output_values*OUTPUT_BYTES_PER_VALUE.get(args['output_format'], DEFAULT_OUTPUT_BYTES_PER_VALUE)
+    runtime = float(bytes_read)/READ_BYTES_PER_SECOND + float(output_size)/WRITE_BYTES_PER_SECOND
+    return {'cells':cells, 'timesteps':timesteps, 'values':values, 'bytes_read':bytes_read, 'output_size':output_size,
+            'runtime':runtime}
+
+
+class Estimator(object):
+    """Estimates the cost of jobs from the dataset catalog built by util.data_scanner, and checks it against configured limits."""
+
+    def __init__(self, catalogPath, maxBytesRead=None, maxOutputSize=None, maxRuntime=None):
+        # path of the SQLite catalog, or None if not available
+        self.catalogPath = catalogPath
+        # limits in bytes, bytes and seconds (None for no limit)
+        self.maxBytesRead = maxBytesRead
+        self.maxOutputSize = maxOutputSize
+        self.maxRuntime = maxRuntime
+
+    def getContainers(self, uris):
+        """Returns the catalog metadata of the container of each dataset URI, or None if any of them is not catalogued."""
+
+        if self.catalogPath is None:
+            return None
+        # the catalog requires the optional sqlalchemy library
+        try:
+            from util.data_scanner import db
+        except ImportError:
+            print 'Dataset catalog not available: sqlalchemy library not installed'
+            return None
+
+        db.connect(self.catalogPath)
+        containers = []
+        with db.session_scope() as session:
+            for uri in uris:
+                container = session.query(db.Container).join(db.Uri).filter(db.Uri.value == uri).first()
+                if container is None:
+                    # precomputed climatology cube
+                    container = session.query(db.Climatology).filter(db.Climatology.uri == uri).first()
+                if container is None:
+                    return None
+                containers.append( dict( (key, getattr(container, key)) for key in
+                                         ['time_start', 'time_stop', 'time_res_days', 'spatial_res', 'spatial_envelope', 'field_shape'] ) )
+        return containers
+
+    def getBounds(self, geom, select_ugid):
+        """Returns the list of bounds (xmin, ymin, xmax, ymax) of the selected geometries of a shapefile,
+           or None if they cannot be read. The bounds are read once per process."""
+
+        key = (geom, tuple(select_ugid) if select_ugid else None)
+        if key not in _bounds:
+            # the shapefiles are read by the optional ocgis library
+            try:
+                import ocgis
+            except ImportError:
+                return None
+            try:
+                _bounds[key] = [ tuple(record['geom'].bounds) for record in ocgis.ShpCabinetIterator(geom, select_ugid=select_ugid or None) ]
+            except Exception as e:
+                print 'Cannot read the bounds of the geometries of %s: %s' % (geom, e)
+                return None
+        return _bounds[key]
+
+    def estimate(self, args):
+        """Returns the estimated cost of the job described by the ocgis arguments,
+           or None if its datasets are not catalogued or the bounds of its geometries are not known."""
+
+        # each dataset URI is a list of files: look up the first one
+        uris = [uri[0] if isinstance(uri, list) else uri for uri in args['uri']]
+        containers = self.getContainers(uris)
+        if containers is None:
+            return None
+        bounds = None
+        if not isinstance(args['geom'], list):
+            bounds = self.getBounds(args['geom'], args['select_ugid'])
+            if bounds is None:
+                return None
+        return estimate(args, containers, bounds=bounds)
+
+    def check(self, estimate):
+        """Returns the list of reasons why a job with the given estimated cost must be rejected."""
+
+        errors = []
+        if estimate is None:
+            return errors
+        if self.maxBytesRead is not None and estimate['bytes_read'] > self.maxBytesRead:
+            errors.append( 'The request would read %s MB of data, more than the limit of %s MB'
+                           % (estimate['bytes_read']/1024/1024, self.maxBytesRead/1024/1024) )
+        if self.maxOutputSize is not None and estimate['output_size'] > self.maxOutputSize:
+            errors.append( 'The request would produce %s MB of output, more than the limit of %s MB'
+                           % (estimate['output_size']/1024/1024, self.maxOutputSize/1024/1024) )
+        if self.maxRuntime is not None and estimate['runtime'] > self.maxRuntime:
+            errors.append( 'The request would run for %s seconds, more than the limit of %s seconds'
+                           % (int(estimate['runtime']), self.maxRuntime) )
+        return errors
@@ -0,0 +1,92 @@
+# module containing the notification of the changes of the job statuses to the browsers,
+# as a stream of Server-Sent Events and as JSON documents validated by their ETag
+from django.conf import settings
+from django.utils import simplejson
+from datetime import datetime
+import hashlib
+import time
+
+from ncpp.models.common import Job
+from ncpp.constants import JOB_FINAL_STATUSES
+
+# seconds between two reads of the job statuses written by the workers
+EVENTS_POLL_INTERVAL = getattr(settings, "NCPP_EVENTS_POLL_INTERVAL", 1)
+# seconds after which a stream is closed, so that the server process is released: the browser reconnects by itself
+EVENTS_TIMEOUT = getattr(settings, "NCPP_EVENTS_TIMEOUT", 300)
+# seconds between two comments sent to keep idle connections open through proxies
+EVENTS_HEARTBEAT = getattr(settings, "NCPP_EVENTS_HEARTBEAT", 15)
+# milliseconds the browser waits before reconnecting
+EVENTS_RETRY = 2000
+
+# fields of the base job table holding the status of a job
+STATUS_FIELDS = ['id', 'job_class', 'status', 'progress', 'phase', 'bytes_read', 'url', 'error', 'updateDateTime']
+
+# format of the identifiers of the events, and of the 'Last-Event-ID' header sent back by the browser on reconnection
+EVENT_ID_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def get_status(job):
+    """Returns the status and progress of a job as a dictionary that can be serialized to JSON."""
+
+    return { 'id': job.id,
+             'status': job.status,
+             'progress': job.progress,
+             'phase': job.phase,
+             'bytes_read': job.bytes_read,
+             'url': job.url,
+             'error': job.error,
+             'updateDateTime': job.updateDateTime.isoformat() if job.updateDateTime else None }
+
+def get_etag(data):
+    """Returns the entity tag of a JSON document, which changes whenever the document changes."""
+
+    return '"%s"' % hashlib.md5( simplejson.dumps(data, sort_keys=True) ).hexdigest()
+
+def format_event(data, event_id=None, event='status'):
+    """Returns a Server-Sent Event carrying a JSON document."""
+
+    lines = []
+    if event_id is not None:
+        lines.append( 'id: %s' % event_id )
+    lines.append( 'event: %s' % event )
+    lines.append( 'data: %s' % simplejson.dumps(data) )
+    return '\n'.join(lines) + '\n\n'
+
+def parse_event_id(value):
+    """Returns the update time encoded in an event identifier, or None if not valid."""
+
+    try:
+        return datetime.strptime(value, EVENT_ID_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+def job_events(user, since=None, poll_interval=EVENTS_POLL_INTERVAL, timeout=EVENTS_TIMEOUT, heartbeat=EVENTS_HEARTBEAT):
+    """Yields the Server-Sent Events of the changes of the jobs of a user: first the status of all the jobs
+       updated after 'since' (of all the active jobs if None), then the status of each job when it changes.
+       The job statuses are read from the database, where the workers write them: no job is updated from remote servers.
+       Stops after 'timeout' seconds."""
+
+    yield 'retry: %s\n\n' % EVENTS_RETRY
+    start = last_heartbeat = time.time()
+    # last status sent for each job
+    sent = {}
+    jobs = Job.objects.filter(user=user).only(*STATUS_FIELDS)
+    if since is None:
+        # the active jobs, then the jobs updated from now on
+        query = jobs.exclude(status__in=JOB_FINAL_STATUSES)
+        since = datetime.now()
+    else:
+        query = jobs.filter(updateDateTime__gte=since)
+    while True:
+        for job in query.order_by('updateDateTime', 'id'):
+            status = get_status(job)
+            if sent.get(job.id) != status:
+                sent[job.id] = status
+                since = max(since, job.updateDateTime)
+                yield format_event(dict(status, job_class=job.job_class), event_id=since.strftime(EVENT_ID_FORMAT))
+        if time.time() - start >= timeout:
+            break
+        if time.time() - last_heartbeat >= heartbeat:
+            last_heartbeat = time.time()
+            yield ': heartbeat\n\n'
+        time.sleep(poll_interval)
+        query = jobs.filter(updateDateTime__gte=since)
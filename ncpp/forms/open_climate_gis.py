@@ -1,9 +1,10 @@
 from django.forms import (Form, CharField, ChoiceField, BooleanField, MultipleChoiceField, SelectMultiple, FloatField,
                           TextInput, RadioSelect, DateTimeField, Select, CheckboxSelectMultiple, ValidationError)
 
-from ncpp.config.open_climate_gis import ocgisChoices, Config, ocgisGeometries, ocgisDatasets, ocgisCalculations
+from ncpp.config.open_climate_gis import ocgisChoices, Config, ocgisGeometries, ocgisDatasets, ocgisCalculations, ocgisOption
 from ncpp.constants import MONTH_CHOICES, NO_VALUE_OPTION
 from ncpp.utils import hasText
+from ncpp.validator import Validator
 from contrib.helpers import validate_time_subset
 import re
 
@@ -161,6 +162,17 @@ class OpenClimateGisForm1(Form):
             if not validate_time_subset(time_range, time_region):
                 self._errors["timeregion_year"] = self.error_class(["Time Range must contain Time Region."])
                     
+        # validate the request against the dataset metadata, once the form is consistent
+        if len(self._errors) == 0:
+            geom = None
+            if geometry == 'box':
+                geom = [self.cleaned_data['lonmin'], self.cleaned_data['lonmax'], self.cleaned_data['latmin'], self.cleaned_data['latmax']]
+            elif geometry == 'point':
+                geom = [self.cleaned_data['lon'], self.cleaned_data['lat']]
+            validator = Validator(ocgisDatasets, ocgisOption(Config.DEFAULT, "catalog"))
+            for field, message in validator.validate(self.cleaned_data['dataset_category'], self.cleaned_data['dataset'],
+                                                     self.cleaned_data.get('variable'), geom, time_range, time_region):
+                self._errors[field] = self.error_class([message])
          
         if not self.is_valid():
             print 'VALIDATION ERRORS: %s' % self.errors
@@ -185,6 +197,8 @@ class OpenClimateGisForm2(Form):
     output_format = ChoiceField(choices=ocgisChoices(Config.OUTPUT_FORMAT).items(), required=True, initial='csv')
     prefix = CharField(required=True, widget=TextInput(attrs={'size':20}), initial='ocgis_output')
     with_auxiliary_files = BooleanField(initial=True, required=False)
+    # run a quick preview on the first time step of the data, before submitting the full job
+    preview = BooleanField(initial=False, required=False)
     
     # custom validation
     def clean(self):
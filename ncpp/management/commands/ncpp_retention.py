@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ncpp.retention import get_retention_manager
+
+class Command(BaseCommand):
+    '''Command to apply the retention policy to the job outputs, typically run periodically from cron.'''
+
+    help = 'Removes the job outputs exceeding the maximum age or the disk quotas'
+
+    def handle(self, *args, **options):
+
+        manager = get_retention_manager()
+        print 'Applying retention policy: maxAge=%s days, userQuota=%s bytes, totalQuota=%s bytes' % (manager.maxAge, manager.userQuota, manager.totalQuota)
+        manager.collect()
@@ -0,0 +1,26 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+
+from ncpp.regions import load_regions, simplify_regions, write_regions, REGIONS_FILEPATH, SIMPLIFIED_REGIONS_FILEPATH, SIMPLIFIED_TOLERANCE
+
+class Command(BaseCommand):
+    '''Command to precompute the simplified geometries of the CSC regions sent to the WPS server.'''
+
+    help = 'Writes the CSC regions simplified by the Douglas-Peucker algorithm (select them with NCPP_CSC_REGIONS_FILEPATH)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--tolerance', type='float', dest='tolerance', default=SIMPLIFIED_TOLERANCE,
+                    help='Maximum distance in degrees between the original and the simplified boundaries (default: %s)' % SIMPLIFIED_TOLERANCE),
+        make_option('--input', dest='input', default=REGIONS_FILEPATH,
+                    help='GML document of the regions (default: %s)' % REGIONS_FILEPATH),
+        make_option('--output', dest='output', default=SIMPLIFIED_REGIONS_FILEPATH,
+                    help='GML document of the simplified regions (default: %s)' % SIMPLIFIED_REGIONS_FILEPATH),
+    )
+
+    def handle(self, *args, **options):
+
+        regions = load_regions(options['input'])
+        simplified = simplify_regions(regions, options['tolerance'])
+        write_regions(simplified, options['output'])
+        count = lambda regions: sum([len(polygon) for polygons in regions.values() for polygon in polygons])
+        print 'Simplified %s regions from %s to %s points: %s' % (len(regions), count(regions), count(simplified), options['output'])
@@ -0,0 +1,24 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+
+from ncpp.workers import WorkerPool, NUMBER_OF_WORKERS, POLL_INTERVAL, PREVIEW_WORKERS
+
+class Command(BaseCommand):
+    '''Command to run the pool of worker processes that execute the queued NCPP jobs.'''
+
+    help = 'Runs the pool of worker processes that execute the queued jobs'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=NUMBER_OF_WORKERS,
+                    help='Number of worker processes (default: %s)' % NUMBER_OF_WORKERS),
+        make_option('--preview-workers', type='int', dest='preview_workers', default=PREVIEW_WORKERS,
+                    help='Number of additional worker processes reserved for preview jobs (default: %s)' % PREVIEW_WORKERS),
+        make_option('--poll-interval', type='float', dest='poll_interval', default=POLL_INTERVAL,
+                    help='Seconds between polls of an empty queue (default: %s)' % POLL_INTERVAL),
+    )
+
+    def handle(self, *args, **options):
+
+        pool = WorkerPool(size=options['workers'], poll_interval=options['poll_interval'], previews=options['preview_workers'])
+        print 'Starting %s workers, and %s preview workers' % (pool.size, pool.previews)
+        pool.serve_forever()
@@ -0,0 +1,24 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+
+from ncpp.poller import WPSPoller, POLLER_THREADS, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL
+
+class Command(BaseCommand):
+    '''Command to run the central poller that monitors the remote WPS executions of the climate index jobs.'''
+
+    help = 'Runs the poller that monitors the remote WPS executions till completion'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--threads', type='int', dest='threads', default=POLLER_THREADS,
+                    help='Number of concurrent status requests (default: %s)' % POLLER_THREADS),
+        make_option('--min-interval', type='float', dest='min_interval', default=POLL_MIN_INTERVAL,
+                    help='Minimum seconds between two checks of an execution (default: %s)' % POLL_MIN_INTERVAL),
+        make_option('--max-interval', type='float', dest='max_interval', default=POLL_MAX_INTERVAL,
+                    help='Maximum seconds between two checks of an execution (default: %s)' % POLL_MAX_INTERVAL),
+    )
+
+    def handle(self, *args, **options):
+
+        poller = WPSPoller(threads=options['threads'], min_interval=options['min_interval'], max_interval=options['max_interval'])
+        print 'Starting WPS poller with %s threads' % poller.threads
+        poller.serve_forever()
@@ -1,3 +1,4 @@
-from common import Job
+from common import Job, SubmissionBucket
 from climate_indexes import ClimateIndexJob, SupportingInfo
-from open_climate_gis import OpenClimateGisJob
\ No newline at end of file
+from open_climate_gis import OpenClimateGisJob
+from batch import OpenClimateGisBatchJob
\ No newline at end of file
@@ -0,0 +1,190 @@
+from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from ncpp.models.common import Job
+from ncpp.models.open_climate_gis import OpenClimateGisJob, REQUEST_FIELDS, create_ocg
+from ncpp.constants import APPLICATION_LABEL, JOB_STATUS
+from ncpp.utils import hasText, get_output_path
+from ncpp.cache import get_size
+from datetime import datetime
+import json
+import os
+
+class OpenClimateGisBatchJob(Job):
+    """Class that represents the execution of the same Open Climate GIS request over many geometries and/or datasets.
+       The batch is queued and executed as a single job: all the geometries of a dataset are selected by a single
+       ocgis operation, so that each dataset is read once for the whole batch."""
+
+    # JSON dictionary of the request fields shared by all members (see ncpp.models.open_climate_gis.REQUEST_FIELDS)
+    template = models.TextField(verbose_name='Request Template', blank=False)
+    # JSON list of the geometry identifiers of the template shape type, selected together in each member
+    geometry_ids = models.TextField(verbose_name='Geometry IDs', blank=True, null=True)
+    # JSON list of [dataset category, dataset, variable], one member each (the template dataset if empty)
+    datasets = models.TextField(verbose_name='Datasets', blank=True, null=True)
+    # JSON list of the outcome of each member: {'dataset_category', 'dataset', 'variable', 'status', 'url', 'error'}
+    members = models.TextField(verbose_name='Members', blank=True, null=True)
+
+    # size in bytes of the output directory of the batch, and time of its last download (see ncpp.retention)
+    output_size = models.BigIntegerField(verbose_name='Output Size', default=0)
+    last_access = models.DateTimeField(verbose_name='Last Access', blank=True, null=True)
+
+    def __init__(self, *args, **kwargs):
+
+        super(OpenClimateGisBatchJob, self).__init__(*args, **kwargs)
+
+        # Open Climate GIS adapter, used to locate the combined output
+        self.ocg = create_ocg()
+
+    def __unicode__(self):
+        return 'Open Climate GIS Batch Job id=%s status=%s' % (self.id, self.status)
+
+    @staticmethod
+    def encode_template(fields):
+        """Returns the JSON template of a request from a dictionary of job fields."""
+
+        return json.dumps( dict( (field, fields[field]) for field in REQUEST_FIELDS if field in fields ), cls=DjangoJSONEncoder )
+
+    def get_template(self):
+        """Returns the dictionary of the request fields shared by all members."""
+
+        fields = json.loads(self.template)
+        for field in ['datetime_start', 'datetime_stop']:
+            if hasText(fields.get(field)):
+                fields[field] = datetime.strptime(fields[field].replace(' ', 'T')[0:19], '%Y-%m-%dT%H:%M:%S')
+        return fields
+
+    def get_geometry_ids(self):
+        return json.loads(self.geometry_ids) if hasText(self.geometry_ids) else []
+
+    def get_datasets(self):
+        """Returns the list of (dataset category, dataset, variable) of the members."""
+
+        if hasText(self.datasets):
+            return [tuple(dataset) for dataset in json.loads(self.datasets)]
+        template = self.get_template()
+        return [ (template['dataset_category'], template['dataset'], template.get('variable')) ]
+
+    def get_members(self):
+        """Returns the list of the outcome of each member, or None before the batch has run."""
+
+        return json.loads(self.members) if hasText(self.members) else None
+
+    def create_member_jobs(self):
+        """Returns the (unsaved) jobs executing the request of each member: one for each dataset, selecting all the geometries."""
+
+        jobs = []
+        for category, dataset, variable in self.get_datasets():
+            fields = self.get_template()
+            fields.update( dataset_category=category, dataset=dataset, variable=variable )
+            if len(self.get_geometry_ids()) > 0:
+                fields['geometry_id'] = ",".join(self.get_geometry_ids())
+            jobs.append( OpenClimateGisJob(status=JOB_STATUS.UNKNOWN, user=self.user, **fields) )
+        return jobs
+
+    def submit(self):
+        """Submits the batch as a single job, unless one of its members selects no data or exceeds the configured limits."""
+
+        for member in self.create_member_jobs():
+            errors = [message for field, message in member.validate()]
+            if len(errors) == 0:
+                errors = member.estimator.check( member.get_estimate() )
+            if len(errors) > 0:
+                self.job_class = self.class_name()
+                self.terminate(JOB_STATUS.REJECTED, '%s: %s' % (member.variable or member.dataset, ' '.join(errors)))
+                return
+        super(OpenClimateGisBatchJob, self).submit()
+
+    def get_cost(self):
+        """Returns the estimated runtime of the batch in seconds, as the sum of the runtimes of its members,
+           or None if the runtime of a member cannot be estimated."""
+
+        costs = [member.get_cost() for member in self.create_member_jobs()]
+        if None in costs:
+            return None
+        return sum(costs)
+
+    def get_output_dir(self):
+        return os.path.join(self.ocg.rootDir, get_output_path(self.id))
+
+    def get_download_path(self):
+        """Returns the local path of the combined output, downloaded as a single archive, or None."""
+
+        if not hasText(self.url) or not self.url.startswith(self.ocg.rootUrl):
+            return None
+        return self.url.replace(self.ocg.rootUrl, self.ocg.rootDir, 1)
+
+    def record_download(self, nbytes):
+        """Accounts for a download of the combined output, which also marks it as recently accessed."""
+
+        super(OpenClimateGisBatchJob, self).record_download(nbytes)
+        self.last_access = datetime.now()
+        OpenClimateGisBatchJob.objects.filter(pk=self.pk).update(last_access=self.last_access)
+
+    def run_member(self, job, args):
+        """Executes the request of one member, and returns the URL of its output."""
+
+        return job.ocg.run(args)
+
+    def execute(self):
+        """Executes the members one after the other, each one in its own sub-directory of the batch output directory,
+           and reports the progress of the whole batch."""
+
+        self.status = JOB_STATUS.STARTED
+        self.save()
+
+        jobs = self.create_member_jobs()
+        members = []
+        for i, job in enumerate(jobs):
+            args = job.ocg.encodeArgs(job)
+            args['dir_output'] = os.path.join(get_output_path(self.id), 'member%s' % (i+1))
+            label = job.variable or job.dataset
+            def _progress(progress, phase, bytes_read=None, i=i, label=label):
+                self.report_progress( (i+progress)/len(jobs), '%s (%s of %s): %s' % (label, i+1, len(jobs), phase) )
+            job.ocg.progress = _progress
+            # the outputs must be written to the batch output directory, to be downloaded together
+            job.ocg.cache = None
+
+            member = {'dataset_category':job.dataset_category, 'dataset':job.dataset, 'variable':job.variable,
+                      'url':None, 'error':None}
+            try:
+                member['url'] = self.run_member(job, args)
+                member['status'] = JOB_STATUS.SUCCESS
+            except Exception as e:
+                print e
+                member['status'] = JOB_STATUS.FAILED
+                member['error'] = str(e)
+            members.append(member)
+            self.members = json.dumps(members)
+            OpenClimateGisBatchJob.objects.filter(pk=self.pk).update(members=self.members)
+
+        # the batch succeeds if any member succeeded: the failed members are reported with their error
+        failed = [member for member in members if member['status'] != JOB_STATUS.SUCCESS]
+        if len(failed) < len(members):
+            self.status = JOB_STATUS.SUCCESS
+            dir_output = self.get_output_dir()
+            self.url = dir_output.replace(self.ocg.rootDir, self.ocg.rootUrl, 1)
+            self.output_size = get_size(dir_output) if os.path.exists(dir_output) else 0
+            self.last_access = datetime.now()
+        else:
+            self.status = JOB_STATUS.FAILED
+        if len(failed) > 0:
+            self.error = '; '.join(['%s: %s' % (member['variable'] or member['dataset'], member['error']) for member in failed])
+        self.progress = 1.0
+        self.phase = 'Completed %s of %s members' % (len(members)-len(failed), len(members))
+        self.save()
+
+    def getFormData(self):
+        """Returns the request of the template, followed by the geometries and the outcome of the members."""
+
+        job_data = [ (label, value) for (label, value) in self.create_member_jobs()[0].getFormData()
+                     if label not in ['Dataset Category', 'Dataset', 'Variable', 'Shape Geometry'] ]
+        if len(self.get_geometry_ids()) > 0:
+            job_data.append( ('Batch Geometries', ", ".join(self.get_geometry_ids())) )
+        members = self.get_members() or []
+        for i, (category, dataset, variable) in enumerate(self.get_datasets()):
+            status = members[i]['status'] if i < len(members) else None
+            name = "%s / %s" % (dataset, variable) if hasText(variable) else dataset
+            job_data.append( ('Batch Member %s' % (i+1), "%s (%s)" % (name, status) if status else name) )
+        return job_data
+
+    class Meta:
+        app_label= APPLICATION_LABEL
@@ -1,13 +1,22 @@
-from threading import Thread
 from django.db import models
+from django.conf import settings
 from datetime import datetime, timedelta, date
-from owslib.wps import WebProcessingService, GMLMultiPolygonFeatureCollection, WFSQuery, WFSFeatureCollection
+import os
+from owslib.wps import GMLMultiPolygonFeatureCollection
 
 from ncpp.constants import APPLICATION_LABEL, JOB_STATUS
 
 from ncpp.models.common import Job
+from ncpp.wps_client import get_client
+from ncpp.regions import get_region_polygons, RegionsFeatureCollection, REGION_ATTRIBUTE
+from ncpp.config import ocgisConfig, Config
+from ncpp.utils import hasText, get_output_path
+from ncpp.cache import get_size
 
-from owslib.wps import WPSExecution
+# Geo Data Portal WPS server executing the climate index jobs
+WPS_URL = 'http://cida.usgs.gov/climate/gdp/process/WebProcessingService'
+# maximum number of queued jobs whose CSV statistics are computed by a single remote execution
+GROUP_SIZE = getattr(settings, "NCPP_CLIMATE_INDEX_GROUP_SIZE", 20)
 
 #REGION_CHOICES = (('','--- Choose ---'), 
 #                  ('NCCSC','North Central Climate Science Center Region'), )
@@ -45,6 +54,23 @@ OUTPUT_FORMAT_CHOICES = {'CSV':'CSV (comma-separated, indexes aggregated by regi
 SUPPORTING_INFO_CHOICES = { 'Metadata':'Metadata',
                             'TranslationalInfo':'Translational Information' }
 
+def split_csv(text, feature):
+    '''Returns the CSV output of the Geo Data Portal restricted to the columns of one feature, keeping the time column.
+       Each block of the output starts with a comment line, followed by the header line of the feature attribute values.'''
+    
+    lines = []
+    columns = None
+    for line in text.splitlines():
+        if line.startswith('#'):
+            lines.append(line)
+            columns = None
+            continue
+        values = line.split(',')
+        if columns is None:
+            columns = [0] + [i for i, value in enumerate(values) if i > 0 and value.strip()==feature]
+        lines.append( ','.join([values[i] for i in columns if i < len(values)]) )
+    return '\n'.join(lines) + '\n'
+
     
 class ClimateIndexJob(Job):
     '''Job that retrieves a climate index over a specified geographic region.'''
@@ -55,14 +81,156 @@ class ClimateIndexJob(Job):
     startDateTime = models.DateField(verbose_name='Start Date', blank=False)
     dataset = models.CharField(max_length=200, verbose_name='Observed Dataset', blank=False)
     outputFormat = models.CharField(max_length=200, verbose_name='Output Format', blank=False)
+    # number of jobs sharing the remote execution, whose output is split per region
+    group_size = models.IntegerField(verbose_name='Group Size', default=1)
+    # size in bytes of the output split for this job, and time of its last download (see ncpp.retention)
+    output_size = models.BigIntegerField(verbose_name='Output Size', default=0)
+    last_access = models.DateTimeField(verbose_name='Last Access', blank=True, null=True)
     
     def __unicode__(self):
         return 'Climate Index Job id=%s status=%s' % (self.id, self.status)
     
-    def submit(self):
-        print 'Submitting the job'
-        runner = Runner(self)
-        runner.start()
+    def execute(self):
+        '''Submits the job to the remote WPS server. It is executed by a worker process, which is released as soon as
+           the execution is accepted: the execution is then monitored till completion by the central poller (see ncpp.poller).'''
+        
+        # shared client: no capabilities request, and connections kept alive
+        client = get_client(WPS_URL)
+        
+        # formula for model data
+        #dataset_id = "ensemble_%s_%s" % (self.dataset, self.index)
+        # formula for observational data
+        dataset_id = "gmo_%s" % self.index
+        print 'dataset_id=%s' % dataset_id
+        if self.index=='tmin-days_below_threshold':
+            dataset_uri = 'dods://cida.usgs.gov/qa/thredds/dodsC/derivatives/derivative-days_below_threshold.tmin.ncml'
+        elif self.index=='tmax-days_above_threshold':
+            dataset_uri = 'dods://cida.usgs.gov/qa/thredds/dodsC/derivatives/derivative-days_above_threshold.tmax.ncml'
+        elif self.index=='pr-days_above_threshold':
+            dataset_uri = 'dods://cida.usgs.gov/qa/thredds/dodsC/derivatives/derivative-days_above_threshold.pr.ncml'
+        else:
+            raise Exception("Unrecognized index choice, cannot select dataset")
+        print 'dataset_uri=%s' % dataset_uri
+        
+        # datetime processing
+        #startDateTime = datetime.strptime(self.startDateTime, "%Y-%m-%d")
+        startDateTime = self.startDateTime
+        _startDateTime = startDateTime.isoformat()+".000Z"
+        # FIXME: 5 year time span
+        stopDateTime = datetime(startDateTime.year+5, startDateTime.month, startDateTime.day)
+        _stopDateTime = stopDateTime.isoformat()+".000Z"
+                
+        # the queued jobs computing the same statistics over other regions are submitted together
+        jobs = self.claim_group()
+        regions = sorted(set([job.region for job in jobs]))
+        print 'outputFormat=%s, regions=%s' % (self.outputFormat, regions)
+        if self.outputFormat=='CSV':
+            # region geometries sent inline, instead of being queried by the WPS server from the remote WFS:
+            # one feature per region, whose identifier heads the columns of the region in the output
+            featureCollection = RegionsFeatureCollection( [(region, get_region_polygons(region)) for region in regions] )
+            processid = 'gov.usgs.cida.gdp.wps.algorithm.FeatureWeightedGridStatisticsAlgorithm'
+            inputs =  [ ("FEATURE_ATTRIBUTE_NAME",REGION_ATTRIBUTE),
+                        ("DATASET_URI", dataset_uri.encode('utf8')),
+                        ("DATASET_ID", dataset_id.encode('utf8')),
+                        ("TIME_START", _startDateTime),
+                        ("TIME_END", _stopDateTime ),
+                        ("REQUIRE_FULL_COVERAGE","false"),
+                        ("DELIMITER","COMMA"),
+                        ("STATISTICS","MEAN"),
+                        ("GROUP_BY","STATISTIC"),
+                        ("SUMMARIZE_TIMESTEP","false"),
+                        ("SUMMARIZE_FEATURE_ATTRIBUTE","false"),
+                        ("FEATURE_COLLECTION", featureCollection)
+                       ]
+        else:
+            featureCollection = GMLMultiPolygonFeatureCollection( get_region_polygons(self.region) )
+            processid = 'gov.usgs.cida.gdp.wps.algorithm.FeatureCoverageOPeNDAPIntersectionAlgorithm'
+            inputs =  [ ("DATASET_URI", dataset_uri.encode('utf8')),
+                        ("DATASET_ID", dataset_id.encode('utf8')),
+                        ("TIME_START", _startDateTime),
+                        ("TIME_END", _stopDateTime ),
+                        ("REQUIRE_FULL_COVERAGE","false"),
+                        ("FEATURE_COLLECTION", featureCollection)
+                       ]
+                        
+        output = "OUTPUT"
+        
+        try:
+            # check the inputs against the cached process description, before submitting
+            accepted = [input.identifier for input in client.describe_process(processid).dataInputs]
+            unknown = [key for key, value in inputs if key not in accepted]
+            if len(unknown) > 0:
+                raise Exception("Inputs not accepted by process %s: %s" % (processid, ", ".join(unknown)))
+            
+            # submit job
+            execution = client.execute(processid, inputs, output=output)
+        except Exception as e:
+            # the worker records the failure of this job only
+            for job in jobs[1:]:
+                job.terminate(JOB_STATUS.FAILED, 'Job failed: %s' % e)
+            raise
+        for job in jobs:
+            job.group_size = len(jobs)
+            job._update(execution, first=True)
+        
+        print 'Submitted %s jobs' % len(jobs)
+        
+    def claim_group(self, max_size=GROUP_SIZE):
+        '''Claims the queued jobs whose results can be computed by the same remote execution as this job:
+           the CSV statistics of the same index, dataset and start date, over any region.
+           Returns the list of the jobs of the group, starting with this job.'''
+        
+        jobs = [self]
+        if self.outputFormat != 'CSV':
+            return jobs
+        now = datetime.now()
+        candidates = ClimateIndexJob.objects.filter(status=JOB_STATUS.QUEUED, index=self.index, dataset=self.dataset,
+                                                    startDateTime=self.startDateTime, outputFormat=self.outputFormat)
+        candidates = candidates.exclude(pk=self.pk).exclude(not_before__gt=now).order_by('submissionDateTime', 'id')
+        for job in candidates[:max_size-1]:
+            # the conditional update guarantees that the job is not claimed by a worker at the same time
+            if Job.objects.filter(pk=job.pk, status=JOB_STATUS.QUEUED).update(status=JOB_STATUS.STARTED, worker=self.worker,
+                                                                               updateDateTime=now) == 1:
+                job.status = JOB_STATUS.STARTED
+                job.worker = self.worker
+                jobs.append(job)
+        return jobs
+        
+    def split_output(self, execution):
+        '''Stores the columns of the region of this job from the CSV output shared by its group, and returns their URL.'''
+        
+        # the output is downloaded once for all the jobs updated from the same execution
+        if getattr(execution, 'sharedOutput', None) is None:
+            execution.sharedOutput = get_client(WPS_URL).request(self.url)
+        dir_output = self.get_output_dir()
+        if not os.path.exists(dir_output):
+            os.makedirs(dir_output)
+        path = os.path.join(dir_output, '%s_%s.csv' % (self.index, self.region))
+        with open(path, 'w') as f:
+            f.write( split_csv(execution.sharedOutput, self.region) )
+        self.output_size = get_size(dir_output)
+        self.last_access = datetime.now()
+        return path.replace(ocgisConfig.get(Config.DEFAULT, 'rootDir'), ocgisConfig.get(Config.DEFAULT, 'rootUrl'), 1)
+    
+    def get_output_dir(self):
+        '''Returns the local directory of the output split from the output of the group.'''
+        
+        return os.path.join(ocgisConfig.get(Config.DEFAULT, 'rootDir'), get_output_path(self.id))
+    
+    def get_download_path(self):
+        '''Returns the local path of the output split from the output of the group, or None.'''
+        
+        rootUrl = ocgisConfig.get(Config.DEFAULT, 'rootUrl')
+        if not hasText(self.url) or not self.url.startswith(rootUrl):
+            return None
+        return self.url.replace(rootUrl, ocgisConfig.get(Config.DEFAULT, 'rootDir'), 1)
+    
+    def record_download(self, nbytes):
+        '''Accounts for a download of the job output, which also marks it as recently accessed.'''
+        
+        super(ClimateIndexJob, self).record_download(nbytes)
+        self.last_access = datetime.now()
+        ClimateIndexJob.objects.filter(pk=self.pk).update(last_access=self.last_access)
         
     def getFormData(self):
         """Returns an ordered list of (choice label, choice value)."""
@@ -82,9 +250,17 @@ class ClimateIndexJob(Job):
     def update(self):
         '''Updates the job in the database from the latest WPS execution status.'''
         
+        # job still waiting in the queue: nothing to check yet
+        # job stopped by its worker: the remote execution is no longer tracked
+        # job whose output was removed by the retention policy (see ncpp.retention)
+        if not self.statusLocation or self.status in [JOB_STATUS.CANCELLED, JOB_STATUS.TIMEOUT, JOB_STATUS.EXPIRED]:
+            return
+        # job monitored by the central poller, which already records the status of the remote execution
+        if self.worker is not None:
+            return
+        
         # create a new execution from the job status URL
-        execution = WPSExecution()
-        execution.checkStatus(url=self.statusLocation, sleepSecs=0)       
+        execution = get_client(WPS_URL).check_status(self.statusLocation)
         self._update(execution)
 
     def _update(self, execution, first=False):
@@ -95,14 +271,25 @@ class ClimateIndexJob(Job):
             self.statusLocation = execution.statusLocation
         self.status = execution.status
         self.response = execution.response
+        # progress as reported by the WPS server
+        self.progress = (execution.percentCompleted or 0)/100.0
+        self.phase = execution.statusMessage
         
         if execution.isComplete():
             # success
             if execution.isSucceded():
+                self.progress = 1.0
                 for output in execution.processOutputs:               
                     if output.reference is not None:
                         print 'Output URL=%s' % output.reference
                         self.url = output.reference
+                # output shared with the other jobs of the group
+                if self.group_size > 1 and hasText(self.url):
+                    try:
+                        self.url = self.split_output(execution)
+                    except Exception as e:
+                        self.status = JOB_STATUS.FAILED
+                        self.error = 'Cannot split the output of the group: %s' % e
             else:
                 for ex in execution.errors:
                     print 'Error: code=%s, locator=%s, text=%s' % (ex.code, ex.locator, ex.text)
@@ -126,80 +313,3 @@ class SupportingInfo(models.Model):
     class Meta:
         app_label= APPLICATION_LABEL
 
-    
-class Runner(Thread):
-    
-    def __init__ (self, job):
-        Thread.__init__(self)
-        self.job = job
-        
-    def run(self):
-        
-        # submit job
-        verbose = True
-        wps = WebProcessingService('http://cida.usgs.gov/climate/gdp/process/WebProcessingService', verbose=verbose)
-        
-        # formula for model data
-        #dataset_id = "ensemble_%s_%s" % (self.job.dataset, self.job.index)
-        # formula for observational data
-        dataset_id = "gmo_%s" % self.job.index
-        print 'dataset_id=%s' % dataset_id
-        if self.job.index=='tmin-days_below_threshold':
-            dataset_uri = 'dods://cida.usgs.gov/qa/thredds/dodsC/derivatives/derivative-days_below_threshold.tmin.ncml'
-        elif self.job.index=='tmax-days_above_threshold':
-            dataset_uri = 'dods://cida.usgs.gov/qa/thredds/dodsC/derivatives/derivative-days_above_threshold.tmax.ncml'
-        elif self.job.index=='pr-days_above_threshold':
-            dataset_uri = 'dods://cida.usgs.gov/qa/thredds/dodsC/derivatives/derivative-days_above_threshold.pr.ncml'
-        else:
-            raise Exception("Unrecognized index choice, cannot select dataset")
-        print 'dataset_uri=%s' % dataset_uri
-        
-        # datetime processing
-        #startDateTime = datetime.strptime(self.job.startDateTime, "%Y-%m-%d")
-        startDateTime = self.job.startDateTime
-        _startDateTime = startDateTime.isoformat()+".000Z"
-        # FIXME: 5 year time span
-        stopDateTime = datetime(startDateTime.year+5, startDateTime.month, startDateTime.day)
-        _stopDateTime = stopDateTime.isoformat()+".000Z"
-                
-        wfsUrl = "http://cida.usgs.gov/climate/gdp/proxy/http://igsarm-cida-gdp2.er.usgs.gov:8082/geoserver/wfs"
-        query = WFSQuery("sample:CSC_Boundaries", propertyNames=["the_geom","area_name"], filters=[self.job.region])
-        featureCollection = WFSFeatureCollection(wfsUrl, query)
-        print 'outputFormat=%s' % self.job.outputFormat
-        if self.job.outputFormat=='CSV':
-            processid = 'gov.usgs.cida.gdp.wps.algorithm.FeatureWeightedGridStatisticsAlgorithm'
-            inputs =  [ ("FEATURE_ATTRIBUTE_NAME","the_geom"),
-                        ("DATASET_URI", dataset_uri.encode('utf8')),
-                        ("DATASET_ID", dataset_id.encode('utf8')),
-                        ("TIME_START", _startDateTime),
-                        ("TIME_END", _stopDateTime ),
-                        ("REQUIRE_FULL_COVERAGE","false"),
-                        ("DELIMITER","COMMA"),
-                        ("STATISTICS","MEAN"),
-                        ("GROUP_BY","STATISTIC"),
-                        ("SUMMARIZE_TIMESTEP","false"),
-                        ("SUMMARIZE_FEATURE_ATTRIBUTE","false"),
-                        ("FEATURE_COLLECTION", featureCollection)
-                       ]
-        else:
-            processid = 'gov.usgs.cida.gdp.wps.algorithm.FeatureCoverageOPeNDAPIntersectionAlgorithm'
-            inputs =  [ ("DATASET_URI", dataset_uri.encode('utf8')),
-                        ("DATASET_ID", dataset_id.encode('utf8')),
-                        ("TIME_START", _startDateTime),
-                        ("TIME_END", _stopDateTime ),
-                        ("REQUIRE_FULL_COVERAGE","false"),
-                        ("FEATURE_COLLECTION", featureCollection)
-                       ]
-                        
-        output = "OUTPUT"
-        
-        # submit job
-        execution = wps.execute(processid, inputs, output = "OUTPUT")
-        self.job._update(execution, first=True)
-                 
-        # keep monitoring till job completion
-        while execution.isComplete()==False:
-            execution.checkStatus(sleepSecs=4)
-            self.job._update(execution)
-            
-        print 'Done'
\ No newline at end of file
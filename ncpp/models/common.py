@@ -1,5 +1,5 @@
 from django.db import models
-from ncpp.constants import APPLICATION_LABEL, JOB_STATUS
+from ncpp.constants import APPLICATION_LABEL, JOB_STATUS, JOB_FINAL_STATUSES, JOB_PRIORITY
 from django.contrib.auth.models import User
 from datetime import datetime, timedelta
 
@@ -15,20 +15,113 @@ class Job(models.Model):
     url = models.URLField('URL', help_text='URL to retrieve the job output', blank=True, verify_exists=False, max_length=1000)
     submissionDateTime = models.DateTimeField('Date Submitted', auto_now_add=True, default=datetime.now())
     updateDateTime = models.DateTimeField('Date Updated', auto_now=True, default=datetime.now())
+    # fully qualified name of the Job subclass, used by the worker processes to load the job from the queue
+    job_class = models.CharField(max_length=200, verbose_name='Job Class', blank=True, null=True)
+    # name of the worker process that claimed the job from the queue
+    worker = models.CharField(max_length=200, verbose_name='Worker', blank=True, null=True)
+    # progress of the running job: fraction done, current phase, and estimated number of bytes read
+    progress = models.FloatField(verbose_name='Progress', default=0.0)
+    phase = models.CharField(max_length=200, verbose_name='Phase', blank=True, null=True)
+    bytes_read = models.BigIntegerField(verbose_name='Bytes Read', default=0)
+    # flag set by the user to request that the worker stops the running job
+    cancel_requested = models.BooleanField(verbose_name='Cancel Requested ?', default=False)
+    # scheduling class of the job, and earliest time at which it may start (off-peak hours or submission rate limit)
+    priority = models.IntegerField(verbose_name='Priority', default=JOB_PRIORITY.INTERACTIVE)
+    not_before = models.DateTimeField(verbose_name='Deferred Until', blank=True, null=True)
+    # number of downloads of the job output, and number of bytes sent
+    download_count = models.IntegerField(verbose_name='Downloads', default=0)
+    bytes_downloaded = models.BigIntegerField(verbose_name='Bytes Downloaded', default=0)
 
     def submit(self):
         """Method to submit the job.
-           The default implementation sets the job status to STARTED."""        
+           The default implementation places the job on the persistent queue, 
+           from where it will be picked up by one of the worker processes."""        
         print 'Submitting job'
         
-        self.status = JOB_STATUS.STARTED
+        from ncpp.scheduler import schedule
+        schedule(self)
+        self.job_class = self.class_name()
+        self.worker = None
+        self.status = JOB_STATUS.QUEUED
+        self.progress = 0.0
+        self.phase = None
+        self.bytes_read = 0
+        self.cancel_requested = False
         self.save()
         
+    def execute(self):
+        """Method to run the job, invoked by a worker process after the job has been claimed from the queue.
+           The default implementation does nothing."""
+        pass
+        
+    def get_cost(self):
+        """Method to return the estimated cost of the job, as its runtime in seconds, used to schedule the job,
+           or None if it cannot be estimated. The default implementation returns 0."""
+        return 0
+        
     def update(self):
         """Method to update the job status. 
            The default implementation does nothing."""
         pass
     
+    def is_preview(self):
+        """Returns True if the job is a quick preview of a full job, executed in the fast lane.
+           The default implementation returns False."""
+        
+        return False
+    
+    def is_active(self):
+        """Returns True if the job has not finished executing."""
+        
+        return self.status not in JOB_FINAL_STATUSES
+    
+    def cancel(self):
+        """Method to cancel the job. A job that has not started yet is cancelled right away, 
+           while a running job is flagged so that its worker stops it."""
+        
+        if not self.is_active():
+            return
+        # the conditional update guarantees that the job is not being claimed by a worker at the same time
+        if Job.objects.filter(pk=self.pk, status__in=[JOB_STATUS.QUEUED, JOB_STATUS.ATTACHED]).update(status=JOB_STATUS.CANCELLED) == 1:
+            self.terminate(JOB_STATUS.CANCELLED, 'Job cancelled by user')
+        else:
+            self.cancel_requested = True
+            Job.objects.filter(pk=self.pk).update(cancel_requested=True)
+            
+    def terminate(self, status, error):
+        """Method to record that the job was stopped before completion, with the given final status and error message."""
+        
+        print 'Job id=%s terminated: %s' % (self.id, error)
+        self.status = status
+        self.error = error
+        self.phase = error
+        self.save()
+    
+    def get_download_path(self):
+        """Method to return the local path of the job output, or None if the output is not stored locally.
+           The default implementation returns None."""
+        return None
+    
+    def record_download(self, nbytes):
+        """Method to account for a download of the job output."""
+        
+        self.download_count += 1
+        self.bytes_downloaded += nbytes
+        Job.objects.filter(pk=self.pk).update(download_count=models.F('download_count')+1, 
+                                              bytes_downloaded=models.F('bytes_downloaded')+nbytes)
+    
+    def report_progress(self, progress, phase, bytes_read=None):
+        """Method to record the progress of the running job.
+           Only the progress fields are written to the database, so that concurrent changes to the job are preserved."""
+        
+        self.progress = progress
+        self.phase = phase
+        if bytes_read is not None:
+            self.bytes_read = bytes_read
+        self.updateDateTime = datetime.now()
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, phase=self.phase, bytes_read=self.bytes_read,
+                                              updateDateTime=self.updateDateTime)
+    
     def getFormData(self):
         """Method to return all job input parameters as a list of tuples of the form (parameter name, parameter value).
           The default implementation returns an empty list of tuples."""
@@ -41,3 +134,15 @@ class Job(models.Model):
         
     def class_name(self):
         return self.__module__ + "." + self.__class__.__name__
+
+
+class SubmissionBucket(models.Model):
+    '''Token bucket limiting the rate of job submissions of a user.'''
+    
+    user = models.OneToOneField(User, related_name='submission_bucket', verbose_name='User')
+    # number of available submissions, negative if the user exceeded the rate
+    tokens = models.FloatField(verbose_name='Tokens')
+    updated = models.DateTimeField(verbose_name='Last Update')
+    
+    class Meta:
+        app_label= APPLICATION_LABEL
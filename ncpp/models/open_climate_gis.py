@@ -1,13 +1,73 @@
 from django.db import models
-from threading import Thread
 from ncpp.models.common import Job
 from ncpp.constants import APPLICATION_LABEL, JOB_STATUS, NO_VALUE_OPTION
 from ncpp.config import ocgisDatasets
-from ncpp.utils import str2bool, get_month_string, hasText
+from ncpp.utils import str2bool, get_month_string, hasText, get_output_path, megabytes
 from ncpp.ocg import OCG
+from ncpp.cache import ResultCache, encode_key, get_size
+from ncpp.estimator import Estimator
+from ncpp.validator import Validator
+from ncpp.climatology import ClimatologyStore
+from ncpp.weights import WeightsStore
+from ncpp.chunkcache import ChunkCache
+from ncpp.preview import summarize_geojson
+from datetime import datetime
 import json
+import os
 
-from ncpp.config import ocgisDatasets, ocgisGeometries, ocgisConfig, Config, ocgisChoices, ocgisCalculations
+from ncpp.config import ocgisDatasets, ocgisGeometries, ocgisConfig, Config, ocgisChoices, ocgisCalculations, ocgisOption
+
+# fields describing the request of a job
+REQUEST_FIELDS = ['dataset_category', 'dataset', 'variable', 'geometry', 'geometry_id', 'latmin', 'latmax', 'lonmin', 'lonmax',
+                  'lat', 'lon', 'datetime_start', 'datetime_stop', 'timeregion_month', 'timeregion_year',
+                  'calc', 'par1', 'par2', 'par3', 'calc_group', 'calc_raw', 'spatial_operation',
+                  'aggregate', 'output_format', 'prefix', 'with_auxiliary_files']
+
+def create_result_cache():
+    """Returns the optional store of previously computed results configured in ocgis.cfg, or None."""
+    
+    if str2bool( ocgisOption(Config.DEFAULT, "cache", "False") ):
+        return ResultCache(os.path.join(ocgisConfig.get(Config.DEFAULT, "rootDir"), "cache"),
+                           int( ocgisOption(Config.DEFAULT, "cacheMaxSize", "10240") )*1024*1024)
+    return None
+
+def create_ocg(progress=None):
+    """Returns the Open Climate GIS adapter configured from ocgis.cfg, reporting the progress of the jobs to 'progress'."""
+    
+    # optional store of previously computed results
+    rootDir = ocgisConfig.get(Config.DEFAULT, "rootDir")
+    cache = create_result_cache()
+    tileMemory = megabytes( ocgisOption(Config.DEFAULT, "tileMemory") )
+    chunkYears = ocgisOption(Config.DEFAULT, "chunkYears")
+    if chunkYears is not None:
+        chunkYears = int(chunkYears)
+    # optional store of the grid cells covered by the selection geometries
+    weights = None
+    if str2bool( ocgisOption(Config.DEFAULT, "weights", "False") ):
+        weights = WeightsStore(os.path.join(rootDir, "weights"))
+    # optional local cache of the data read from remote datasets
+    chunkCache = None
+    if str2bool( ocgisOption(Config.DEFAULT, "chunkCache", "False") ):
+        chunkCache = ChunkCache(os.path.join(rootDir, "chunks"), megabytes( ocgisOption(Config.DEFAULT, "chunkCacheMaxSize", "10240") ))
+    # optional store of precomputed climatology cubes
+    climatologies = None
+    if str2bool( ocgisOption(Config.DEFAULT, "climatology", "False") ):
+        climatologies = ClimatologyStore( ocgisOption(Config.DEFAULT, "catalog") )
+    
+    # instantiate Open Climate GIS adapter
+    return OCG(ocgisDatasets, ocgisGeometries, ocgisCalculations,
+               rootDir,
+               ocgisConfig.get(Config.DEFAULT, "rootUrl"),
+               debug=str2bool( ocgisConfig.get(Config.DEFAULT, "debug")),
+               cache=cache,
+               processes=int( ocgisOption(Config.DEFAULT, "processes", "1") ),
+               tileMemory=tileMemory,
+               chunkYears=chunkYears,
+               progress=progress,
+               streamZip=str2bool( ocgisOption(Config.DEFAULT, "streamZip", "False") ),
+               climatologies=climatologies,
+               weights=weights,
+               chunkCache=chunkCache )
 
 class OpenClimateGisJob(Job):
     """Class that represents the execution of an Open Climate GIS job."""
@@ -43,50 +103,234 @@ class OpenClimateGisJob(Job):
     prefix = models.CharField(max_length=50, verbose_name='Prefix', blank=False, default='ocgis_output')
     with_auxiliary_files = models.BooleanField(verbose_name='Include auxiliary files ?')
     
+    # quick preview of the request on a sample of the data, and the JSON summary of its output
+    preview = models.BooleanField(verbose_name='Preview ?', default=False)
+    summary = models.TextField(verbose_name='Preview Summary', blank=True, null=True)
+    
+    # number of results served from/not found in the store of previously computed results
+    cache_hits = models.IntegerField(verbose_name='Cache Hits', default=0)
+    cache_misses = models.IntegerField(verbose_name='Cache Misses', default=0)
+    
+    # hash of the normalized job arguments, identical for all jobs that produce the same output
+    cache_key = models.CharField(max_length=64, verbose_name='Cache Key', blank=True, null=True, db_index=True)
+    # identical job already in progress, whose result is shared by this job
+    leader = models.ForeignKey('self', related_name='followers', verbose_name='Leader Job', blank=True, null=True)
+    
+    # size in bytes of the output directory owned by the job, and last time the output was produced or downloaded
+    output_size = models.BigIntegerField(verbose_name='Output Size', default=0)
+    last_access = models.DateTimeField(verbose_name='Last Access', blank=True, null=True)
+    
     def __init__(self, *args, **kwargs):
         
         super(OpenClimateGisJob, self).__init__(*args, **kwargs)
                 
-        # instantiate Open Climate GIS adapter
-        self.ocg = OCG(ocgisDatasets, ocgisGeometries, ocgisCalculations,
-                       ocgisConfig.get(Config.DEFAULT, "rootDir"),
-                       ocgisConfig.get(Config.DEFAULT, "rootUrl"),
-                       debug=str2bool( ocgisConfig.get(Config.DEFAULT, "debug")) )
+        # Open Climate GIS adapter
+        self.ocg = create_ocg(progress=self.report_progress)
+        
+        # estimator of the cost of the job, and limits on the cost
+        maxRuntime = ocgisOption(Config.DEFAULT, "maxRuntime")
+        self.estimator = Estimator(ocgisOption(Config.DEFAULT, "catalog"),
+                                   maxBytesRead=megabytes( ocgisOption(Config.DEFAULT, "maxBytesRead") ),
+                                   maxOutputSize=megabytes( ocgisOption(Config.DEFAULT, "maxOutputSize") ),
+                                   maxRuntime=int(maxRuntime) if maxRuntime is not None else None)
+        # validator of the request against the dataset metadata
+        self.validator = Validator(ocgisDatasets, ocgisOption(Config.DEFAULT, "catalog"))
         
     def __unicode__(self):
 		return 'Open Climate GIS Job id=%s status=%s' % (self.id, self.status)
         
     def submit(self):
-        """This method submits the job in a separate thread."""
+        """Submits the job, unless it selects no data or its estimated cost exceeds the configured limits, 
+           or an identical job is already in progress: in this case, the job is attached to it and will share its result."""
+        
+        errors = [message for field, message in self.validate()]
+        if len(errors) == 0:
+            errors = self.estimator.check( self.get_estimate() )
+        if len(errors) > 0:
+            self.job_class = self.class_name()
+            self.terminate(JOB_STATUS.REJECTED, ' '.join(errors))
+            return
+        
+        self.cache_key = encode_key( self.ocg.encodeArgs(self) )
+        leader = self._find_leader([JOB_STATUS.QUEUED, JOB_STATUS.STARTED])
+        if leader is None:
+            super(OpenClimateGisJob, self).submit()
+        else:
+            self.job_class = self.class_name()
+            self._attach(leader)
+        
+    def is_preview(self):
+        """Returns True if the job only previews the request on the first time step of the data."""
         
-        print 'Submitting the job'
-        runner = Runner(self)
-        runner.start()
+        return self.preview
+    
+    def get_summary(self):
+        """Returns the summary of the output of a preview job (see ncpp.preview.summarize_geojson), or None."""
+        
+        return json.loads(self.summary) if hasText(self.summary) else None
+    
+    def create_full_job(self):
+        """Returns a new (unsaved) job executing the full request previewed by this job."""
+        
+        return OpenClimateGisJob(status=JOB_STATUS.UNKNOWN, user=self.user, preview=False,
+                                 **dict( (field, getattr(self, field)) for field in REQUEST_FIELDS ))
         
-    def _submit(self):
-        """Method that contains the logic to run the job. It may be executed in a separate thread,"""
+    def validate(self):
+        """Returns the list of (field, message) errors of the request against the dataset metadata (see ncpp.validator)."""
         
         args = self.ocg.encodeArgs(self)
+        return self.validator.validate(self.dataset_category, self.dataset, self.variable,
+                                       args['geom'], args['time_range'], args['time_region'])
+        
+    def get_estimate(self):
+        """Returns the estimated cost of the job from the dataset catalog (see ncpp.estimator.estimate), 
+           or None if the datasets are not catalogued."""
+        
+        if not hasattr(self, '_estimate'):
+            self._estimate = self.estimator.estimate( self.ocg.encodeArgs(self) )
+        return self._estimate
+        
+    def get_cost(self):
+        """Returns the estimated runtime of the job in seconds, or None if it cannot be estimated."""
+        
+        estimate = self.get_estimate()
+        if estimate is None:
+            return None
+        return estimate['runtime']
+        
+    def update(self):
+        """Copies the result of the leader job, if it has completed."""
+        
+        if self.status == JOB_STATUS.ATTACHED and self.leader is not None:
+            leader = OpenClimateGisJob.objects.get(pk=self.leader_id)
+            if not leader.status in [JOB_STATUS.QUEUED, JOB_STATUS.STARTED]:
+                self._copy_result(leader)
+        
+    def _find_leader(self, statuses):
+        """Returns the oldest identical job with one of the given statuses, or None."""
+        
+        # only attach to older jobs, so that two identical jobs can never wait on each other
+        leaders = OpenClimateGisJob.objects.filter(cache_key=self.cache_key, leader__isnull=True, status__in=statuses,
+                                                   id__lt=self.id).order_by('id')
+        return leaders[0] if leaders.exists() else None
+        
+    def _attach(self, leader):
+        """Attaches this job to an identical job in progress."""
+        
+        print 'Attaching job id=%s to identical job id=%s' % (self.id, leader.id)
+        self.leader = leader
+        self.status = JOB_STATUS.ATTACHED
+        # the job no longer occupies its worker, nor a running slot of its user (see ncpp.scheduler)
+        self.worker = None
+        self.save()
+        # the leader may have completed before this job was attached to it
+        self.update()
+        
+    def get_output_dir(self):
+        """Returns the output directory of the job, in the sharded layout or in the flat layout of older jobs."""
+        
+        path = os.path.join(self.ocg.rootDir, get_output_path(self.id))
+        legacy_path = os.path.join(self.ocg.rootDir, str(self.id))
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            return legacy_path
+        return path
+    
+    def get_download_path(self):
+        """Returns the local path of the file downloaded by the user, or None."""
+        
+        if not hasText(self.url) or not self.url.startswith(self.ocg.rootUrl):
+            return None
+        return self.url.replace(self.ocg.rootUrl, self.ocg.rootDir, 1)
+    
+    def record_download(self, nbytes):
+        """Accounts for a download of the job output, which also marks the output as recently accessed
+           for all the jobs sharing it."""
+        
+        super(OpenClimateGisJob, self).record_download(nbytes)
+        self.last_access = datetime.now()
+        OpenClimateGisJob.objects.filter(url=self.url, status=JOB_STATUS.SUCCESS).update(last_access=self.last_access)
+    
+    def rerun(self):
+        """Submits again a job whose output has expired."""
+        
+        if self.status == JOB_STATUS.EXPIRED:
+            print 'Re-running expired job id=%s' % self.id
+            self.url = ''
+            self.error = None
+            self.output_size = 0
+            self.submit()
+    
+    def _copy_result(self, leader):
+        """Copies the outcome of the leader job into this job."""
+        
+        # a cancelled job has no outcome to share: the identical jobs attached to it are submitted again
+        if leader.status == JOB_STATUS.CANCELLED:
+            print 'Re-submitting job id=%s after cancellation of job id=%s' % (self.id, leader.id)
+            self.leader = None
+            self.submit()
+            return
+        
+        self.request = leader.request
+        self.url = leader.url
+        self.summary = leader.summary
+        self.error = leader.error
+        self.status = leader.status
+        self._encode_response()
+        self.save()
+        
+    def _notify_followers(self):
+        """Propagates the outcome of this job to all the identical jobs attached to it."""
+        
+        for follower in self.followers.filter(status=JOB_STATUS.ATTACHED).order_by('id'):
+            follower._copy_result(self)
+            
+    def terminate(self, status, error):
+        """Records the termination of the job, and propagates it to the identical jobs attached to it."""
+        
+        super(OpenClimateGisJob, self).terminate(status, error)
+        self._notify_followers()
+        
+    def execute(self):
+        """Method that contains the logic to run the job. It is executed by a worker process."""
+        
+        args = self.ocg.encodeArgs(self)
+        
+        # an identical job may have started after this job was queued
+        self.cache_key = encode_key(args)
+        leader = self._find_leader([JOB_STATUS.STARTED])
+        if leader is not None:
+            self._attach(leader)
+            return
+        
         self.request = self._encode_request(args)
         self.status = JOB_STATUS.STARTED
         self.save()
         
         try:
             # submit the job synchronously, wait for output
+            dir_output = os.path.join(self.ocg.rootDir, args['dir_output'])
             self.url = self.ocg.run(args)
             
             # job terminated successfully
             self.status = JOB_STATUS.SUCCESS
-            self._encode_response()
+            self.output_size = get_size(dir_output) if os.path.exists(dir_output) else 0
+            self.last_access = datetime.now()
+            if self.preview and self.get_download_path() is not None:
+                self.summary = json.dumps( summarize_geojson(self.get_download_path()) )
             
         except Exception as e:
             print e
             # job terminated in error
             self.status = JOB_STATUS.FAILED
             self.error = e
-            self._encode_response()    
             
-        self.save()   
+        self.cache_hits = self.ocg.cacheHits
+        self.cache_misses = self.ocg.cacheMisses
+        self._encode_response()
+            
+        # the status must be saved before the followers are notified
+        self.save()
+        self._notify_followers()
         
     def _encode_request(self, args):
         """Utility method to build the job request document."""
@@ -105,6 +349,7 @@ class OpenClimateGisJob(Job):
         self.response += '<status>%s</status>' % self.status
         self.response += '<url>%s</url>' % self.url
         self.response += '<error>%s</error>' % self.error
+        self.response += '<cache hits="%s" misses="%s"/>' % (self.cache_hits, self.cache_misses)
         self.response += '</response>'
         
         
@@ -159,19 +404,10 @@ class OpenClimateGisJob(Job):
         job_data.append( ('Output Format', ocgisChoices(Config.OUTPUT_FORMAT)[self.output_format]) )
         job_data.append( ('File Output Prefix', self.prefix) )
         job_data.append( ('Include Auxiliary Files', self.with_auxiliary_files) )
+        if self.preview:
+            job_data.append( ('Preview', self.preview) )
                  
         return job_data				  
         
     class Meta:
 		app_label= APPLICATION_LABEL
-
-class Runner(Thread):
-    """Class to execute an Open Climate GIS job in a separate thread."""
-    
-    def __init__ (self, job):
-        Thread.__init__(self)
-        self.job = job
-        
-    def run(self):
-        print "Running the job"
-        self.job._submit()
\ No newline at end of file
@@ -1,17 +1,30 @@
 import time
 import os
 from shutil import rmtree
-from ncpp.utils import hasText
+from ncpp.utils import hasText, get_output_path
+from ncpp.weights import get_grid, grid_fingerprint, get_cell_centers, compute_weights
+from ncpp.chunkcache import ChunkCacheProxy, is_remote
+from ncpp.preview import PREVIEW_OUTPUT_FORMAT
+from ncpp.parallel import (run_parallel, merge_outputs, split_bbox, split_time_range, overlaps_time_region,
+                           MERGE_TILES, MERGE_TIME)
+import math
 import re
 
 SLEEP_SECONDS = 1
 HEADERS_NOCALC = ['did','ugid','gid','time','year','month','day','variable','alias','value']
 HEADERS_CALC = ['did','ugid','gid','year','month','day','variable','alias','calc_name','value']
+# output formats whose partial outputs can be merged after a parallel execution
+PARALLEL_OUTPUT_FORMATS = ['csv','nc']
+# estimated memory to load one data value, and the geometry of one grid cell
+VALUE_BYTES = 8
+CELL_BYTES = 1024
 
 class OCG(object):
     """Adapter class that invokes the OCGIS library."""
     
-    def __init__(self, datasets, geometries, calculations, rootDir, rootUrl, debug=False):
+    def __init__(self, datasets, geometries, calculations, rootDir, rootUrl, debug=False, cache=None, processes=1, 
+                 tileMemory=None, chunkYears=None, progress=None, streamZip=False, climatologies=None,
+                 weights=None, chunkCache=None):
         # object holding datasets
         self.ocgisDatasets = datasets
         # object holding geometries
@@ -24,6 +37,28 @@ class OCG(object):
         self.rootUrl = rootUrl
         # flag to execute dummy run while developing
         self.debug = debug
+        # optional store of previously computed results
+        self.cache = cache
+        # number of processes executing the parts of a job in parallel
+        self.processes = processes
+        # memory budget in bytes for each tile of a bounding box request (None disables tiling)
+        self.tileMemory = tileMemory
+        # number of years in each time chunk of a long request (None disables time chunking)
+        self.chunkYears = chunkYears
+        # number of results found/not found in the store
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        # optional function progress(fraction, phase, bytesRead) invoked as the job advances
+        self.progress = progress
+        # flag to return the output directory, zipped on the fly when downloaded, instead of building a zip file
+        self.streamZip = streamZip
+        # optional store of precomputed climatology cubes read instead of the original datasets
+        self.climatologies = climatologies
+        # optional store of the grid cells covered by the selection geometries
+        self.weights = weights
+        # optional local cache of the data read from remote datasets, and the proxy serving it to ocgis
+        self.chunkCache = chunkCache
+        self.proxy = None
         
     def encodeArgs(self, openClimateGisJob):
         """Method to transform the OpenClimateGisJob instance into a dictionary of arguments passed on to the ocgis library."""
@@ -38,6 +73,7 @@ class OCG(object):
             jsonData =jsonObject[openClimateGisJob.variable]
         elif jsonObject['type'] == 'package':
             jsonData = jsonObject
+        args['package'] = jsonObject['type'] == 'package'
         args['uri'] = jsonData['uri']
         args['variable'] = jsonData["variable"]
         args['t_calendar'] = jsonData["t_calendar"]
@@ -120,14 +156,261 @@ class OCG(object):
         args['aggregate'] = openClimateGisJob.aggregate
         args['output_format'] = openClimateGisJob.output_format
         args['prefix'] = openClimateGisJob.prefix
-        args['dir_output'] = str( openClimateGisJob.id )
+        args['dir_output'] = get_output_path( openClimateGisJob.id ) if openClimateGisJob.id is not None else None
         args['with_auxiliary_files'] = openClimateGisJob.with_auxiliary_files
+        
+        # a preview reads only the first time step, or the first time group of a calculation,
+        # and returns a sample that can be displayed on a map
+        args['snippet'] = openClimateGisJob.preview
+        if openClimateGisJob.preview:
+            args['output_format'] = PREVIEW_OUTPUT_FORMAT
+            args['with_auxiliary_files'] = False
+        
+        # read the precomputed climatology cubes matching the calculation, if any
+        args['climatology'] = False
+        if self.climatologies is not None:
+            args = self.climatologies.rewrite(args) or args
             
         return args
         
+    def reportProgress(self, fraction, phase, bytesRead=None):
+        """Reports the fraction of the job completed, the current phase, and the estimated number of bytes read so far."""
+        
+        if self.progress is not None:
+            self.progress(fraction, phase, bytesRead)
+    
+    def getInputSize(self, datasets):
+        """Returns the total size in bytes of the local files read by the given datasets (remote URIs are not counted)."""
+        
+        size = 0
+        for rd in datasets:
+            uris = rd['uri'] if isinstance(rd['uri'], list) else [rd['uri']]
+            for uri in uris:
+                if os.path.isfile(uri):
+                    size += os.path.getsize(uri)
+        return size
+        
+    def getRequestDatasets(self, args):
+        """Returns the list of keyword arguments for each ocgis.RequestDataset of the job."""
+        
+        datasets = []
+        iter_tuple = [args[key] for key in ['uri', 'variable', 't_calendar', 't_units', 'alias']]
+        for uri,variable,t_calendar,t_units,alias in zip(*iter_tuple):
+            datasets.append( dict(uri=uri, variable=variable, t_calendar=t_calendar, t_units=t_units,
+                                  time_range=args['time_range'], time_region=args['time_region'], alias=alias) )
+        return datasets
+    
+    def getCachedDatasets(self, datasets):
+        """Returns the request datasets reading the remote URIs through the local chunk cache, if enabled.
+           The proxy serving the cache is started on first use, and runs until the end of the process."""
+        
+        if self.chunkCache is None:
+            return datasets
+        _datasets = []
+        for rd in datasets:
+            uris = rd['uri'] if isinstance(rd['uri'], list) else [rd['uri']]
+            if any([is_remote(uri) for uri in uris]):
+                if self.proxy is None:
+                    self.proxy = ChunkCacheProxy(self.chunkCache)
+                    self.proxy.start()
+                uris = [self.proxy.getUrl(uri) for uri in uris]
+                rd = dict(rd, uri=uris if isinstance(rd['uri'], list) else uris[0])
+            _datasets.append(rd)
+        return _datasets
+    
+    def getOperationsArgs(self, args, dir_output):
+        """Returns the keyword arguments for ocgis.OcgOperations, except for the datasets."""
+        
+        return dict(geom=args['geom'],
+                    select_ugid=args['select_ugid'],
+                    aggregate=args['aggregate'], 
+                    spatial_operation=args['spatial_operation'], 
+                    calc=args['calc'], 
+                    calc_grouping=args['calc_grouping'],
+                    calc_raw=args['calc_raw'],
+                    prefix=args['prefix'],
+                    output_format=args['output_format'], 
+                    dir_output=dir_output,
+                    headers=args['headers'],
+                    snippet=args['snippet'])
+        
+    def getSelection(self, args, datasets):
+        """Returns the selection geometries of an 'intersects' request as the centers of the grid cells they intersect,
+           read from the weights store, so that ocgis tests points instead of intersecting the geometry boundaries
+           with the grid. The selected cells are unchanged.
+           Returns None if the request cannot use the store."""
+        
+        # clipping needs the actual geometries, and the auxiliary files describe them
+        if (self.weights is None or args['spatial_operation'] != 'intersects' or not args['select_ugid']
+            or args['with_auxiliary_files']):
+            return None
+        
+        import ocgis
+        from shapely.geometry import MultiPoint
+        # the same selection applies to all the datasets, which must share the same grid
+        grids = []
+        for rd in datasets:
+            grid = ocgis.RequestDataset(**rd).get().spatial.grid
+            grids.append( get_grid(grid.extent, grid.resolution, *grid.shape) )
+        if len( set([grid_fingerprint(grid) for grid in grids]) ) != 1:
+            return None
+        grid = grids[0]
+        
+        selection = []
+        for ugid in args['select_ugid']:
+            def _compute():
+                geometry = list( ocgis.ShpCabinetIterator(args['geom'], select_ugid=[ugid]) )[0]['geom']
+                return compute_weights(geometry, grid)
+            weights = self.weights.getWeights(args['geom'], ugid, grid, _compute)
+            if len(weights['rows']) > 0:
+                selection.append( {'geom':MultiPoint( get_cell_centers(grid, weights) ), 'properties':{'UGID':ugid}} )
+        if len(selection) == 0:
+            return None
+        return selection
+        
+    def isParallelPackage(self, args):
+        """Returns True if the members of a data package can be executed in parallel and merged into a single output."""
+        
+        return (self.processes > 1 and args['package'] and len(args['uri']) > 1
+                and args['output_format'] in PARALLEL_OUTPUT_FORMATS)
+    
+    def getTiles(self, args, datasets):
+        """Splits a bounding box request into tiles, so that each tile fits within the memory budget.
+           Returns the list of tile bounding boxes, or None if the request must not be tiled."""
+        
+        # a spatial aggregation over the bounding box cannot be recombined exactly from the tiles,
+        # and the climatology cubes are small enough to be read at once
+        if (self.processes <= 1 or self.tileMemory is None or args['aggregate'] or args['climatology']
+            or args['output_format'] not in PARALLEL_OUTPUT_FORMATS
+            or not isinstance(args['geom'], list) or len(args['geom']) != 4):
+            return None
+        lonmin, lonmax, latmin, latmax = args['geom']
+        
+        # estimate the memory needed to load the request, from the grid and time axis of the first dataset
+        import ocgis
+        field = ocgis.RequestDataset(**datasets[0]).get()
+        resolution = field.spatial.grid.resolution
+        ntimes = field.temporal.shape[0]
+        if args['time_range'] is not None:
+            days = (args['time_range'][1] - args['time_range'][0]).days + 1
+            ntimes = min(ntimes, int( math.ceil(days/field.temporal.resolution) ))
+        ncols = int( math.ceil((lonmax-lonmin)/resolution) )
+        nrows = int( math.ceil((latmax-latmin)/resolution) )
+        nbytes = ncols*nrows*(ntimes*len(datasets)*VALUE_BYTES + CELL_BYTES)
+        ntiles = int( math.ceil(float(nbytes)/self.tileMemory) )
+        if ntiles <= 1:
+            return None
+        
+        print 'Splitting bounding box into %s tiles (estimated memory=%s bytes)' % (ntiles, nbytes)
+        return split_bbox(args['geom'], resolution, ntiles)
+    
+    def getTimeChunks(self, args, datasets):
+        """Splits the time range of a request into chunks of whole years, which can be computed independently.
+           Returns the list of chunk time ranges, or None if the request must not be chunked."""
+        
+        # calculations grouped across years (for example monthly climatologies) need the whole time axis
+        if (self.processes <= 1 or self.chunkYears is None or args['climatology']
+            or args['output_format'] not in PARALLEL_OUTPUT_FORMATS
+            or (args['calc'] is not None and 'year' not in (args['calc_grouping'] or []))):
+            return None
+        
+        if args['time_range'] is not None:
+            start, stop = args['time_range']
+        else:
+            import ocgis
+            field = ocgis.RequestDataset(**datasets[0]).get()
+            start, stop = field.temporal.extent_datetime
+        # chunks outside of the time region would be empty
+        chunks = [chunk for chunk in split_time_range(start, stop, self.chunkYears) 
+                  if overlaps_time_region(chunk, args['time_region'])]
+        if len(chunks) <= 1:
+            return None
+        print 'Splitting time range into %s chunks of %s years' % (len(chunks), self.chunkYears)
+        return chunks
+    
+    def runParts(self, members, splits, kwargs, mode):
+        """Executes the job as several independent operations across a pool of processes, then merges
+           the outputs into the layout of a single operation. Returns the path of the merged output.
+           
+           members: list of lists of ocgis.RequestDataset arguments, one output member each
+           splits: list of (RequestDataset arguments, OcgOperations arguments) overrides that partition each member
+           mode: how the outputs of the splits of the same member are merged
+        """
+        
+        dir_output = kwargs['dir_output']
+        parts = []
+        # description and estimated input size of each part, for progress reporting
+        labels = []
+        sizes = []
+        for i, datasets in enumerate(members):
+            variables = ', '.join([rd['alias'] for rd in datasets])
+            for j, (rd_kwargs, ops_kwargs) in enumerate(splits):
+                _dir_output = os.path.join(dir_output, 'part%s_%s' % (i, j))
+                os.makedirs(_dir_output)
+                _kwargs = dict(kwargs, dir_output=_dir_output)
+                _kwargs.update(ops_kwargs)
+                parts.append( ([dict(rd, **rd_kwargs) for rd in datasets], _kwargs) )
+                if mode == MERGE_TILES:
+                    labels.append( '%s, tile %s of %s' % (variables, j+1, len(splits)) )
+                elif mode == MERGE_TIME:
+                    labels.append( '%s, years %s-%s' % (variables, rd_kwargs['time_range'][0].year, rd_kwargs['time_range'][1].year) )
+                else:
+                    labels.append( variables )
+                sizes.append( self.getInputSize(datasets)/len(splits) )
+        
+        progress = {'bytesRead':0}
+        def _callback(index, ndone):
+            progress['bytesRead'] += sizes[index]
+            self.reportProgress(0.9*ndone/len(parts), 'Computed %s (%s of %s parts)' % (labels[index], ndone, len(parts)),
+                                progress['bytesRead'])
+        
+        self.reportProgress(0.0, 'Computing %s parts in parallel' % len(parts), 0)
+        paths = run_parallel(parts, self.processes, callback=_callback)
+        dirs = [part[1]['dir_output'] for part in parts]
+        
+        self.reportProgress(0.9, 'Merging outputs')
+        # merge the splits of each member
+        if len(splits) > 1:
+            _dirs = []
+            _paths = []
+            for i in range(len(members)):
+                _dir_output = os.path.join(dir_output, 'member%s' % i)
+                n = len(splits)
+                _paths.append( merge_outputs(dirs[i*n:(i+1)*n], paths[i*n:(i+1)*n], _dir_output, mode=mode) )
+                _dirs.append(_dir_output)
+            for _dir_output in dirs:
+                rmtree(_dir_output)
+            dirs, paths = _dirs, _paths
+        
+        # merge the members: the dataset identifiers are assigned as in a single operation over all members
+        if len(members) > 1:
+            path = merge_outputs(dirs, paths, dir_output, dids=[str(i+1) for i in range(len(members))])
+        else:
+            path = merge_outputs(dirs, paths, dir_output)
+        for _dir_output in dirs:
+            rmtree(_dir_output)
+        return path
+        
+    def isStreamedArchive(self, args):
+        """Returns True if the output of the job is a directory zipped on the fly when downloaded,
+           instead of a zip file built by ocgis: multi-file outputs (shapefiles, auxiliary files) when enabled."""
+        
+        return self.streamZip and (args['with_auxiliary_files'] or args['output_format'] == 'shp')
+    
     def run(self, args):
         
         print 'Running OCGIS job with arguments=%s' % args
+        
+        # identical requests resolve to the previously computed output
+        if self.cache is not None:
+            key = self.cache.getKey(args)
+            download_path = self.cache.lookup(key)
+            if download_path is not None:
+                print 'Found cached result for key=%s' % key
+                self.cacheHits += 1
+                self.reportProgress(1.0, 'Completed (cached result)', 0)
+                return download_path.replace(self.rootDir, self.rootUrl)
+            self.cacheMisses += 1
 
         # fake invocation on laptop
         if self.debug:
@@ -147,35 +430,54 @@ class OCG(object):
             os.makedirs(dir_output)             
                                     
             # build up the list of request datasets
-            dataset = []
-            iter_tuple = [args[key] for key in ['uri', 'variable', 't_calendar', 't_units', 'alias']]
-            time_range=args['time_range']
-            time_region=args['time_region']
-            for uri,variable,t_calendar,t_units,alias in zip(*iter_tuple):
-                rd = ocgis.RequestDataset(uri=uri,variable=variable,t_calendar=t_calendar,t_units=t_units,
-                                  time_range=time_range,time_region=time_region,alias=alias)
-                dataset.append(rd)
+            datasets = self.getCachedDatasets( self.getRequestDatasets(args) )
+            dataset = [ocgis.RequestDataset(**rd) for rd in datasets]
 
             ## construct the operations call
-            ops = ocgis.OcgOperations(dataset=dataset, 
-                                      geom=args['geom'],
-                                      select_ugid=args['select_ugid'],
-                                      aggregate=args['aggregate'], 
-                                      spatial_operation=args['spatial_operation'], 
-                                      calc=args['calc'], 
-                                      calc_grouping=args['calc_grouping'],
-                                      calc_raw=args['calc_raw'],
-                                      prefix=args['prefix'],
-                                      output_format=args['output_format'], 
-                                      dir_output=dir_output,
-                                      headers=args['headers'])
+            kwargs = self.getOperationsArgs(args, dir_output)
+            # geometries replaced by the grid cells they cover, from the weights store
+            selection = self.getSelection(args, datasets)
+            if selection is not None:
+                kwargs['geom'], kwargs['select_ugid'] = selection, None
+            # ocgis reports its progress through each geometry and variable as a percentage
+            inputSize = self.getInputSize(datasets)
+            def _callback(percent, message):
+                self.reportProgress(0.009*percent, message, int(inputSize*percent/100.0))
+            ops = ocgis.OcgOperations(dataset=dataset, callback=_callback, **kwargs)
+
+            # split the job into parts executed in parallel: package members, and/or spatial tiles or time chunks
+            members = [[rd] for rd in datasets] if self.isParallelPackage(args) else [datasets]
+            splits = [({}, {})]
+            mode = None
+            tiles = self.getTiles(args, datasets)
+            if tiles is not None:
+                splits = [({}, {'geom':tile}) for tile in tiles]
+                mode = MERGE_TILES
+            else:
+                chunks = self.getTimeChunks(args, datasets)
+                if chunks is not None:
+                    splits = [({'time_range':chunk}, {}) for chunk in chunks]
+                    mode = MERGE_TIME
 
             # execute the operation
             # 'path' points to the top-level folder containing the output data
-            path = ops.execute()
-            # 'download_path' points to single file for user to download
-            download_path = ocgis.format_return(path, ops, with_auxiliary_files=args['with_auxiliary_files'])
+            if len(members) > 1 or len(splits) > 1:
+                path = self.runParts(members, splits, kwargs, mode)
+            else:
+                self.reportProgress(0.0, 'Computing', 0)
+                path = ops.execute()
+            # 'download_path' points to single file for user to download,
+            # or to the directory streamed as a zip archive when downloaded
+            self.reportProgress(0.95, 'Packaging output', inputSize)
+            if self.isStreamedArchive(args):
+                download_path = path if os.path.isdir(path) else os.path.dirname(path)
+            else:
+                download_path = ocgis.format_return(path, ops, with_auxiliary_files=args['with_auxiliary_files'])
+            
+            if self.cache is not None:
+                download_path = self.cache.store(key, download_path)
 
+        self.reportProgress(1.0, 'Completed')
         # return ouput
         url = download_path.replace(self.rootDir, self.rootUrl)
         return url
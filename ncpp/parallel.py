@@ -0,0 +1,240 @@
+# module containing the parallel execution of Open Climate GIS operations, and the merging of their outputs
+from multiprocessing import Pool
+import csv
+import datetime
+import math
+import os
+import shutil
+
+# number of records copied at once when merging NetCDF variables
+NETCDF_COPY_RECORDS = 100
+
+# modes for merging the outputs of several operations:
+# each operation processed different variables, different spatial tiles, or different time chunks of the same variables
+MERGE_VARIABLES = 'variables'
+MERGE_TILES = 'tiles'
+MERGE_TIME = 'time'
+
+def execute_operations(part):
+    """Executes a single ocgis operation described by the tuple (list of RequestDataset arguments, OcgOperations arguments).
+       Returns the path of the output. This function runs inside the pool processes."""
+
+    import ocgis
+    datasets, kwargs = part
+    dataset = [ocgis.RequestDataset(**rd) for rd in datasets]
+    ops = ocgis.OcgOperations(dataset=dataset, **kwargs)
+    return ops.execute()
+
+def _execute_operations_indexed(indexed_part):
+    """Executes a single operation described by the tuple (index, part), returning the tuple (index, output path)."""
+
+    index, part = indexed_part
+    return (index, execute_operations(part))
+
+def run_parallel(parts, processes, callback=None):
+    """Executes the given operations across a pool of processes.
+       Returns the list of output paths, in the same order as the operations.
+       If given, callback(index, ndone) is invoked in the calling process every time an operation completes."""
+
+    pool = Pool( processes=max(1, min(processes, len(parts))) )
+    paths = [None]*len(parts)
+    try:
+        for ndone, (index, path) in enumerate(pool.imap_unordered(_execute_operations_indexed, enumerate(parts))):
+            paths[index] = path
+            if callback is not None:
+                callback(index, ndone+1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return paths
+
+def split_bbox(bbox, resolution, ntiles):
+    """Splits the bounding box [lonmin, lonmax, latmin, latmax] into a near-square arrangement of at least 'ntiles' tiles,
+       with inner edges on multiples of the grid resolution. Returns the list of tile bounding boxes."""
+
+    lonmin, lonmax, latmin, latmax = bbox
+    ncols = max(1, int( math.ceil((lonmax-lonmin)/resolution) ))
+    nrows = max(1, int( math.ceil((latmax-latmin)/resolution) ))
+    nx = max(1, min(ncols, int( round(math.sqrt(ntiles*float(ncols)/nrows)) )))
+    ny = max(1, min(nrows, int( math.ceil(float(ntiles)/nx) )))
+    lons = [lonmin + int(round(i*float(ncols)/nx))*resolution for i in range(nx)] + [lonmax]
+    lats = [latmin + int(round(j*float(nrows)/ny))*resolution for j in range(ny)] + [latmax]
+    return [ [lons[i], lons[i+1], lats[j], lats[j+1]] for j in range(ny) for i in range(nx) ]
+
+def split_time_range(start, stop, years):
+    """Splits the time range [start, stop] into consecutive chunks spanning 'years' calendar years each,
+       so that no yearly group straddles two chunks. Returns the list of chunk time ranges, in order."""
+
+    chunks = []
+    year = start.year
+    while year <= stop.year:
+        chunk_start = max(start, datetime.datetime(year, 1, 1))
+        # time ranges are inclusive: stop just before the first instant of the next chunk
+        chunk_stop = min(stop, datetime.datetime(year+years, 1, 1) - datetime.timedelta(microseconds=1))
+        chunks.append( [chunk_start, chunk_stop] )
+        year += years
+    return chunks
+
+def overlaps_time_region(time_range, time_region):
+    """Returns True if the time range contains at least one month selected by the time region."""
+
+    if time_region is None:
+        return True
+    months = time_region.get('month')
+    years = time_region.get('year')
+    year, month = time_range[0].year, time_range[0].month
+    while (year, month) <= (time_range[1].year, time_range[1].month):
+        if (months is None or month in months) and (years is None or year in years):
+            return True
+        year, month = (year+1, 1) if month == 12 else (year, month+1)
+    return False
+
+def merge_csv(paths, target, dids=None, dedupe=False):
+    """Concatenates CSV files sharing the same header into the target file.
+       If 'dids' is given, the 'did' column of the rows from paths[i] is set to dids[i].
+       If 'dedupe' is True, the rows of each grid cell ('gid' column) are only taken from the first file containing that cell,
+       which removes the cells on the boundary between adjacent tiles."""
+
+    with open(target, 'wb') as f:
+        writer = csv.writer(f)
+        header = None
+        # index of the file each grid cell is taken from
+        owners = {}
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as g:
+                reader = csv.reader(g)
+                _header = reader.next()
+                if header is None:
+                    header = _header
+                    writer.writerow(header)
+                elif [h.lower() for h in _header] != [h.lower() for h in header]:
+                    raise ValueError('Cannot merge CSV files with different headers: %s' % path)
+                lheader = [h.lower() for h in header]
+                idid = lheader.index('did') if (dids is not None and 'did' in lheader) else None
+                igid = lheader.index('gid') if (dedupe and 'gid' in lheader) else None
+                for row in reader:
+                    if igid is not None and owners.setdefault(row[igid], i) != i:
+                        continue
+                    if idid is not None:
+                        row[idid] = dids[i]
+                    writer.writerow(row)
+
+def merge_netcdf(paths, target):
+    """Merges the variables of NetCDF files defined on the same dimensions into the target file."""
+
+    import netCDF4
+
+    shutil.copy2(paths[0], target)
+    ds = netCDF4.Dataset(target, 'a')
+    try:
+        for path in paths[1:]:
+            src = netCDF4.Dataset(path, 'r')
+            try:
+                for name, dim in src.dimensions.items():
+                    if name not in ds.dimensions:
+                        ds.createDimension(name, None if dim.isunlimited() else len(dim))
+                    elif not dim.isunlimited() and len(dim) != len(ds.dimensions[name]):
+                        raise ValueError('Cannot merge NetCDF files with different dimension: %s' % name)
+                for name, var in src.variables.items():
+                    if name in ds.variables:
+                        continue
+                    attrs = dict( (k, var.getncattr(k)) for k in var.ncattrs() )
+                    fill_value = attrs.pop('_FillValue', None)
+                    _var = ds.createVariable(name, var.dtype, var.dimensions, fill_value=fill_value)
+                    _var.setncatts(attrs)
+                    # copy the data in blocks of records, to bound the memory usage
+                    if len(var.shape) == 0:
+                        _var.assignValue(var.getValue())
+                    else:
+                        for i in range(0, var.shape[0], NETCDF_COPY_RECORDS):
+                            _var[i:i+NETCDF_COPY_RECORDS] = var[i:i+NETCDF_COPY_RECORDS]
+            finally:
+                src.close()
+    finally:
+        ds.close()
+
+def _copy_attributes(src, dst):
+    dst.setncatts( dict( (k, src.getncattr(k)) for k in src.ncattrs() if k != '_FillValue' ) )
+
+def stitch_netcdf(paths, target):
+    """Stitches NetCDF files holding adjacent spatial tiles or time chunks of the same variables into the target file.
+       The stitched dimensions are those whose coordinate values differ across the files."""
+
+    import netCDF4
+    import numpy as np
+
+    srcs = [netCDF4.Dataset(path, 'r') for path in paths]
+    try:
+        first = srcs[0]
+        # for each stitched dimension: the union of the coordinate values, and the offset of each tile into it
+        offsets = {}
+        sizes = {}
+        for name in first.dimensions:
+            if name in first.variables and len(first.variables[name].dimensions) == 1:
+                values = [src.variables[name][:] for src in srcs]
+                if any([ len(v) != len(values[0]) or not np.array_equal(v, values[0]) for v in values[1:] ]):
+                    union = np.unique( np.concatenate(values) )
+                    if len(values[0]) > 1 and values[0][0] > values[0][-1]:
+                        union = union[::-1]
+                    sizes[name] = len(union)
+                    offsets[name] = [int( np.nonzero(union == v[0])[0][0] ) for v in values]
+
+        ds = netCDF4.Dataset(target, 'w', format=first.file_format)
+        try:
+            _copy_attributes(first, ds)
+            for name, dim in first.dimensions.items():
+                if name in sizes:
+                    ds.createDimension(name, sizes[name])
+                else:
+                    ds.createDimension(name, None if dim.isunlimited() else len(dim))
+            for name, var in first.variables.items():
+                fill_value = var.getncattr('_FillValue') if '_FillValue' in var.ncattrs() else None
+                _var = ds.createVariable(name, var.dtype, var.dimensions, fill_value=fill_value)
+                _copy_attributes(var, _var)
+                if len(var.shape) == 0:
+                    _var.assignValue(var.getValue())
+                elif not any([dim in offsets for dim in var.dimensions]):
+                    # explicit slices extend the unlimited dimensions
+                    _var[tuple( [slice(0, size) for size in var.shape] )] = var[:]
+                else:
+                    # write each tile at its offset along the stitched dimensions
+                    for i, src in enumerate(srcs):
+                        _src = src.variables[name]
+                        slices = []
+                        for dim, size in zip(_src.dimensions, _src.shape):
+                            offset = offsets[dim][i] if dim in offsets else 0
+                            slices.append( slice(offset, offset+size) )
+                        _var[tuple(slices)] = _src[:]
+        finally:
+            ds.close()
+    finally:
+        for src in srcs:
+            src.close()
+
+def merge_outputs(dirs, paths, dir_output, mode=MERGE_VARIABLES, dids=None):
+    """Merges the outputs of several operations, each written to its own directory, into 'dir_output',
+       reproducing the layout of the output of a single operation. CSV and NetCDF files are merged according to 'mode',
+       while all other (auxiliary) files are taken from the first operation. Returns the path of the merged output."""
+
+    for dirpath, dirnames, filenames in os.walk(dirs[0]):
+        reldir = os.path.relpath(dirpath, dirs[0])
+        _dirpath = os.path.normpath( os.path.join(dir_output, reldir) )
+        if not os.path.exists(_dirpath):
+            os.makedirs(_dirpath)
+        for filename in filenames:
+            relpath = os.path.normpath( os.path.join(reldir, filename) )
+            sources = [os.path.join(d, relpath) for d in dirs]
+            target = os.path.join(_dirpath, filename)
+            if all([os.path.exists(s) for s in sources]) and filename.endswith('.csv'):
+                merge_csv(sources, target, dids=dids, dedupe=(mode == MERGE_TILES))
+            elif all([os.path.exists(s) for s in sources]) and filename.endswith('.nc'):
+                if mode in [MERGE_TILES, MERGE_TIME]:
+                    stitch_netcdf(sources, target)
+                else:
+                    merge_netcdf(sources, target)
+            else:
+                shutil.copy2(sources[0], target)
+    return os.path.join(dir_output, os.path.relpath(paths[0], dirs[0]))
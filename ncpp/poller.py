@@ -0,0 +1,163 @@
+# module containing the central poller of the remote WPS executions of the climate index jobs:
+# a single service checks the status of all the outstanding executions, instead of one worker per job
+from multiprocessing.pool import ThreadPool
+import random
+import signal
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from ncpp.constants import JOB_STATUS, JOB_FINAL_STATUSES
+from ncpp.wps_client import WPSClient
+
+# number of status requests sent concurrently to the WPS servers
+POLLER_THREADS = getattr(settings, "NCPP_WPS_POLLER_THREADS", 8)
+# seconds between two checks of the same execution: the interval doubles, up to the maximum, while the status does not change
+POLL_MIN_INTERVAL = getattr(settings, "NCPP_WPS_POLL_MIN_INTERVAL", 4)
+POLL_MAX_INTERVAL = getattr(settings, "NCPP_WPS_POLL_MAX_INTERVAL", 300)
+# seconds between two reads of the outstanding executions from the database
+POLLER_TICK = 1
+
+def get_next_interval(interval, changed, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+    """Returns the interval before the next check of an execution: back to the minimum when its status changed,
+       doubled otherwise, up to the maximum."""
+
+    if changed or interval is None:
+        return min_interval
+    return min(2*interval, max_interval)
+
+def get_jitter(interval):
+    """Returns the delay before the next check, spread randomly over the second half of the interval,
+       so that the executions submitted together are not checked in bursts."""
+
+    return interval*random.uniform(0.5, 1.0)
+
+def _fetch(args):
+    fetch, url = args
+    try:
+        return (fetch(url), None)
+    except Exception as e:
+        return (None, e)
+
+def has_changed(job, execution):
+    """Returns True if the WPS execution reports a status or progress different from the one recorded in the job."""
+
+    progress = 1.0 if execution.isComplete() and execution.isSucceded() else (execution.percentCompleted or 0)/100.0
+    return (job.status, job.progress, job.phase) != (execution.status, progress, execution.statusMessage)
+
+
+class WPSPoller(object):
+    """Checks the status of all the outstanding WPS executions with concurrent requests, each execution at its own
+       adaptive interval, and records the status of a job only when it changed."""
+
+    def __init__(self, threads=POLLER_THREADS, fetch=None, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+        self.threads = threads
+        # function returning the WPS execution of a status location URL:
+        # by default, read on connections kept alive to the WPS servers, one per thread
+        self.fetch = fetch or WPSClient(None).check_status
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # (time of the next check, current interval) of each job identifier
+        self.schedule = {}
+        # identifiers of the jobs whose last check failed, retried at their next scheduled check
+        self.failed = set()
+        self.pool = None
+
+    def _reschedule(self, job, now, changed=False):
+        """Schedules the next check of a job, sooner if its status changed."""
+
+        interval = get_next_interval(self.schedule.get(job.id, (0, None))[1], changed, self.min_interval, self.max_interval)
+        self.schedule[job.id] = (now + get_jitter(interval), interval)
+
+    def get_pending(self):
+        """Returns the climate index jobs whose remote execution has not completed."""
+
+        from ncpp.models.climate_indexes import ClimateIndexJob
+        return ClimateIndexJob.objects.exclude(statusLocation='').exclude(status__in=JOB_FINAL_STATUSES)
+
+    def poll(self, now=None):
+        """Checks the executions that are due, and returns the number of jobs checked."""
+
+        now = now or time.time()
+        jobs = list(self.get_pending())
+        # forget the jobs that are no longer pending
+        ids = set([job.id for job in jobs])
+        for job_id in self.schedule.keys():
+            if job_id not in ids:
+                del self.schedule[job_id]
+        self.failed &= ids
+
+        due = []
+        for job in jobs:
+            isDue = self.schedule.get(job.id, (0, None))[0] <= now
+            # the remote execution cannot be cancelled: the job stops being tracked
+            if job.cancel_requested:
+                if isDue or job.id not in self.failed:
+                    self._handle(job, now, lambda: job.terminate(JOB_STATUS.CANCELLED, 'Job cancelled by user'))
+                continue
+            if isDue:
+                due.append(job)
+        if len(due) == 0:
+            return 0
+
+        if self.pool is None:
+            self.pool = ThreadPool(self.threads)
+        # the jobs sharing a remote execution are updated from a single status request
+        locations = sorted(set([job.statusLocation for job in due]))
+        results = dict( zip(locations, self.pool.map(_fetch, [(self.fetch, url) for url in locations])) )
+        for job in due:
+            execution, error = results[job.statusLocation]
+            if error is not None:
+                print 'Job id=%s: cannot check status: %s' % (job.id, error)
+                self._reschedule(job, now)
+            else:
+                self._handle(job, now, lambda: self._record(job, execution))
+        return len(due)
+
+    def _record(self, job, execution):
+        """Records the status of an execution in the job, if changed. Returns True if changed."""
+
+        changed = has_changed(job, execution)
+        if changed:
+            job._update(execution)
+        return changed
+
+    def _handle(self, job, now, action):
+        """Runs an action on a job: a failure is logged, and the job is checked again later, at a growing interval,
+           without stopping the other jobs."""
+
+        try:
+            changed = action()
+            self.failed.discard(job.id)
+        except Exception as e:
+            print 'Job id=%s: cannot update status: %s' % (job.id, e)
+            self.failed.add(job.id)
+            changed = False
+        self._reschedule(job, now, changed=bool(changed))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def serve_forever(self, tick=POLLER_TICK):
+        """Polls the executions until the process receives SIGTERM or SIGINT."""
+
+        stopped = []
+        def _shutdown(signum, frame):
+            stopped.append(signum)
+        signal.signal(signal.SIGTERM, _shutdown)
+        signal.signal(signal.SIGINT, _shutdown)
+
+        while len(stopped) == 0:
+            # an error reading the database is retried at the next tick
+            try:
+                self.poll()
+            except Exception as e:
+                print 'Cannot poll the WPS executions: %s' % e
+            # read the latest job statuses, committed by the workers and the web server
+            connection.close()
+            time.sleep(tick)
+        self.close()
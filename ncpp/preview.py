@@ -0,0 +1,50 @@
+# module containing the summary of the output of preview jobs
+import json
+
+# output format of the preview jobs, which can be displayed on a map
+PREVIEW_OUTPUT_FORMAT = 'geojson'
+
+def _iter_coordinates(coordinates):
+    """Yields the (x, y) positions nested in the coordinates of a GeoJSON geometry."""
+
+    if len(coordinates) > 0 and isinstance(coordinates[0], (int, long, float)):
+        yield coordinates
+    else:
+        for _coordinates in coordinates:
+            for position in _iter_coordinates(_coordinates):
+                yield position
+
+def summarize_geojson(path):
+    """Returns the summary of a GeoJSON feature collection written by ocgis, to be displayed with the preview:
+       number of features, bounding box [xmin, ymin, xmax, ymax], minimum, mean and maximum value,
+       and the variables or calculations found in the features."""
+
+    with open(path, 'r') as f:
+        collection = json.load(f)
+
+    xs = []
+    ys = []
+    values = []
+    variables = set()
+    for feature in collection.get('features', []):
+        if feature.get('geometry') is not None:
+            for position in _iter_coordinates(feature['geometry']['coordinates']):
+                xs.append(position[0])
+                ys.append(position[1])
+        properties = feature.get('properties') or {}
+        value = properties.get('value')
+        if isinstance(value, (int, long, float)):
+            values.append(value)
+        name = properties.get('calc_name') or properties.get('calc_key') or properties.get('alias') or properties.get('variable')
+        if name is not None:
+            variables.add(name)
+
+    summary = {'features':len(collection.get('features', [])), 'variables':sorted(variables),
+               'bbox':None, 'min':None, 'mean':None, 'max':None}
+    if len(xs) > 0:
+        summary['bbox'] = [min(xs), min(ys), max(xs), max(ys)]
+    if len(values) > 0:
+        summary['min'] = min(values)
+        summary['mean'] = sum(values)/float(len(values))
+        summary['max'] = max(values)
+    return summary
@@ -0,0 +1,132 @@
+# module containing the geometries of the Climate Science Center regions, read from the GML document shipped with the application
+# and sent inline to the WPS server, instead of being queried by the server from a remote WFS
+from django.conf import settings
+from owslib.wps import FeatureCollection, GMLMultiPolygonFeatureCollection, namespaces
+from owslib.util import nspath_eval
+from xml.etree import ElementTree
+import math
+import os
+
+GML_NAMESPACE = 'http://www.opengis.net/gml'
+MS_NAMESPACE = 'http://mapserver.gis.umn.edu/mapserver'
+
+# GML feature collection of the CSC regions, keyed by feature identifier (see ncpp.models.climate_indexes.REGION_CHOICES)
+GML_DIR = os.path.join(os.path.dirname(__file__), 'static', 'ncpp', 'gml')
+REGIONS_FILEPATH = os.path.join(GML_DIR, 'CSCregions.xml')
+# same regions simplified with a tolerance of SIMPLIFIED_TOLERANCE degrees, well below the 1/8 degree cells of the gridded datasets
+# (see 'python manage.py ncpp_simplify_regions')
+SIMPLIFIED_REGIONS_FILEPATH = os.path.join(GML_DIR, 'CSCregions_simplified.xml')
+SIMPLIFIED_TOLERANCE = 0.05
+
+# document of the regions sent to the WPS server: the full resolution or the simplified regions
+CSC_REGIONS_FILEPATH = getattr(settings, "NCPP_CSC_REGIONS_FILEPATH", REGIONS_FILEPATH)
+# attribute of the features sent to the WPS server holding the region identifier
+REGION_ATTRIBUTE = 'ID'
+
+def parse_coordinates(text):
+    """Returns the list of (lon, lat) of a GML 'coordinates' element."""
+
+    return [ tuple( float(value) for value in pair.split(',') ) for pair in text.split() ]
+
+def load_regions(path):
+    """Returns a dictionary of the polygons of each region of a GML feature collection, keyed by feature identifier.
+       Each polygon is the list of the (lon, lat) of its outer boundary."""
+
+    regions = {}
+    for feature in ElementTree.parse(path).getroot().iter('{%s}polygon' % MS_NAMESPACE):
+        polygons = []
+        for ring in feature.iter('{%s}outerBoundaryIs' % GML_NAMESPACE):
+            polygons.append( parse_coordinates( ring.find('.//{%s}coordinates' % GML_NAMESPACE).text ) )
+        regions[feature.get('fid')] = polygons
+    return regions
+
+def write_regions(regions, path):
+    """Writes the polygons of each region to a GML feature collection, in the format read by load_regions."""
+
+    lines = ['<?xml version="1.0" encoding="ISO-8859-1"?>',
+             '<wfs:FeatureCollection xmlns:ms="%s" xmlns:wfs="http://www.opengis.net/wfs" xmlns:gml="%s">' % (MS_NAMESPACE, GML_NAMESPACE)]
+    for fid in sorted(regions.keys()):
+        lines.append('<gml:featureMember><ms:polygon fid="%s"><ms:msGeometry><gml:MultiPolygon srsName="EPSG:4326">' % fid)
+        for polygon in regions[fid]:
+            lines.append('<gml:polygonMember><gml:Polygon><gml:outerBoundaryIs><gml:LinearRing><gml:coordinates>%s</gml:coordinates>'
+                         '</gml:LinearRing></gml:outerBoundaryIs></gml:Polygon></gml:polygonMember>' % ' '.join(['%r,%r' % point for point in polygon]))
+        lines.append('</gml:MultiPolygon></ms:msGeometry><ms:id>%s</ms:id></ms:polygon></gml:featureMember>' % fid)
+    lines.append('</wfs:FeatureCollection>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def _distance(point, start, end):
+    """Returns the distance of a point to the segment [start, end]."""
+
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2-x1, y2-y1
+    if dx == 0 and dy == 0:
+        return math.hypot(x-x1, y-y1)
+    t = max(0.0, min(1.0, ((x-x1)*dx + (y-y1)*dy)/(dx*dx + dy*dy)))
+    return math.hypot(x-x1-t*dx, y-y1-t*dy)
+
+def simplify_ring(points, tolerance):
+    """Returns the closed ring simplified by the Douglas-Peucker algorithm: the points within 'tolerance' degrees
+       of the simplified boundary are removed. The ring is left unchanged if it would collapse."""
+
+    if tolerance <= 0 or len(points) <= 4:
+        return list(points)
+    keep = [False]*len(points)
+    keep[0] = keep[-1] = True
+    # iterative version, since the rings have thousands of points
+    segments = [(0, len(points)-1)]
+    while len(segments) > 0:
+        first, last = segments.pop()
+        dmax, index = 0.0, None
+        for i in range(first+1, last):
+            d = _distance(points[i], points[first], points[last])
+            if d > dmax:
+                dmax, index = d, i
+        if index is not None and dmax > tolerance:
+            keep[index] = True
+            segments.append( (first, index) )
+            segments.append( (index, last) )
+    simplified = [point for point, kept in zip(points, keep) if kept]
+    return simplified if len(simplified) >= 4 else list(points)
+
+def simplify_regions(regions, tolerance):
+    """Returns the regions with all their polygons simplified."""
+
+    return dict( (fid, [simplify_ring(polygon, tolerance) for polygon in polygons]) for fid, polygons in regions.items() )
+
+
+class RegionsFeatureCollection(FeatureCollection):
+    '''Feature collection sent inline to the WPS server, with one multi-polygon feature for each region,
+       identified by the region key in its REGION_ATTRIBUTE attribute.'''
+    
+    def __init__(self, regions):
+        '''Initializer accepts a list of (region key, list of polygons), where each polygon is a list of (lon, lat) tuples.'''
+        self.regions = regions
+    
+    def getXml(self):
+        dataElement = None
+        for i, (region, polygons) in enumerate(self.regions):
+            # feature encoded by owslib, then renamed
+            element = GMLMultiPolygonFeatureCollection(polygons).getXml()
+            feature = element.find('.//%s' % nspath_eval('gml:box', namespaces))
+            feature.set(nspath_eval('gml:id', namespaces), 'box.%s' % (i+1))
+            feature.find(nspath_eval('gml:%s' % REGION_ATTRIBUTE, namespaces)).text = region
+            if dataElement is None:
+                dataElement = element
+            else:
+                dataElement.find('.//%s' % nspath_eval('gml:featureMembers', namespaces)).append(feature)
+        return dataElement
+
+
+# regions loaded by this process, keyed by file path
+_regions = {}
+
+def get_region_polygons(region, path=CSC_REGIONS_FILEPATH):
+    """Returns the polygons of a CSC region, loaded once per process."""
+
+    if path not in _regions:
+        _regions[path] = load_regions(path)
+    try:
+        return _regions[path][region]
+    except KeyError:
+        raise Exception("Unrecognized region choice: %s" % region)
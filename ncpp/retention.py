@@ -0,0 +1,126 @@
+# module containing the retention policy of the job outputs: maximum age, per-user and global disk quotas
+from datetime import datetime, timedelta
+from shutil import rmtree
+import os
+
+from ncpp.constants import JOB_STATUS
+from ncpp.models.open_climate_gis import OpenClimateGisJob, create_result_cache
+from ncpp.models.batch import OpenClimateGisBatchJob
+from ncpp.models.climate_indexes import ClimateIndexJob
+from ncpp.cache import get_unlinked_size
+from ncpp.config import Config, ocgisOption
+from ncpp.utils import megabytes
+
+# classes of the jobs writing their output under rootDir, with the status of their successful completion
+RETAINED_JOBS = [(OpenClimateGisJob, JOB_STATUS.SUCCESS), (OpenClimateGisBatchJob, JOB_STATUS.SUCCESS), (ClimateIndexJob, 'ProcessSucceeded')]
+
+class RetentionManager(object):
+    """Removes the output directories of completed jobs, least recently accessed first, when they exceed
+       the maximum age or the disk quotas. Jobs whose output file is no longer available are marked as expired."""
+
+    def __init__(self, maxAge=None, userQuota=None, totalQuota=None, cache=None):
+        # maximum number of days since the last access to the output
+        self.maxAge = maxAge
+        # maximum size in bytes of the outputs of each user, and of all users
+        self.userQuota = userQuota
+        self.totalQuota = totalQuota
+        # store of the results, holding hard links to the outputs of the jobs (see ncpp.cache.ResultCache)
+        self.cache = cache
+
+    def getSucceeded(self, **kwargs):
+        """Returns the list of successful jobs of all the retained classes, filtered by the given arguments."""
+
+        jobs = []
+        for kls, status in RETAINED_JOBS:
+            jobs.extend( kls.objects.filter(status=status, **kwargs) )
+        return jobs
+
+    def getJobs(self):
+        """Returns the jobs owning an output directory, least recently accessed first."""
+
+        return sorted(self.getSucceeded(output_size__gt=0), key=lambda job: (job.last_access, job.id))
+
+    def remove(self, job):
+        """Removes the output directory of a job, with the result cached from it, and expires the jobs whose output file
+           was removed with them. Returns the number of bytes freed, and the list of expired jobs."""
+
+        paths = [job.get_output_dir()]
+        # the cached result is a hard link to the output: both are removed to free the space
+        if self.cache is not None and getattr(job, 'cache_key', None):
+            paths.append( self.cache.getEntryDir(job.cache_key) )
+        freed = get_unlinked_size(paths)
+        print 'Removing output of job id=%s (%s bytes freed)' % (job.id, freed)
+        rmtree(paths[0], ignore_errors=True)
+        if len(paths) > 1:
+            self.cache.remove(job.cache_key)
+        job.output_size = 0
+        job.save()
+        return freed, self.expireMissing( job.__class__.objects.filter(status=dict(RETAINED_JOBS)[job.__class__], url=job.url) )
+
+    def expireMissing(self, jobs):
+        """Marks as expired the given jobs whose output file no longer exists, and removes what is left of their output
+           directory: the links to an output evicted from the result cache. Returns the list of expired jobs."""
+
+        expired = []
+        for job in jobs:
+            path = job.get_download_path()
+            if path is not None and not os.path.exists(path):
+                print 'Output of job id=%s expired' % job.id
+                rmtree(job.get_output_dir(), ignore_errors=True)
+                job.status = JOB_STATUS.EXPIRED
+                job.output_size = 0
+                job.save()
+                expired.append(job)
+        return expired
+
+    def collect(self, now=None):
+        """Applies the retention policy. Returns the list of expired jobs."""
+
+        now = now or datetime.now()
+        # outputs removed by other means, for example evicted from the result cache
+        expired = self.expireMissing( self.getSucceeded() )
+        removed = set()
+
+        def _remove(job):
+            removed.add(job.id)
+            freed, jobs = self.remove(job)
+            expired.extend(jobs)
+            return freed
+
+        # outputs not accessed for too long
+        if self.maxAge is not None:
+            for job in self.getJobs():
+                if job.last_access is not None and job.last_access < now-timedelta(days=self.maxAge):
+                    _remove(job)
+
+        # least recently accessed outputs of the users above their quota
+        if self.userQuota is not None:
+            sizes = {}
+            jobs = list(self.getJobs())
+            for job in jobs:
+                sizes[job.user_id] = sizes.get(job.user_id, 0) + job.output_size
+            for job in jobs:
+                if sizes[job.user_id] > self.userQuota:
+                    sizes[job.user_id] -= _remove(job)
+
+        # least recently accessed outputs of all users
+        if self.totalQuota is not None:
+            jobs = list(self.getJobs())
+            size = sum([job.output_size for job in jobs])
+            for job in jobs:
+                if size <= self.totalQuota:
+                    break
+                size -= _remove(job)
+
+        print 'Removed %s job outputs, %s jobs expired' % (len(removed), len(expired))
+        return expired
+
+
+def get_retention_manager():
+    """Returns the retention manager configured in the Open Climate GIS configuration file."""
+
+    maxAge = ocgisOption(Config.DEFAULT, "maxAge")
+    return RetentionManager(maxAge=int(maxAge) if maxAge is not None else None,
+                            userQuota=megabytes( ocgisOption(Config.DEFAULT, "userQuota") ),
+                            totalQuota=megabytes( ocgisOption(Config.DEFAULT, "totalQuota") ),
+                            cache=create_result_cache())
@@ -0,0 +1,121 @@
+# module containing the fair-share scheduling of the queued jobs
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from ncpp.constants import JOB_STATUS, JOB_FINAL_STATUSES, JOB_PRIORITY
+from ncpp.models.common import Job, SubmissionBucket
+
+# maximum number of jobs of the same user running at the same time
+USER_CONCURRENCY = getattr(settings, "NCPP_SCHEDULER_USER_CONCURRENCY", 2)
+# maximum number of previews of the same user running at the same time, counted separately
+PREVIEW_CONCURRENCY = getattr(settings, "NCPP_SCHEDULER_PREVIEW_CONCURRENCY", 1)
+# token bucket limiting the rate at which the jobs of each user enter the queue:
+# sustained number of jobs per minute, and number of jobs that can be submitted at once
+SUBMISSION_RATE = getattr(settings, "NCPP_SCHEDULER_SUBMISSION_RATE", 6)
+SUBMISSION_BURST = getattr(settings, "NCPP_SCHEDULER_SUBMISSION_BURST", 10)
+# maximum cost (estimated runtime in seconds) of an interactive job: more expensive jobs are executed with bulk priority
+INTERACTIVE_COST = getattr(settings, "NCPP_SCHEDULER_INTERACTIVE_COST", 100)
+# minimum cost of a job deferred to the off-peak hours, and the off-peak hours (start, stop), or None to never defer
+OFFPEAK_COST = getattr(settings, "NCPP_SCHEDULER_OFFPEAK_COST", 10000)
+OFFPEAK_HOURS = getattr(settings, "NCPP_SCHEDULER_OFFPEAK_HOURS", None)
+# number of queued jobs considered at each scheduling decision
+SCHEDULING_WINDOW = 100
+
+
+def get_offpeak_start(now, hours=OFFPEAK_HOURS):
+    """Returns the next time within the off-peak hours, which is 'now' itself if it falls within them.
+       The off-peak hours (start, stop) may wrap around midnight."""
+
+    start, stop = hours
+    if (start <= stop and start <= now.hour < stop) or (start > stop and (now.hour >= start or now.hour < stop)):
+        return now
+    offpeak = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if offpeak < now:
+        offpeak += timedelta(days=1)
+    return offpeak
+
+def take_token(user, now=None):
+    """Takes one token from the user's submission bucket.
+       Returns the time at which the token becomes available, which is 'now' unless the user exceeded the rate."""
+
+    now = now or datetime.now()
+    rate = SUBMISSION_RATE/60.0
+    SubmissionBucket.objects.get_or_create(user=user, defaults={'tokens':SUBMISSION_BURST, 'updated':now})
+    while True:
+        bucket = SubmissionBucket.objects.get(user=user)
+        # refill the bucket for the time elapsed since the last submission
+        elapsed = max(0.0, (now - bucket.updated).total_seconds())
+        tokens = min(float(SUBMISSION_BURST), bucket.tokens + elapsed*rate) - 1
+        # the update only succeeds if no other process took a token in the meantime, otherwise read the bucket again
+        if SubmissionBucket.objects.filter(pk=bucket.pk, tokens=bucket.tokens, updated=bucket.updated).update(tokens=tokens, updated=max(now, bucket.updated)) == 1:
+            break
+    # a negative balance is paid back by waiting
+    if tokens >= 0:
+        return now
+    return now + timedelta(seconds=-tokens/rate)
+
+def schedule(job):
+    """Assigns the priority class and the earliest start time of a job entering the queue."""
+
+    now = datetime.now()
+    not_before = take_token(job.user, now)
+    # previews run in the fast lane: ahead of all other jobs, and never deferred
+    if job.is_preview():
+        job.priority = JOB_PRIORITY.PREVIEW
+        job.not_before = not_before if not_before > now else None
+        return
+    cost = job.get_cost()
+    # a job whose runtime cannot be estimated is not classified: it runs as an interactive job
+    job.priority = JOB_PRIORITY.INTERACTIVE if cost is None or cost <= INTERACTIVE_COST else JOB_PRIORITY.BULK
+    if OFFPEAK_HOURS is not None and cost is not None and cost >= OFFPEAK_COST:
+        not_before = max(not_before, get_offpeak_start(now))
+    job.not_before = not_before if not_before > now else None
+
+def get_running_jobs(previews=False):
+    """Returns a dictionary of the number of running jobs, or of running previews only, for each user identifier."""
+
+    running = Job.objects.filter(worker__isnull=False).exclude(status__in=JOB_FINAL_STATUSES+[JOB_STATUS.QUEUED])
+    if previews:
+        running = running.filter(priority=JOB_PRIORITY.PREVIEW)
+    return dict( (r['user'], r['njobs']) for r in running.values('user').annotate(njobs=Count('id')) )
+
+def get_candidates(now=None, previews_only=False):
+    """Returns the queued jobs that can be started now, in the order they should be claimed:
+       by priority class, then favoring the users with fewer running jobs, then by submission time.
+       Users who reached their maximum number of running jobs are skipped, except for previews,
+       which are limited to a maximum number of running previews per user."""
+
+    now = now or datetime.now()
+    running = get_running_jobs()
+    queued = Job.objects.filter(status=JOB_STATUS.QUEUED).exclude(not_before__gt=now)
+    if previews_only:
+        queued = queued.filter(priority=JOB_PRIORITY.PREVIEW)
+    # the users at their limit are excluded before the window is taken, so that their jobs never fill it
+    previews = Q(priority=JOB_PRIORITY.PREVIEW)
+    others = ~Q(priority=JOB_PRIORITY.PREVIEW)
+    capped = [user_id for user_id, njobs in running.items() if njobs >= USER_CONCURRENCY]
+    if len(capped) > 0:
+        others &= ~Q(user__in=capped)
+    capped = [user_id for user_id, njobs in get_running_jobs(previews=True).items() if njobs >= PREVIEW_CONCURRENCY]
+    if len(capped) > 0:
+        previews &= ~Q(user__in=capped)
+    queued = queued.filter(previews | others)
+    candidates = queued.order_by('priority', 'submissionDateTime', 'id')[:SCHEDULING_WINDOW]
+    return sorted(candidates, key=lambda job: (job.priority, running.get(job.user_id, 0), job.submissionDateTime, job.id))
+
+def get_queue_positions(now=None):
+    """Returns a dictionary of the position of each queued job, not counting the deferred jobs (position None).
+       The position ignores the fair-share ordering, which depends on the jobs running when the job is claimed."""
+
+    now = now or datetime.now()
+    positions = {}
+    position = 0
+    for id, not_before in Job.objects.filter(status=JOB_STATUS.QUEUED).order_by('priority', 'submissionDateTime', 'id').values_list('id', 'not_before'):
+        if not_before is not None and not_before > now:
+            positions[id] = None
+        else:
+            position += 1
+            positions[id] = position
+    return positions
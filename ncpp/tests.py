@@ -6,6 +6,47 @@ Replace this with more appropriate tests for your application.
 """
 
 from django.test import TestCase
+from django.test.client import Client
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+import base64
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from StringIO import StringIO
+
+from ncpp.constants import JOB_STATUS
+from ncpp.models import Job, OpenClimateGisJob, OpenClimateGisBatchJob
+from ncpp.workers import claim_job, requeue_orphans, get_worker_prefix, run_job
+from ncpp.scheduler import take_token, get_offpeak_start, get_queue_positions, get_running_jobs, SUBMISSION_BURST, SCHEDULING_WINDOW, USER_CONCURRENCY
+from ncpp.constants import JOB_PRIORITY
+from ncpp.estimator import estimate, Estimator
+from ncpp.validator import check_time, check_space
+from ncpp.retention import RetentionManager
+from ncpp.climatology import ClimatologyStore, get_climatology_calcs, get_climatology_groupings, get_climatology_calc
+from ncpp.config import ocgisConfig, Config
+from ncpp.utils import get_output_path
+from ncpp.download import parse_range
+from ncpp.zipstream import ZipStream
+from ncpp.cache import ResultCache, encode_key, get_unlinked_size
+from ncpp.weights import WeightsStore, get_grid, grid_fingerprint, get_cell_centers
+from ncpp.chunkcache import ChunkCache, ChunkCacheProxy, parse_request
+from ncpp.preview import summarize_geojson
+from ncpp.events import job_events, get_status, get_etag
+from ncpp.poller import WPSPoller, get_next_interval
+from ncpp.wps_client import WPSClient, DocumentCache
+from ncpp.regions import load_regions, write_regions, simplify_ring, simplify_regions, get_region_polygons, REGIONS_FILEPATH, SIMPLIFIED_REGIONS_FILEPATH
+from ncpp.regions import RegionsFeatureCollection
+import SocketServer
+from ncpp.models.climate_indexes import ClimateIndexJob, split_csv
+import BaseHTTPServer
+import threading
+import urllib2
+from ncpp.parallel import merge_outputs, split_bbox, split_time_range, overlaps_time_region, MERGE_TILES
 
 
 class SimpleTest(TestCase):
@@ -14,3 +55,1309 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def create_job(user, **kwargs):
+    """Creates an Open Climate GIS job with default values for all required fields."""
+
+    fields = dict(status=JOB_STATUS.UNKNOWN, user=user, dataset_category='Observational Datasets',
+                  dataset='Maurer02v2 Datasets', variable='Air Temperature (1971-2000)',
+                  calc_group='', spatial_operation='intersects', output_format='csv')
+    fields.update(kwargs)
+    return OpenClimateGisJob.objects.create(**fields)
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='tester')
+
+    def test_submit_enqueues_job(self):
+        job = create_job(self.user)
+        job.submit()
+        job = OpenClimateGisJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, JOB_STATUS.QUEUED)
+        self.assertEqual(job.job_class, 'ncpp.models.open_climate_gis.OpenClimateGisJob')
+
+    def test_claim_job_in_submission_order(self):
+        job1 = create_job(self.user)
+        job2 = create_job(self.user, variable='Precipitation (1971-2000)')
+        job1.submit()
+        job2.submit()
+
+        claimed = claim_job('worker-1')
+        self.assertTrue(isinstance(claimed, OpenClimateGisJob))
+        self.assertEqual(claimed.pk, job1.pk)
+        self.assertEqual(claimed.status, JOB_STATUS.STARTED)
+        self.assertEqual(claimed.worker, 'worker-1')
+        self.assertEqual(claim_job('worker-2').pk, job2.pk)
+        self.assertTrue(claim_job('worker-3') is None)
+
+    def test_requeue_orphans(self):
+        job = create_job(self.user)
+        job.submit()
+        claim_job(get_worker_prefix() + '1-0')
+        self.assertEqual(requeue_orphans(), 1)
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job.pk).status, JOB_STATUS.QUEUED)
+
+    def test_identical_jobs_are_coalesced(self):
+        job1 = create_job(self.user)
+        job2 = create_job(self.user)
+        job3 = create_job(self.user, variable='Maximum Air Temperature (1971-2000)')
+        for job in [job1, job2, job3]:
+            job.submit()
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job2.pk).status, JOB_STATUS.ATTACHED)
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job2.pk).leader_id, job1.pk)
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job3.pk).status, JOB_STATUS.QUEUED)
+
+        # the attached job is never claimed, and receives the result of the leader
+        self.assertEqual(claim_job('worker-1').pk, job1.pk)
+        self.assertEqual(claim_job('worker-2').pk, job3.pk)
+        self.assertTrue(claim_job('worker-3') is None)
+        job1 = OpenClimateGisJob.objects.get(pk=job1.pk)
+        job1.status = JOB_STATUS.SUCCESS
+        job1.url = 'http://localhost/static/ocgis/1/ocgis_output.csv'
+        job1.save()
+        job1._notify_followers()
+        job2 = OpenClimateGisJob.objects.get(pk=job2.pk)
+        self.assertEqual(job2.status, JOB_STATUS.SUCCESS)
+        self.assertEqual(job2.url, job1.url)
+
+
+class SchedulerTest(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create(username='tester1')
+        self.user2 = User.objects.create(username='tester2')
+
+    def test_priority_classes(self):
+        bulk = create_job(self.user1, datetime_start=datetime.datetime(1950,1,1), datetime_stop=datetime.datetime(1999,12,31),
+                          geometry='QED TBW Basins', geometry_id='1 - WITHE,2 - WITHE,3 - WITHE')
+        bulk._estimate = {'cells':3000, 'timesteps':18262, 'values':3000*18262, 'bytes_read':3000*18262*4, 'output_size':3*600*4, 'runtime':600.0}
+        small = create_job(self.user1, variable='Precipitation (1971-2000)')
+        bulk.submit()
+        small.submit()
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=bulk.pk).priority, JOB_PRIORITY.BULK)
+        # no estimate without the catalog: not classified
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=small.pk).priority, JOB_PRIORITY.INTERACTIVE)
+        self.assertEqual(claim_job('worker-1').pk, small.pk)
+        self.assertEqual(claim_job('worker-2').pk, bulk.pk)
+
+    def test_user_concurrency(self):
+        variables = ['Air Temperature (1971-2000)', 'Precipitation (1971-2000)', 'Maximum Air Temperature (1971-2000)']
+        jobs = [create_job(self.user1, variable=variable) for variable in variables] + [create_job(self.user2, variable='Minimum Air Temperature (1971-2000)')]
+        for job in jobs:
+            job.submit()
+        # the second user goes first once the first user has a running job,
+        # and the third job of the first user waits until one of its jobs completes
+        self.assertEqual([claim_job('worker-%s' % i).pk for i in range(3)], [jobs[0].pk, jobs[3].pk, jobs[1].pk])
+        self.assertTrue(claim_job('worker-3') is None)
+        self.assertEqual(get_queue_positions(), {jobs[2].pk: 1})
+
+    def test_capped_user_does_not_fill_window(self):
+        for i in range(USER_CONCURRENCY):
+            create_job(self.user1, status=JOB_STATUS.STARTED, worker='worker-%s' % i)
+        for i in range(SCHEDULING_WINDOW + 1):
+            create_job(self.user1, status=JOB_STATUS.QUEUED)
+        job = create_job(self.user2, status=JOB_STATUS.QUEUED, job_class='ncpp.models.open_climate_gis.OpenClimateGisJob')
+        self.assertEqual(claim_job('worker-%s' % USER_CONCURRENCY).pk, job.pk)
+
+    def test_attached_job_is_not_running(self):
+        leader = create_job(self.user1)
+        leader.submit()
+        self.assertEqual(claim_job('worker-1').pk, leader.pk)
+        # identical job claimed while the leader runs: it waits for the leader without holding a running slot
+        follower = create_job(self.user1, status=JOB_STATUS.QUEUED, job_class=leader.job_class)
+        follower = claim_job('worker-2')
+        follower.execute()
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=follower.pk).status, JOB_STATUS.ATTACHED)
+        self.assertEqual(get_running_jobs(), {self.user1.id: 1})
+
+    def test_submission_rate(self):
+        now = datetime.datetime(2013,1,1,12)
+        for i in range(SUBMISSION_BURST):
+            self.assertEqual(take_token(self.user1, now), now)
+        self.assertTrue(take_token(self.user1, now) > now)
+        self.assertEqual(take_token(self.user2, now), now)
+
+    def test_offpeak_start(self):
+        self.assertEqual(get_offpeak_start(datetime.datetime(2013,1,1,12), (22, 6)), datetime.datetime(2013,1,1,22))
+        self.assertEqual(get_offpeak_start(datetime.datetime(2013,1,1,23), (22, 6)), datetime.datetime(2013,1,1,23))
+        self.assertEqual(get_offpeak_start(datetime.datetime(2013,1,1,3), (22, 6)), datetime.datetime(2013,1,1,3))
+
+
+class PreviewTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+
+    def test_preview_fast_lane(self):
+        jobs = [create_job(self.user, variable=variable) for variable in
+                ['Air Temperature (1971-2000)', 'Precipitation (1971-2000)', 'Maximum Air Temperature (1971-2000)']]
+        preview = create_job(self.user, variable='Minimum Air Temperature (1971-2000)', preview=True)
+        for job in jobs + [preview]:
+            job.submit()
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=preview.pk).priority, JOB_PRIORITY.PREVIEW)
+        # workers reserved for the previews only claim previews
+        self.assertTrue(claim_job('worker-p', previews_only=True).is_preview())
+        self.assertTrue(claim_job('worker-p', previews_only=True) is None)
+        self.assertEqual(claim_job('worker-1').pk, jobs[0].pk)
+
+    def test_preview_concurrency(self):
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        previews = [create_job(user, variable=variable, preview=True) for user, variable in
+                    [(self.user, 'Air Temperature (1971-2000)'), (self.user, 'Precipitation (1971-2000)'), (other, 'Maximum Air Temperature (1971-2000)')]]
+        for job in previews:
+            job.submit()
+        # a single running preview per user: the second preview of the first user waits for the first one
+        self.assertEqual(claim_job('worker-p', previews_only=True).pk, previews[0].pk)
+        self.assertEqual(claim_job('worker-1').pk, previews[2].pk)
+        self.assertTrue(claim_job('worker-2') is None)
+
+    def test_preview_args(self):
+        job = create_job(self.user, preview=True, output_format='nc', with_auxiliary_files=True)
+        args = job.ocg.encodeArgs(job)
+        self.assertEqual((args['snippet'], args['output_format'], args['with_auxiliary_files']), (True, 'geojson', False))
+        full_job = job.create_full_job()
+        self.assertEqual((full_job.preview, full_job.output_format, full_job.variable), (False, 'nc', job.variable))
+
+    def test_summarize_geojson(self):
+        features = [{'type':'Feature', 'geometry':{'type':'Polygon', 'coordinates':[[[-100.0, 30.0], [-99.0, 30.0], [-99.0, 31.0], [-100.0, 30.0]]]},
+                     'properties':{'alias':'tas', 'value':10.0}},
+                    {'type':'Feature', 'geometry':{'type':'Point', 'coordinates':[-98.5, 32.5]}, 'properties':{'alias':'tas', 'value':14.0}}]
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            f.write( simplejson.dumps({'type':'FeatureCollection', 'features':features}) )
+        summary = summarize_geojson(path)
+        os.remove(path)
+        self.assertEqual(summary, {'features':2, 'variables':['tas'], 'bbox':[-100.0, 30.0, -98.5, 32.5], 'min':10.0, 'mean':12.0, 'max':14.0})
+
+    def test_submit_full_job(self):
+        preview = create_job(self.user, status=JOB_STATUS.SUCCESS, preview=True)
+        self.client.login(username='tester', password='secret')
+        response = self.client.get(reverse('job_commit', args=[preview.id, preview.class_name()]))
+        full_job = OpenClimateGisJob.objects.exclude(pk=preview.pk).get()
+        self.assertRedirects(response, reverse('job_detail', args=[full_job.id, full_job.class_name()]))
+        self.assertEqual((full_job.preview, full_job.status), (False, JOB_STATUS.QUEUED))
+
+
+class EstimatorTest(TestCase):
+
+    container = {'time_start':datetime.datetime(1971,1,1), 'time_stop':datetime.datetime(2000,12,31), 'time_res_days':1.0,
+                 'spatial_res':u'0.125', 'field_shape':u'(1, 10958, 1, 222, 462)',
+                 'spatial_envelope':u'POLYGON ((-124.75 25.125, -124.75 52.875, -67.0 52.875, -67.0 25.125, -124.75 25.125))'}
+
+    def _args(self, **kwargs):
+        args = {'geom':[-100.0, -90.0, 30.0, 40.0], 'select_ugid':None, 'time_range':[datetime.datetime(1971,1,1), datetime.datetime(1980,12,31)],
+                'time_region':None, 'calc':None, 'calc_grouping':None, 'aggregate':False, 'output_format':'nc'}
+        args.update(kwargs)
+        return args
+
+    def test_estimate(self):
+        result = estimate(self._args(), [self.container])
+        self.assertEqual(result['cells'], 80*80)
+        self.assertEqual(result['timesteps'], 3653)
+        self.assertEqual(result['bytes_read'], 80*80*3653*4)
+        self.assertEqual(result['output_size'], 80*80*3653*4)
+
+        # monthly means over the summer months, aggregated over the bounding box
+        result = estimate(self._args(time_region={'month':[6,7,8], 'year':None}, calc=[{'func':'mean', 'name':'mean'}],
+                                     calc_grouping=['month', 'year'], aggregate=True), [self.container])
+        self.assertEqual(result['timesteps'], 3653*3/12)
+        self.assertEqual(result['output_size'], 10*3*4)
+
+        # preview of the first time step
+        result = estimate(self._args(snippet=True), [self.container])
+        self.assertEqual((result['timesteps'], result['output_size']), (1, 80*80*4))
+
+    def test_estimate_shapes(self):
+        # selected geometries of a shapefile: read over their bounding boxes, not the whole grid
+        args = self._args(geom='us_counties', select_ugid=[1, 2], aggregate=True)
+        result = estimate(args, [self.container], bounds=[(-100.0, 30.0, -99.0, 31.0), (-90.0, 40.0, -89.5, 40.5)])
+        self.assertEqual(result['cells'], 8*8 + 4*4)
+        self.assertEqual(result['output_size'], 2*3653*4)
+        # unknown bounds: no estimate
+        self.assertTrue(estimate(args, [self.container]) is None)
+        estimator = Estimator(None)
+        estimator.getContainers = lambda uris: [self.container]
+        estimator.getBounds = lambda geom, select_ugid: None
+        self.assertTrue(estimator.estimate(dict(args, uri=['tas.nc'])) is None)
+
+    def test_check_limits(self):
+        estimator = Estimator(None, maxBytesRead=50*1024*1024, maxRuntime=3600)
+        self.assertEqual(estimator.check(None), [])
+        errors = estimator.check( estimate(self._args(), [self.container]) )
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('The request would read 89 MB'))
+
+    def test_reject_job(self):
+        job = create_job(User.objects.create(username='tester'))
+        job.estimator = Estimator(None, maxRuntime=3600)
+        job._estimate = {'cells':1, 'timesteps':1, 'values':1, 'bytes_read':4, 'output_size':60, 'runtime':7200.0}
+        job.submit()
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job.pk).status, JOB_STATUS.REJECTED)
+        self.assertTrue(claim_job('worker-1') is None)
+
+
+class ValidatorTest(TestCase):
+
+    dataset_time_range = [datetime.datetime(1971,1,1), datetime.datetime(2000,12,31)]
+
+    def test_check_time(self):
+        self.assertEqual(check_time([datetime.datetime(1980,1,1), datetime.datetime(1989,12,31)], {'month':[6], 'year':[1985]},
+                                    self.dataset_time_range), [])
+        errors = check_time([datetime.datetime(1950,1,1), datetime.datetime(1960,12,31)], None, self.dataset_time_range)
+        self.assertEqual(errors, [('datetime_start', 'The requested time range 1950-01-01 to 1960-12-31 does not overlap '
+                                                     'the time range of the dataset: 1971-01-01 to 2000-12-31.')])
+        self.assertEqual(check_time(None, {'month':None, 'year':[2010, 2011]}, self.dataset_time_range)[0][0], 'timeregion_year')
+        # summer months outside of a winter time range
+        errors = check_time([datetime.datetime(1980,1,1), datetime.datetime(1980,3,31)], {'month':[6,7,8], 'year':None}, self.dataset_time_range)
+        self.assertEqual(errors[0][0], 'timeregion_month')
+
+    def test_check_space(self):
+        containers = [EstimatorTest.container]
+        self.assertEqual(check_space([-100.0, -90.0, 30.0, 40.0], containers), [])
+        self.assertEqual(check_space([-130.0, -120.0, 20.0, 30.0], containers), [])
+        self.assertEqual(check_space('qed_tbw_basins', containers), [])
+        self.assertEqual(check_space([10.0, 20.0, 40.0, 50.0], containers)[0][0], 'latmin')
+        self.assertEqual(check_space([-100.0, 60.0], containers)[0][0], 'lat')
+
+    def test_reject_job(self):
+        job = create_job(User.objects.create(username='tester'), datetime_start=datetime.datetime(2050,1,1),
+                         datetime_stop=datetime.datetime(2060,12,31))
+        job.submit()
+        job = OpenClimateGisJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, JOB_STATUS.REJECTED)
+        self.assertTrue('does not overlap the time range of the dataset' in job.error)
+
+    def test_validate_view(self):
+        params = {'dataset_category':'Observational Datasets', 'dataset':'Maurer02v2 Datasets', 'variable':'Air Temperature (1971-2000)',
+                  'datetime_start':'1990-01-01 00:00:00', 'datetime_stop':'1999-12-31 00:00:00'}
+        response = simplejson.loads( self.client.get(reverse('validate_request'), params).content )
+        self.assertEqual(response, {'valid':True, 'errors':{}})
+        del params['datetime_start'], params['datetime_stop']
+        params['timeregion_year'] = '2005-2008'
+        response = simplejson.loads( self.client.get(reverse('validate_request'), params).content )
+        self.assertFalse(response['valid'])
+        self.assertEqual(response['errors'].keys(), ['timeregion_year'])
+
+
+class BatchTest(TestCase):
+
+    template = {'dataset_category':'Observational Datasets', 'dataset':'Maurer02v2 Datasets', 'geometry':'QED TBW Basins',
+                'calc':'mean', 'calc_group':'year', 'aggregate':True, 'datetime_start':'1980-01-01 00:00:00',
+                'datetime_stop':'1989-12-31 00:00:00'}
+    datasets = [['Observational Datasets', 'Maurer02v2 Datasets', 'Air Temperature (1971-2000)'],
+                ['Observational Datasets', 'Maurer02v2 Datasets', 'Precipitation (1971-2000)']]
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        self.client.login(username='tester', password='secret')
+        self.dir = tempfile.mkdtemp()
+        self.rootDir = ocgisConfig.get(Config.DEFAULT, 'rootDir')
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', self.dir)
+
+    def tearDown(self):
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', self.rootDir)
+        shutil.rmtree(self.dir)
+
+    def _submit(self, **kwargs):
+        document = {'template':self.template, 'geometry_ids':['1 - WITHE', '2 - WITHE', '3 - WITHE'], 'datasets':self.datasets}
+        document.update(kwargs)
+        return self.client.post(reverse('submit_batch'), simplejson.dumps(document), content_type='application/json')
+
+    def test_submit_batch(self):
+        response = simplejson.loads( self._submit().content )
+        self.assertEqual(response['status'], JOB_STATUS.QUEUED)
+        # the batch is queued as a single job, running one operation per dataset over all the geometries
+        batch = claim_job('worker-1')
+        self.assertEqual((batch.id, batch.class_name()), (response['id'], response['job_class']))
+        self.assertTrue(claim_job('worker-1') is None)
+        jobs = batch.create_member_jobs()
+        self.assertEqual([job.variable for job in jobs], ['Air Temperature (1971-2000)', 'Precipitation (1971-2000)'])
+        args = jobs[0].ocg.encodeArgs(jobs[0])
+        self.assertEqual((args['geom'], len(args['select_ugid']), args['time_range'][0]), ('qed_tbw_basins', 3, datetime.datetime(1980,1,1)))
+
+    def test_invalid_batch(self):
+        self.assertEqual(self._submit(template=dict(self.template, colour='blue')).status_code, 400)
+        self.assertEqual(self._submit(datasets=[['Observational Datasets', 'Maurer02v2 Datasets']]).status_code, 400)
+        # members selecting no data reject the whole batch
+        response = simplejson.loads( self._submit(template=dict(self.template, datetime_start='2050-01-01 00:00:00',
+                                                                 datetime_stop='2060-12-31 00:00:00')).content )
+        self.assertEqual(response['status'], JOB_STATUS.REJECTED)
+
+    def test_execute_batch(self):
+        batch = OpenClimateGisBatchJob.objects.get(pk=simplejson.loads( self._submit().content )['id'])
+        def _run_member(job, args):
+            if job.variable.startswith('Precipitation'):
+                raise Exception('No data')
+            path = os.path.join(self.dir, args['dir_output'], 'ocgis_output.csv')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(','.join(map(str, args['select_ugid'])))
+            job.ocg.reportProgress(1.0, 'Completed')
+            return path.replace(self.dir, job.ocg.rootUrl)
+        batch.run_member = _run_member
+        batch.execute()
+
+        batch = OpenClimateGisBatchJob.objects.get(pk=batch.pk)
+        self.assertEqual((batch.status, batch.progress, batch.phase), (JOB_STATUS.SUCCESS, 1.0, 'Completed 1 of 2 members'))
+        self.assertEqual([member['status'] for member in batch.get_members()], [JOB_STATUS.SUCCESS, JOB_STATUS.FAILED])
+        self.assertEqual(batch.error, 'Precipitation (1971-2000): No data')
+        # combined download of the outputs of all members
+        response = self.client.get(reverse('job_download', args=[batch.id, batch.class_name()]))
+        archive = zipfile.ZipFile( StringIO(response.content) )
+        self.assertEqual(archive.namelist(), ['member1/ocgis_output.csv'])
+
+
+class ApiTest(TestCase):
+
+    fields = {'dataset_category':'Observational Datasets', 'dataset':'Maurer02v2 Datasets', 'variable':'Air Temperature (1971-2000)',
+              'lonmin':-100.0, 'lonmax':-90.0, 'latmin':30.0, 'latmax':40.0,
+              'datetime_start':'1980-01-01 00:00:00', 'datetime_stop':'1989-12-31 00:00:00', 'timeregion_month':['6', '7', '8'],
+              'calc':'mean', 'calc_group':['month', 'year'], 'spatial_operation':'intersects', 'aggregate':True,
+              'output_format':'csv', 'prefix':'tas_summer'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        self.auth = 'Basic %s' % base64.b64encode('tester:secret')
+
+    def _submit(self, fields, **kwargs):
+        kwargs.setdefault('HTTP_AUTHORIZATION', self.auth)
+        return self.client.post(reverse('api_submit_job'), simplejson.dumps(fields), content_type='application/json', **kwargs)
+
+    def test_submit_job(self):
+        response = self._submit(self.fields)
+        self.assertEqual(response.status_code, 201)
+        status = simplejson.loads(response.content)
+        self.assertEqual(status['status'], JOB_STATUS.QUEUED)
+        job = OpenClimateGisJob.objects.get(pk=status['id'])
+        self.assertEqual((job.user, job.timeregion_month, job.calc_group, job.lonmin), (self.user, '6,7,8', 'month,year', -100.0))
+        # the status is read without session
+        response = self.client.get(response['Location'], HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(simplejson.loads(response.content)['id'], job.id)
+
+    def test_download_url(self):
+        job = ClimateIndexJob.objects.create(status='ProcessSucceeded', user=self.user, region='CSC_Boundaries.1', index='tmin-days_below_threshold',
+                                             startDateTime=datetime.date(2010,1,1), dataset='gmo', outputFormat='CSV',
+                                             job_class='ncpp.models.climate_indexes.ClimateIndexJob')
+        status = simplejson.loads( self.client.get(reverse('api_job_status', args=[job.id]), HTTP_AUTHORIZATION=self.auth).content )
+        self.assertEqual(status['download_url'], reverse('job_download', args=[job.id, job.job_class]))
+
+    def test_invalid_job(self):
+        response = self._submit(dict(self.fields, prefix='tas summer', calc_group=[]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(simplejson.loads(response.content)['errors'].keys()), ['calc_group', 'prefix'])
+        self.assertEqual(OpenClimateGisJob.objects.count(), 0)
+
+    def test_authentication(self):
+        self.assertEqual(self._submit(self.fields, HTTP_AUTHORIZATION='').status_code, 401)
+        response = self._submit(self.fields, HTTP_AUTHORIZATION='Basic %s' % base64.b64encode('tester:wrong'))
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Basic realm="NCPP"'))
+        # the session of a logged in user is protected against cross-site requests
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='tester', password='secret')
+        response = client.post(reverse('api_submit_job'), simplejson.dumps(self.fields), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        # only the owner can read the status of a job
+        job = create_job(User.objects.create_user('other', 'other@example.com', 'secret'))
+        response = self.client.get(reverse('api_job_status', args=[job.id]), HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, 403)
+
+
+class JobEventsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        self.client.login(username='tester', password='secret')
+
+    def _events(self, **kwargs):
+        events = []
+        for event in job_events(self.user, poll_interval=0, timeout=0, **kwargs):
+            lines = dict( line.split(': ', 1) for line in event.strip().split('\n') if not line.startswith(':') )
+            if 'data' in lines:
+                events.append( (lines['id'], simplejson.loads(lines['data'])) )
+        return events
+
+    def test_status_events(self):
+        job = create_job(self.user, status=JOB_STATUS.QUEUED)
+        create_job(self.user, status=JOB_STATUS.SUCCESS, variable='Precipitation (1971-2000)')
+        # the first events describe the active jobs
+        events = self._events()
+        self.assertEqual([(data['id'], data['status']) for event_id, data in events], [(job.id, JOB_STATUS.QUEUED)])
+        # a reconnecting client receives the changes after the last event it received
+        time.sleep(0.01)
+        job.report_progress(0.5, 'Computing')
+        events = self._events(since=datetime.datetime.strptime(events[-1][0], '%Y-%m-%dT%H:%M:%S.%f'))
+        self.assertEqual([(data['id'], data['progress'], data['phase']) for event_id, data in events], [(job.id, 0.5, 'Computing')])
+
+    def test_events_view(self):
+        User.objects.create_user('other', 'other@example.com', 'secret')
+        self.assertEqual(self.client.get(reverse('jobs_events', args=['other'])).status_code, 403)
+        response = self.client.get(reverse('jobs_events', args=['tester']))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+
+    def test_jobs_list_events(self):
+        url = reverse('jobs_list', args=['tester', 'ncpp.models.open_climate_gis.OpenClimateGisJob'])
+        job = create_job(self.user, status=JOB_STATUS.SUCCESS)
+        self.assertFalse('EventSource' in self.client.get(url).content)
+        create_job(self.user, status=JOB_STATUS.QUEUED, variable='Precipitation (1971-2000)')
+        self.assertTrue('EventSource' in self.client.get(url).content)
+
+    def test_status_etag(self):
+        job = create_job(self.user, status=JOB_STATUS.QUEUED)
+        url = reverse('job_status', args=[job.id, job.class_name()])
+        response = self.client.get(url)
+        self.assertEqual(response['ETag'], get_etag( get_status(Job.objects.get(pk=job.pk)) ))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        job.report_progress(0.5, 'Computing')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        # only the owner can read the status of a job
+        User.objects.create_user('other', 'other@example.com', 'secret')
+        self.client.login(username='other', password='secret')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class FakeExecution(object):
+    """WPS execution returned by a fake status request."""
+
+    def __init__(self, status, percentCompleted=0, statusMessage=None, url=None):
+        self.status = status
+        self.percentCompleted = percentCompleted
+        self.statusMessage = statusMessage
+        self.response = '<ExecuteResponse/>'
+        self.processOutputs = [type('Output', (), {'reference': url})()]
+        self.errors = []
+
+    def isComplete(self):
+        return self.status in ['ProcessSucceeded', 'ProcessFailed', 'Exception']
+
+    def isSucceded(self):
+        return self.status == 'ProcessSucceeded'
+
+
+class WPSPollerTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        # status returned for each status location, and number of requests sent
+        self.executions = {}
+        self.requests = []
+
+    def _fetch(self, url):
+        self.requests.append(url)
+        return self.executions[url]
+
+    def _create_job(self, url, region='CSC_Boundaries.1', group_size=1):
+        self.executions[url] = FakeExecution('ProcessStarted', 10, 'Running')
+        return ClimateIndexJob.objects.create(status='ProcessAccepted', user=self.user, statusLocation=url, worker='host:1',
+                                              region=region, group_size=group_size, index='tmin-days_below_threshold',
+                                              startDateTime=datetime.date(1970,1,1), dataset='Maurer', outputFormat='CSV')
+
+    def test_next_interval(self):
+        self.assertEqual(get_next_interval(None, False, 4, 60), 4)
+        self.assertEqual(get_next_interval(8, False, 4, 60), 16)
+        self.assertEqual(get_next_interval(40, False, 4, 60), 60)
+        self.assertEqual(get_next_interval(40, True, 4, 60), 4)
+
+    def test_poll(self):
+        job1 = self._create_job('http://wps/status/1')
+        job2 = self._create_job('http://wps/status/2')
+        poller = WPSPoller(threads=2, fetch=self._fetch, min_interval=4, max_interval=60)
+        # all executions are checked at once, and their new status recorded
+        self.assertEqual(poller.poll(now=1000), 2)
+        self.assertEqual(ClimateIndexJob.objects.get(pk=job1.pk).progress, 0.1)
+        # no execution is due before its interval
+        self.assertEqual(poller.poll(now=1001), 0)
+        # an unchanged status is not written again, and the interval grows
+        updated = ClimateIndexJob.objects.get(pk=job1.pk).updateDateTime
+        time.sleep(0.01)
+        self.assertEqual(poller.poll(now=1010), 2)
+        self.assertEqual(ClimateIndexJob.objects.get(pk=job1.pk).updateDateTime, updated)
+        self.assertEqual(poller.schedule[job1.id][1], 8)
+        # a completed execution is recorded, and no longer polled
+        self.executions['http://wps/status/1'] = FakeExecution('ProcessSucceeded', 100, 'Done', url='http://wps/output/1')
+        poller.poll(now=1100)
+        job1 = ClimateIndexJob.objects.get(pk=job1.pk)
+        self.assertEqual((job1.status, job1.progress, job1.url, job1.is_active()), ('ProcessSucceeded', 1.0, 'http://wps/output/1', False))
+        self.assertEqual(poller.poll(now=1200), 1)
+        self.assertEqual(poller.schedule.keys(), [job2.id])
+        # a cancelled job stops being tracked
+        job2.cancel()
+        poller.poll(now=1300)
+        self.assertEqual(ClimateIndexJob.objects.get(pk=job2.pk).status, JOB_STATUS.CANCELLED)
+        self.assertEqual(self.requests.count('http://wps/status/2'), 4)
+        poller.close()
+
+    def test_update_errors(self):
+        job1 = self._create_job('http://wps/status/1')
+        job2 = self._create_job('http://wps/status/2')
+        # malformed status of the first execution
+        self.executions['http://wps/status/1'] = FakeExecution('ProcessStarted', 'n/a', 'Running')
+        poller = WPSPoller(threads=2, fetch=self._fetch, min_interval=4, max_interval=60)
+        # the other jobs are still updated, and the failing job is checked again at a growing interval
+        self.assertEqual(poller.poll(now=1000), 2)
+        self.assertEqual(ClimateIndexJob.objects.get(pk=job2.pk).progress, 0.1)
+        self.assertEqual(poller.poll(now=1010), 2)
+        self.assertEqual(poller.schedule[job1.id][1], 8)
+        # a failing cancellation is retried at the next scheduled check only
+        job1.cancel()
+        poller.get_pending = lambda: [job1]
+        job1.terminate = lambda status, error: 1/0
+        poller.poll(now=1100)
+        self.assertEqual(poller.schedule[job1.id][1], 16)
+        poller.poll(now=1101)
+        self.assertEqual(poller.schedule[job1.id][1], 16)
+        poller.close()
+
+    def test_grouped_jobs(self):
+        dir = tempfile.mkdtemp()
+        rootDir = ocgisConfig.get(Config.DEFAULT, 'rootDir')
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', dir)
+        try:
+            job1 = self._create_job('http://wps/status/1', region='CSC_Boundaries.1', group_size=2)
+            job2 = self._create_job('http://wps/status/1', region='CSC_Boundaries.2', group_size=2)
+            execution = FakeExecution('ProcessSucceeded', 100, 'Done', url='http://wps/output/1')
+            execution.sharedOutput = GDP_CSV
+            self.executions['http://wps/status/1'] = execution
+            poller = WPSPoller(threads=2, fetch=self._fetch)
+            # a single status request for the shared execution
+            self.assertEqual(poller.poll(now=1000), 2)
+            self.assertEqual(self.requests, ['http://wps/status/1'])
+            # each job gets the columns of its region
+            for job, value in [(job1, '12.5'), (job2, '7.25')]:
+                job = ClimateIndexJob.objects.get(pk=job.pk)
+                self.assertEqual(job.status, 'ProcessSucceeded')
+                with open(job.get_download_path()) as f:
+                    self.assertEqual(f.read(), split_csv(GDP_CSV, job.region))
+                self.assertTrue(value in split_csv(GDP_CSV, job.region))
+            poller.close()
+        finally:
+            ocgisConfig.set(Config.DEFAULT, 'rootDir', rootDir)
+            shutil.rmtree(dir)
+
+
+# CSV output of a FeatureWeightedGridStatistics execution over two regions
+GDP_CSV = """# gmo_tmin-days_below_threshold
+TIMESTEP,CSC_Boundaries.1,CSC_Boundaries.2
+,MEAN,MEAN
+1970-01-01T00:00:00Z,12.5,7.25
+1971-01-01T00:00:00Z,13.0,8.0
+"""
+
+class ClimateIndexGroupTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+
+    def _create_job(self, region, **kwargs):
+        fields = dict(status=JOB_STATUS.QUEUED, user=self.user, region=region, index='tmin-days_below_threshold',
+                      startDateTime=datetime.date(1970,1,1), dataset='Maurer', outputFormat='CSV')
+        fields.update(kwargs)
+        return ClimateIndexJob.objects.create(**fields)
+
+    def test_split_csv(self):
+        self.assertEqual(split_csv(GDP_CSV, 'CSC_Boundaries.2'),
+                         '# gmo_tmin-days_below_threshold\nTIMESTEP,CSC_Boundaries.2\n,MEAN\n1970-01-01T00:00:00Z,7.25\n1971-01-01T00:00:00Z,8.0\n')
+
+    def test_claim_group(self):
+        job = self._create_job('CSC_Boundaries.1', status=JOB_STATUS.STARTED, worker='host:1')
+        other = self._create_job('CSC_Boundaries.2')
+        # other index, other output format, cancelled job
+        self._create_job('CSC_Boundaries.3', index='pr-days_above_threshold')
+        self._create_job('CSC_Boundaries.4', outputFormat='NetCDF')
+        self._create_job('CSC_Boundaries.5', status=JOB_STATUS.CANCELLED)
+        jobs = job.claim_group()
+        self.assertEqual([j.id for j in jobs], [job.id, other.id])
+        other = ClimateIndexJob.objects.get(pk=other.pk)
+        self.assertEqual((other.status, other.worker), (JOB_STATUS.STARTED, 'host:1'))
+        # jobs already claimed are not grouped again
+        self.assertEqual(len(self._create_job('CSC_Boundaries.6', status=JOB_STATUS.STARTED).claim_group()), 1)
+
+    def test_feature_collection(self):
+        element = RegionsFeatureCollection([(region, get_region_polygons(region)) for region in ['CSC_Boundaries.1', 'CSC_Boundaries.5']]).getXml()
+        # a single collection of one feature per region
+        gml = '{http://www.opengis.net/gml}'
+        self.assertEqual(len(element.findall('.//%sfeatureMembers' % gml)), 1)
+        features = element.findall('.//%sbox' % gml)
+        self.assertEqual([(feature.get('%sid' % gml), feature.find('%sID' % gml).text) for feature in features],
+                         [('box.1', 'CSC_Boundaries.1'), ('box.2', 'CSC_Boundaries.5')])
+        self.assertEqual(len(features[0].findall('.//%sPolygon' % gml)), len(get_region_polygons('CSC_Boundaries.1')))
+
+
+WPS_CAPABILITIES = """<wps:Capabilities xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1" service="WPS" version="1.0.0">
+<wps:ProcessOfferings><wps:Process><ows:Identifier>algorithm</ows:Identifier><ows:Title>Algorithm</ows:Title></wps:Process></wps:ProcessOfferings>
+</wps:Capabilities>"""
+WPS_DESCRIPTION = """<wps:ProcessDescriptions xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1" service="WPS" version="1.0.0">
+<ProcessDescription statusSupported="true" storeSupported="true"><ows:Identifier>algorithm</ows:Identifier><ows:Title>Algorithm</ows:Title>
+<DataInputs><Input minOccurs="1" maxOccurs="1"><ows:Identifier>DATASET_URI</ows:Identifier><ows:Title>Dataset</ows:Title><LiteralData/></Input></DataInputs>
+</ProcessDescription></wps:ProcessDescriptions>"""
+WPS_RESPONSE = """<wps:ExecuteResponse xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1" statusLocation="%s">
+<wps:Process><ows:Identifier>algorithm</ows:Identifier></wps:Process><wps:Status><wps:%s>%s</wps:%s></wps:Status>
+</wps:ExecuteResponse>"""
+
+class WPSHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stand-in for a remote WPS server on persistent connections, recording the requests and the client ports."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self, data):
+        self.server.requests.append( (self.command, self.path, self.client_address[1]) )
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        status = 'http://%s:%s/status/1' % self.server.server_address
+        if 'GetCapabilities' in self.path:
+            self._respond(WPS_CAPABILITIES)
+        elif 'DescribeProcess' in self.path:
+            self._respond(WPS_DESCRIPTION)
+        else:
+            self._respond(WPS_RESPONSE % (status, 'ProcessSucceeded', 'Done', 'ProcessSucceeded'))
+
+    def do_POST(self):
+        self.rfile.read( int(self.headers.getheader('Content-Length')) )
+        self._respond(WPS_RESPONSE % ('http://%s:%s/status/1' % self.server.server_address, 'ProcessAccepted', 'Accepted', 'ProcessAccepted'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class WPSClientTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WPSHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = 'http://%s:%s/wps/WebProcessingService' % self.server.server_address
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def test_persistent_connection(self):
+        client = WPSClient(self.url, cache=DocumentCache(self.dir, 3600))
+        process = client.describe_process('algorithm')
+        self.assertEqual([input.identifier for input in process.dataInputs], ['DATASET_URI'])
+        execution = client.execute('algorithm', [('DATASET_URI', 'dods://host/data.ncml')], output='OUTPUT')
+        self.assertEqual((execution.status, execution.statusLocation), ('ProcessAccepted', 'http://%s:%s/status/1' % self.server.server_address))
+        self.assertTrue('DATASET_URI' in execution.request)
+        execution = client.check_status(execution.statusLocation)
+        self.assertEqual((execution.status, execution.isComplete()), ('ProcessSucceeded', True))
+        # all the requests are sent on the same connection
+        self.assertEqual([command for command, path, port in self.server.requests], ['GET', 'POST', 'GET'])
+        self.assertEqual(len(set([port for command, path, port in self.server.requests])), 1)
+        self.assertEqual(client.connections, 1)
+        client.close()
+
+    def test_cached_documents(self):
+        client = WPSClient(self.url, cache=DocumentCache(self.dir, 3600))
+        self.assertEqual([process.identifier for process in client.get_service().processes], ['algorithm'])
+        client.describe_process('algorithm')
+        client.close()
+        # the documents are shared with the clients of the other processes, until they expire
+        client = WPSClient(self.url, cache=DocumentCache(self.dir, 3600))
+        client.get_service()
+        client.describe_process('algorithm')
+        self.assertEqual(len(self.server.requests), 2)
+        client = WPSClient(self.url, cache=DocumentCache(self.dir, 0))
+        client.describe_process('algorithm')
+        self.assertEqual(len(self.server.requests), 3)
+        client.close()
+
+
+class RegionsTest(TestCase):
+
+    def test_load_regions(self):
+        regions = load_regions(REGIONS_FILEPATH)
+        self.assertEqual(sorted(regions.keys()), ['CSC_Boundaries.%s' % i for i in range(1, 9)])
+        polygon = get_region_polygons('CSC_Boundaries.1')[0]
+        self.assertEqual((polygon[0], polygon[0]==polygon[-1]), ((-75.7777971929998, 36.22738690500023), True))
+        self.assertRaises(Exception, get_region_polygons, 'CSC_Boundaries.0')
+
+    def test_simplify(self):
+        # the points closer than the tolerance to the simplified boundary are removed
+        ring = [(0, 0), (1, 0.001), (2, 0), (2, 2), (1, 2.5), (0, 2), (0, 0)]
+        self.assertEqual(simplify_ring(ring, 0.01), [(0, 0), (2, 0), (2, 2), (1, 2.5), (0, 2), (0, 0)])
+        self.assertEqual(simplify_ring(ring, 0), ring)
+        # rings are never collapsed
+        self.assertEqual(simplify_ring(ring, 10), ring)
+
+    def test_simplified_regions(self):
+        dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir, 'regions.xml')
+            regions = simplify_regions(load_regions(REGIONS_FILEPATH), 0.05)
+            write_regions(regions, path)
+            self.assertEqual(load_regions(path), regions)
+            # the shipped simplified regions are up to date
+            self.assertEqual(load_regions(SIMPLIFIED_REGIONS_FILEPATH), regions)
+        finally:
+            shutil.rmtree(dir)
+
+
+class ClimatologyTest(TestCase):
+
+    class Store(ClimatologyStore):
+        """Store holding one cube for the monthly climatologies of mean."""
+
+        def getCubes(self, uris, func, grouping):
+            if (func, grouping) != ('mean', 'month'):
+                return [None for uri in uris]
+            return [{'uri':'/data/climatology/tas_mean_month.nc', 'variable':'mean', 'time_units':'days since 1971-01-01',
+                     'time_calendar':'standard', 'time_start':datetime.datetime(1971,1,1),
+                     'time_stop':datetime.datetime(2000,12,31)} for uri in uris]
+
+    def test_calcs_and_groupings(self):
+        calcs = {'mean':{'func':'mean'}, 'std':{'func':'std'}, 'threshold':{'func':'threshold', 'keywords':[{'name':'threshold'}]}}
+        self.assertEqual(get_climatology_calcs(calcs), ['mean'])
+        self.assertEqual(get_climatology_groupings(['year', 'month', 'day', 'hour'], 'day'),
+                         [['day'], ['month'], ['year'], ['day', 'month'], ['day', 'year'], ['month', 'year']])
+        self.assertEqual(get_climatology_groupings(['year', 'month'], 'month'), [['month'], ['year']])
+
+    def test_eligible_requests(self):
+        args = {'calc':[{'func':'max', 'name':'Max', 'kwds':{}}], 'calc_grouping':['year', 'month'], 'calc_raw':False,
+                'aggregate':False, 'time_region':{'month':[6,7,8], 'year':None}}
+        self.assertEqual(get_climatology_calc(args), ('max', 'month,year'))
+        # the maximum of a spatial average is not the spatial average of the maxima
+        self.assertEqual(get_climatology_calc(dict(args, aggregate=True)), None)
+        # a selection of years cannot be applied to groups spanning several years
+        self.assertEqual(get_climatology_calc(dict(args, calc_grouping=['month'], time_region={'month':None, 'year':[1980]})), None)
+
+    def test_encode_args_reads_cube(self):
+        job = create_job(User.objects.create(username='tester'), calc='mean', calc_group='month')
+        job.ocg.climatologies = self.Store(None)
+        args = job.ocg.encodeArgs(job)
+        self.assertEqual((args['uri'], args['variable'], args['climatology']), (['/data/climatology/tas_mean_month.nc'], ['mean'], True))
+        self.assertEqual(args['calc'][0]['func'], 'mean')
+        # a time range within the dataset needs the daily values
+        job.datetime_start, job.datetime_stop = datetime.datetime(1980,1,1), datetime.datetime(1989,12,31)
+        self.assertEqual(job.ocg.encodeArgs(job)['climatology'], False)
+        job.calc = 'max'
+        job.datetime_start = job.datetime_stop = None
+        self.assertEqual(job.ocg.encodeArgs(job)['climatology'], False)
+
+
+class RetentionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='tester')
+        self.dir = tempfile.mkdtemp()
+        self.rootDir = ocgisConfig.get(Config.DEFAULT, 'rootDir')
+        self.rootUrl = ocgisConfig.get(Config.DEFAULT, 'rootUrl')
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', self.dir)
+
+    def tearDown(self):
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', self.rootDir)
+        shutil.rmtree(self.dir)
+
+    def _create_output(self, days, size):
+        job = create_job(self.user, status=JOB_STATUS.SUCCESS, output_size=size,
+                         last_access=datetime.datetime(2013,1,1)+datetime.timedelta(days=days))
+        path = os.path.join(self.dir, get_output_path(job.id), 'ocgis_output.csv')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('x'*size)
+        job.url = path.replace(self.dir, self.rootUrl)
+        job.save()
+        return job
+
+    def test_output_path(self):
+        self.assertEqual(get_output_path(543), '1f/543')
+        self.assertEqual(get_output_path(1), '01/1')
+
+    def test_user_quota(self):
+        jobs = [self._create_output(days, 40) for days in [2, 0, 1]]
+        expired = RetentionManager(userQuota=100).collect()
+        self.assertEqual([job.id for job in expired], [jobs[1].id])
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=jobs[1].pk).status, JOB_STATUS.EXPIRED)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, get_output_path(jobs[1].id))))
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=jobs[2].pk).status, JOB_STATUS.SUCCESS)
+
+    def test_max_age(self):
+        old = self._create_output(0, 10)
+        recent = self._create_output(40, 10)
+        RetentionManager(maxAge=30).collect(now=datetime.datetime(2013,2,15))
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=old.pk).status, JOB_STATUS.EXPIRED)
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=recent.pk).status, JOB_STATUS.SUCCESS)
+
+    def test_cached_output(self):
+        cache = ResultCache(os.path.join(self.dir, 'cache'), 1000)
+        jobs = []
+        for days in [0, 1]:
+            job = self._create_output(days, 40)
+            job.cache_key = encode_key({'job': job.id})
+            job.url = cache.store(job.cache_key, job.get_download_path()).replace(self.dir, self.rootUrl)
+            job.save()
+            jobs.append(job)
+        # the output is still linked from the cache: removing the output directory alone frees nothing
+        self.assertEqual(get_unlinked_size([jobs[0].get_output_dir()]), 0)
+        self.assertEqual(get_unlinked_size([jobs[0].get_output_dir(), cache.getEntryDir(jobs[0].cache_key)]), 40)
+
+        expired = RetentionManager(totalQuota=50, cache=cache).collect()
+        self.assertEqual([job.id for job in expired], [jobs[0].id])
+        self.assertTrue(cache.lookup(jobs[0].cache_key) is None)
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=jobs[1].pk).status, JOB_STATUS.SUCCESS)
+
+    def test_evicted_cached_output(self):
+        cache = ResultCache(os.path.join(self.dir, 'cache'), 1000)
+        job = self._create_output(0, 40)
+        job.cache_key = encode_key({'job': job.id})
+        job.url = cache.store(job.cache_key, job.get_download_path()).replace(self.dir, self.rootUrl)
+        job.save()
+        # evicted from the cache: the links left in the output directory are removed with the expired job
+        cache.remove(job.cache_key)
+        expired = RetentionManager(cache=cache).collect()
+        self.assertEqual([job.id for job in expired], [job.id])
+        self.assertFalse(os.path.exists(job.get_output_dir()))
+
+    def test_batch_and_climate_index_outputs(self):
+        last_access = datetime.datetime(2013,1,1)
+        batch = OpenClimateGisBatchJob.objects.create(status=JOB_STATUS.SUCCESS, user=self.user, template='{}', output_size=40, last_access=last_access)
+        index = ClimateIndexJob.objects.create(status='ProcessSucceeded', user=self.user, region='CSC_Boundaries.1', index='tmin-days_below_threshold',
+                                               startDateTime=datetime.date(2010,1,1), dataset='gmo', outputFormat='CSV', group_size=2,
+                                               output_size=40, last_access=last_access+datetime.timedelta(days=1))
+        for job, name in [(batch, 'member1/ocgis_output.csv'), (index, 'index.csv')]:
+            path = os.path.join(self.dir, get_output_path(job.id), name)
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('x'*40)
+            job.url = os.path.dirname(path).replace(self.dir, self.rootUrl) if job == batch else path.replace(self.dir, self.rootUrl)
+            job.save()
+        recent = self._create_output(2, 40)
+
+        expired = RetentionManager(totalQuota=50).collect()
+        self.assertEqual([job.id for job in expired], [batch.id, index.id])
+        self.assertEqual(ClimateIndexJob.objects.get(pk=index.pk).status, JOB_STATUS.EXPIRED)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, get_output_path(batch.id))))
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=recent.pk).status, JOB_STATUS.SUCCESS)
+
+    def test_rerun_expired_job(self):
+        job = self._create_output(0, 10)
+        RetentionManager(totalQuota=0).collect()
+        job = OpenClimateGisJob.objects.get(pk=job.pk)
+        job.rerun()
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job.pk).status, JOB_STATUS.QUEUED)
+
+
+class DownloadTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        self.dir = tempfile.mkdtemp()
+        self.rootDir = ocgisConfig.get(Config.DEFAULT, 'rootDir')
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', self.dir)
+        self.job = create_job(self.user, status=JOB_STATUS.SUCCESS)
+        path = os.path.join(self.dir, get_output_path(self.job.id), 'ocgis_output.csv')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('0123456789')
+        self.job.url = path.replace(self.dir, ocgisConfig.get(Config.DEFAULT, 'rootUrl'))
+        self.job.save()
+        self.download_url = reverse('job_download', args=[self.job.id, self.job.class_name()])
+        self.client.login(username='tester', password='secret')
+
+    def tearDown(self):
+        ocgisConfig.set(Config.DEFAULT, 'rootDir', self.rootDir)
+        shutil.rmtree(self.dir)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=2-5', 10), (2, 5))
+        self.assertEqual(parse_range('bytes=2-', 10), (2, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEqual(parse_range('bytes=10-', 10), False)
+        self.assertEqual(parse_range('bytes=0-1,4-5', 10), None)
+        self.assertEqual(parse_range(None, 10), None)
+
+    def test_download(self):
+        response = self.client.get(self.download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        job = OpenClimateGisJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.download_count, job.bytes_downloaded), (1, 10))
+
+    def test_download_range(self):
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=4-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, '456789')
+        self.assertEqual(response['Content-Range'], 'bytes 4-9/10')
+        # the file changed since the first part was downloaded
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=4-', HTTP_IF_RANGE='"0-0"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_download_forbidden(self):
+        User.objects.create_user('other', 'other@example.com', 'secret')
+        self.client.login(username='other', password='secret')
+        self.assertEqual(self.client.get(self.download_url).status_code, 403)
+
+    def test_download_climate_index_output(self):
+        job = ClimateIndexJob.objects.create(status='ProcessSucceeded', user=self.user, region='CSC_Boundaries.1', index='tmin-days_below_threshold',
+                                             startDateTime=datetime.date(2010,1,1), dataset='gmo', outputFormat='CSV', group_size=2)
+        path = os.path.join(job.get_output_dir(), 'index.csv')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('0123456789')
+        job.url = path.replace(self.dir, ocgisConfig.get(Config.DEFAULT, 'rootUrl'))
+        job.save()
+        response = self.client.get(reverse('job_download', args=[job.id, job.class_name()]))
+        self.assertEqual((response.status_code, ''.join(response)), (200, '0123456789'))
+
+    def test_download_directory_as_zip(self):
+        output_dir = os.path.join(self.dir, get_output_path(self.job.id))
+        with open(os.path.join(output_dir, 'ocgis_output.nc'), 'wb') as f:
+            f.write('\x00\x01'*1000)
+        self.job.url = output_dir.replace(self.dir, ocgisConfig.get(Config.DEFAULT, 'rootUrl'))
+        self.job.save()
+        response = self.client.get(self.download_url)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile( StringIO(response.content) )
+        self.assertEqual(archive.namelist(), ['ocgis_output.csv', 'ocgis_output.nc'])
+        self.assertEqual(archive.read('ocgis_output.csv'), '0123456789')
+        # NetCDF files are stored without compression
+        self.assertEqual(archive.getinfo('ocgis_output.nc').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.getinfo('ocgis_output.csv').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.testzip(), None)
+        job = OpenClimateGisJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.bytes_downloaded, 2010)
+
+    def test_zip64_archive(self):
+        path = os.path.join(self.dir, get_output_path(self.job.id), 'ocgis_output.csv')
+        # force the zip64 extensions on every entry and offset
+        data = ''.join( ZipStream([(path, 'a.csv'), (path, 'b.csv')], zip64_limit=0) )
+        archive = zipfile.ZipFile( StringIO(data) )
+        self.assertEqual([archive.read(name) for name in archive.namelist()], ['0123456789', '0123456789'])
+        self.assertEqual(archive.testzip(), None)
+
+
+class JobProgressTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+
+    def test_report_progress(self):
+        job = create_job(self.user)
+        job.submit()
+        claim_job('worker-1')
+        job.report_progress(0.5, 'Computed tas, tile 2 of 4', 1024)
+        job = OpenClimateGisJob.objects.get(pk=job.pk)
+        # the progress update does not overwrite the status set by the worker
+        self.assertEqual(job.status, JOB_STATUS.STARTED)
+        self.assertEqual(job.progress, 0.5)
+        self.assertEqual(job.phase, 'Computed tas, tile 2 of 4')
+        self.assertEqual(job.bytes_read, 1024)
+
+    def test_job_status_view(self):
+        job = create_job(self.user)
+        job.submit()
+        job.report_progress(0.25, 'Computing', 2048)
+        self.client.login(username='tester', password='secret')
+        response = self.client.get(reverse('job_status', args=[job.id, job.class_name()]))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = simplejson.loads(response.content)
+        self.assertEqual(data['status'], JOB_STATUS.QUEUED)
+        self.assertEqual(data['progress'], 0.25)
+        self.assertEqual(data['phase'], 'Computing')
+        self.assertEqual(data['bytes_read'], 2048)
+
+
+class JobCancelTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'secret')
+        self.client.login(username='tester', password='secret')
+
+    def test_cancel_queued_job(self):
+        job = create_job(self.user)
+        job.submit()
+        self.client.get(reverse('job_cancel', args=[job.id, job.class_name()]))
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job.pk).status, JOB_STATUS.CANCELLED)
+        self.assertTrue(claim_job('worker-1') is None)
+
+    def test_cancel_running_job(self):
+        job = create_job(self.user)
+        job.submit()
+        claim_job('worker-1')
+        self.client.get(reverse('job_cancel', args=[job.id, job.class_name()]))
+        job = OpenClimateGisJob.objects.get(pk=job.pk)
+        # the worker stops the job
+        self.assertEqual(job.status, JOB_STATUS.STARTED)
+        self.assertTrue(job.cancel_requested)
+
+    def test_cancel_leader_resubmits_followers(self):
+        job1 = create_job(self.user)
+        job2 = create_job(self.user)
+        job1.submit()
+        job2.submit()
+        job1.cancel()
+        job2 = OpenClimateGisJob.objects.get(pk=job2.pk)
+        self.assertEqual(job2.status, JOB_STATUS.QUEUED)
+        self.assertTrue(job2.leader is None)
+
+    def test_wallclock_limit(self):
+        job = create_job(self.user)
+        job.submit()
+        job = claim_job('worker-1')
+        job.execute = lambda: time.sleep(30)
+        started = time.time()
+        run_job(job, wallclock_limit=1, check_interval=0.1)
+        self.assertTrue(time.time()-started < 10)
+        self.assertEqual(OpenClimateGisJob.objects.get(pk=job.pk).status, JOB_STATUS.TIMEOUT)
+
+
+class ResultCacheTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.dir, 'cache'), 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, size):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write('x'*size)
+        return path
+
+    def test_encode_key(self):
+        args = {'uri':[u'/data/tas.nc'], 'select_ugid':[5, 3], 'calc_grouping':['month', 'year'], 'dir_output':'1',
+                'time_range':[datetime.datetime(1971,1,1), datetime.datetime(1980,12,31)], 'time_region':None}
+        same = dict(args, select_ugid=[3, 5], calc_grouping=['year', 'month'], dir_output='2')
+        other = dict(args, select_ugid=[3])
+        self.assertEqual(encode_key(args), encode_key(same))
+        self.assertNotEqual(encode_key(args), encode_key(other))
+
+    def test_store_and_lookup(self):
+        self.assertTrue(self.cache.lookup('abcd') is None)
+        path = self.cache.store('abcd', self._write('output.csv', 10))
+        self.assertEqual(self.cache.lookup('abcd'), path)
+        self.assertEqual(os.path.basename(path), 'output.csv')
+
+    def test_lru_eviction(self):
+        self.cache.store('aaaa', self._write('a.csv', 40))
+        self.cache.store('bbbb', self._write('b.csv', 40))
+        # make 'aaaa' the most recently used entry
+        os.utime(os.path.join(self.cache.cacheDir, 'bb', 'bbbb'), (0, 0))
+        self.cache.lookup('aaaa')
+        self.cache.store('cccc', self._write('c.csv', 40))
+        self.assertTrue(self.cache.lookup('bbbb') is None)
+        self.assertTrue(self.cache.lookup('aaaa') is not None)
+        self.assertTrue(self.cache.lookup('cccc') is not None)
+
+
+class WeightsStoreTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = WeightsStore(self.dir)
+        self.grid = get_grid((-124.75, 25.125, -67.0, 52.875), 0.125, 222, 462)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_grid_fingerprint(self):
+        self.assertEqual(grid_fingerprint(self.grid), grid_fingerprint( get_grid((-124.75, 25.125, -67, 52.875), '0.125', 222, 462) ))
+        self.assertNotEqual(grid_fingerprint(self.grid), grid_fingerprint( get_grid((-124.75, 25.125, -67.0, 52.875), 0.25, 111, 231) ))
+
+    def test_grid_from_centers(self):
+        # extent of the cell centers, for a dataset without bounds variables
+        grid = get_grid((-124.6875, 25.1875, -67.0625, 52.8125), 0.125, 222, 462)
+        self.assertEqual(grid, self.grid)
+        self.assertEqual(get_cell_centers(grid, {'rows':[0, 221], 'cols':[0, 461]}), [(-124.6875, 25.1875), (-67.0625, 52.8125)])
+
+    def test_weights_computed_once(self):
+        calls = []
+        def _compute():
+            calls.append(1)
+            return {'rows':[0, 0], 'cols':[0, 1]}
+        for i in range(2):
+            weights = self.store.getWeights('us_counties', 3, self.grid, _compute)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(weights['cols'], [0, 1])
+        self.assertEqual(get_cell_centers(self.grid, weights), [(-124.6875, 25.1875), (-124.5625, 25.1875)])
+        # other geometries and grids are stored separately
+        self.assertEqual(self.store.lookup('us_counties', 4, grid_fingerprint(self.grid)), None)
+
+
+class RemoteDatasetHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stand-in for a remote OPeNDAP/HTTP server, serving the request path as data and counting the requests."""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/missing'):
+            self.send_error(404)
+            return
+        data = self.path
+        status = 200
+        if self.headers.getheader('Range') is not None:
+            data = 'range %s' % self.headers.getheader('Range')
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Description', 'dods_data')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ChunkCacheTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RemoteDatasetHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever).start()
+        self.cache = ChunkCache(self.dir, 1024*1024)
+        self.proxy = ChunkCacheProxy(self.cache)
+        self.proxy.start()
+        self.uri = 'dods://127.0.0.1:%s/thredds/dodsC/tas.nc' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def test_parse_request(self):
+        self.assertEqual(parse_request('http://host/tas.nc.dods?tas[0:1:9][10:1:20],time[0:1:9]'),
+                         ('http://host/tas.nc.dods', 'tas,time', '[0:1:9][10:1:20],[0:1:9]', ''))
+        self.assertEqual(parse_request('http://host/tas.nc.dds'), ('http://host/tas.nc.dds', '', '', ''))
+        # the selection clauses are part of the request
+        self.assertEqual(parse_request('http://host/stations.dods?tas&time%3E=10&station=%22A%22'),
+                         ('http://host/stations.dods', 'tas', '', 'station="A"&time>=10'))
+        self.assertEqual(parse_request('http://host/stations.dods?tas&station=%22A%22&time%3E=10'),
+                         parse_request('http://host/stations.dods?tas&time%3E=10&station=%22A%22'))
+
+    def test_repeated_reads_are_local(self):
+        url = self.proxy.getUrl(self.uri) + '.dods?tas[0:1:9][10:1:20]'
+        for i in range(2):
+            response = urllib2.urlopen(url)
+            self.assertEqual(response.read(), '/thredds/dodsC/tas.nc.dods?tas[0:1:9][10:1:20]')
+            self.assertEqual(response.info().getheader('Content-Description'), 'dods_data')
+        urllib2.urlopen( self.proxy.getUrl(self.uri) + '.dods?tas[10:1:19][10:1:20]' ).read()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.assertEqual(self.proxy.getUrl('/data/tas.nc'), '/data/tas.nc')
+
+    def test_byte_ranges(self):
+        url = self.proxy.getUrl(self.uri.replace('dods://', 'http://'))
+        for byteRange in ['bytes=0-99', 'bytes=100-199', 'bytes=0-99']:
+            response = urllib2.urlopen( urllib2.Request(url, headers={'Range':byteRange}) )
+            self.assertEqual((response.getcode(), response.read()), (206, 'range %s' % byteRange))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_errors_are_not_cached(self):
+        url = self.proxy.getUrl(self.uri.replace('/thredds', '/missing'))
+        for i in range(2):
+            self.assertRaises(urllib2.HTTPError, urllib2.urlopen, url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_lru_eviction(self):
+        for i in range(4):
+            self.cache.store(self.cache.getKey('uri', 'tas', '[%s]' % i), {'status':200}, 'x'*60)
+            # distinct access times
+            os.utime(self.cache._getPath( self.cache.getKey('uri', 'tas', '[%s]' % i) ), (i, i))
+        self.cache.lookup( self.cache.getKey('uri', 'tas', '[0]') )
+        # each entry takes 77 bytes
+        self.cache.maxSize = 200
+        self.cache.evict()
+        remaining = [i for i in range(4) if self.cache.lookup( self.cache.getKey('uri', 'tas', '[%s]' % i) ) is not None]
+        self.assertEqual(remaining, [0, 3])
+
+    def test_size_counted_on_store(self):
+        self.cache.maxSize = 200
+        scans = []
+        getEntries = self.cache.getEntries
+        self.cache.getEntries = lambda: scans.append(1) or getEntries()
+        # the directory is scanned on the first store, then when the size exceeds the maximum
+        for i in range(3):
+            self.cache.store(self.cache.getKey('uri', 'tas', '[%s]' % i), {'status':200}, 'x'*60)
+        self.assertEqual(len(scans), 2)
+        self.assertEqual(self.cache.size, sum([entry[1] for entry in getEntries()]))
+        self.assertTrue(self.cache.size <= 200)
+
+
+class MergeOutputsTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_merge_package_members(self):
+        dirs = []
+        paths = []
+        for i, variable in enumerate(['tas', 'pr']):
+            dir_output = os.path.join(self.dir, 'member%s' % i, 'ocgis_output')
+            os.makedirs(dir_output)
+            paths.append(os.path.join(dir_output, 'ocgis_output.csv'))
+            with open(paths[-1], 'w') as f:
+                f.write('DID,UGID,GID,VARIABLE,VALUE\r\n1,1,10,%s,%s\r\n' % (variable, i))
+            with open(os.path.join(dir_output, 'ocgis_output_metadata.txt'), 'w') as f:
+                f.write(variable)
+            dirs.append(os.path.join(self.dir, 'member%s' % i))
+
+        path = merge_outputs(dirs, paths, self.dir, dids=['1', '2'])
+        self.assertEqual(path, os.path.join(self.dir, 'ocgis_output', 'ocgis_output.csv'))
+        with open(path) as f:
+            self.assertEqual(f.read(), 'DID,UGID,GID,VARIABLE,VALUE\r\n1,1,10,tas,0\r\n2,1,10,pr,1\r\n')
+        with open(os.path.join(self.dir, 'ocgis_output', 'ocgis_output_metadata.txt')) as f:
+            self.assertEqual(f.read(), 'tas')
+
+    def test_merge_tiles(self):
+        dirs = []
+        paths = []
+        # cell 11 lies on the boundary between the two tiles
+        for i, rows in enumerate([['10', '11'], ['11', '12']]):
+            dirs.append(os.path.join(self.dir, 'part0_%s' % i))
+            os.makedirs(dirs[-1])
+            paths.append(os.path.join(dirs[-1], 'ocgis_output.csv'))
+            with open(paths[-1], 'w') as f:
+                f.write('DID,UGID,GID,TIME,VALUE\r\n')
+                for time in ['1971-01-01', '1971-01-02']:
+                    for gid in rows:
+                        f.write('1,1,%s,%s,%s\r\n' % (gid, time, i))
+
+        path = merge_outputs(dirs, paths, os.path.join(self.dir, 'member0'), mode=MERGE_TILES)
+        with open(path) as f:
+            rows = f.read().split('\r\n')[1:-1]
+        self.assertEqual(rows, ['1,1,10,1971-01-01,0', '1,1,11,1971-01-01,0', '1,1,10,1971-01-02,0', '1,1,11,1971-01-02,0',
+                                '1,1,12,1971-01-01,1', '1,1,12,1971-01-02,1'])
+
+    def test_split_bbox(self):
+        tiles = split_bbox([-125.0, -67.0, 25.0, 53.0], 0.125, 4)
+        self.assertTrue(len(tiles) >= 4)
+        self.assertEqual(min([t[0] for t in tiles]), -125.0)
+        self.assertEqual(max([t[1] for t in tiles]), -67.0)
+        self.assertEqual(min([t[2] for t in tiles]), 25.0)
+        self.assertEqual(max([t[3] for t in tiles]), 53.0)
+        # inner edges fall on multiples of the grid resolution
+        for tile in tiles:
+            self.assertEqual(((tile[1]-tile[0])/0.125) % 1, 0)
+
+    def test_split_time_range(self):
+        chunks = split_time_range(datetime.datetime(1971,6,1), datetime.datetime(1980,12,31,12), 4)
+        self.assertEqual([(c[0].year, c[1].year) for c in chunks], [(1971, 1974), (1975, 1978), (1979, 1980)])
+        self.assertEqual(chunks[0][0], datetime.datetime(1971,6,1))
+        self.assertEqual(chunks[1][0], datetime.datetime(1975,1,1))
+        self.assertEqual(chunks[1][1], datetime.datetime(1978,12,31,23,59,59,999999))
+        self.assertEqual(chunks[2][1], datetime.datetime(1980,12,31,12))
+        self.assertTrue(overlaps_time_region(chunks[0], {'month':[1], 'year':None}))
+        self.assertFalse(overlaps_time_region(chunks[0], {'month':None, 'year':[1980]}))
+        self.assertFalse(overlaps_time_region([datetime.datetime(1971,6,1), datetime.datetime(1971,12,31)], {'month':[1,2], 'year':None}))
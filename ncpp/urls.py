@@ -19,13 +19,25 @@ urlpatterns = patterns('',
     # open climate GIS use case
     url(r'^open_climate_gis/$', OpenClimateGisWizard.as_view([OpenClimateGisForm1, OpenClimateGisForm2, OpenClimateGisForm3]), name='open_climate_gis' ),
     url(r'^open_climate_gis/geometries/$', 'ncpp.views.open_climate_gis.get_geometries', name='get_geometries'),
+    url(r'^open_climate_gis/validate/$', 'ncpp.views.open_climate_gis.validate_request', name='validate_request'),
+    url(r'^open_climate_gis/batch/$', 'ncpp.views.open_climate_gis.submit_batch', name='submit_batch'),
+    
+    # JSON API for scripted clients
+    url(r'^api/jobs/$', 'ncpp.views.api.api_submit_job', name='api_submit_job'),
+    url(r'^api/jobs/(?P<job_id>\d+)/$', 'ncpp.views.api.api_job_status', name='api_job_status'),
     
     # job display pages
+    url(r'^jobs/(?P<username>[^/]+)/events/$', 'ncpp.views.jobs_events', name='jobs_events' ),
     url(r'^jobs/(?P<username>.+)/(?P<job_class>.+)/$', 'ncpp.views.jobs_list', name='jobs_list' ),
     
     url(r'^job/request/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_request', name='job_request' ),
     url(r'^job/response/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_response', name='job_response' ),
+    url(r'^job/status/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_status', name='job_status' ),
     url(r'^job/check/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_check', name='job_check' ),
+    url(r'^job/download/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_download', name='job_download' ),
+    url(r'^job/rerun/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_rerun', name='job_rerun' ),
+    url(r'^job/commit/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_commit', name='job_commit' ),
+    url(r'^job/cancel/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_cancel', name='job_cancel' ),
     url(r'^job/(?P<job_id>.+)/(?P<job_class>.+)/$', 'ncpp.views.job_detail', name='job_detail' ),
     
     # login/logout using django default authentication views and templates
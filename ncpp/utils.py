@@ -41,4 +41,16 @@ def formatListForDisplay(values):
         if i>0:
             s += ", "
         s += str(value)
-    return s
\ No newline at end of file
+    return s
+
+def get_output_path(job_id):
+    """Returns the path of the output directory of a job, relative to the root output directory.
+       Jobs are spread over 256 sub-directories, so that the root directory does not hold one entry per job.
+       Example: '1f/543' = get_output_path(543)."""
+    
+    return "%02x/%s" % (int(job_id) % 256, job_id)
+
+def megabytes(value):
+    """Converts an optional number of megabytes read from the configuration into a number of bytes."""
+    
+    return int(value)*1024*1024 if value is not None else None
@@ -0,0 +1,115 @@
+# module containing the dry-run validation of Open Climate GIS requests against the metadata of the datasets
+# (the dataset configuration and the catalog built by util.data_scanner), without opening any data file
+from datetime import datetime
+from ncpp.estimator import Estimator, parse_envelope
+
+# format of the time ranges in the dataset configuration
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def parse_time_range(time_range):
+    """Returns the [start, stop] datetimes of a time range of the dataset configuration."""
+
+    return [datetime.strptime(str(value), TIME_FORMAT) for value in time_range]
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d')
+
+def check_time(time_range, time_region, dataset_time_range):
+    """Returns the list of (field, message) errors if the requested time range and time region
+       do not select any time step within the time range of the dataset."""
+
+    errors = []
+    start, stop = dataset_time_range
+    if time_range is not None:
+        if time_range[1] < start or time_range[0] > stop:
+            errors.append( ('datetime_start', 'The requested time range %s to %s does not overlap the time range of the dataset: %s to %s.'
+                            % (_format_date(time_range[0]), _format_date(time_range[1]), _format_date(start), _format_date(stop))) )
+            return errors
+        start, stop = max(start, time_range[0]), min(stop, time_range[1])
+
+    time_region = time_region or {}
+    years = time_region.get('year')
+    months = time_region.get('month')
+    if years is not None and len(years) > 0:
+        if len([year for year in years if start.year <= year <= stop.year]) == 0:
+            errors.append( ('timeregion_year', 'None of the requested years is within %s to %s.' % (_format_date(start), _format_date(stop))) )
+            return errors
+    if months is not None and len(months) > 0:
+        # months between start and stop, restricted to the requested years
+        found = False
+        for year in range(start.year, stop.year+1):
+            if years is not None and len(years) > 0 and year not in years:
+                continue
+            for month in months:
+                if (start.year, start.month) <= (year, month) <= (stop.year, stop.month):
+                    found = True
+        if not found:
+            errors.append( ('timeregion_month', 'None of the requested months is within %s to %s.' % (_format_date(start), _format_date(stop))) )
+    return errors
+
+def check_space(geom, containers):
+    """Returns the list of (field, message) errors if the requested bounding box [lonmin, lonmax, latmin, latmax]
+       or point [lon, lat] does not intersect the spatial envelope of the datasets (dictionaries of catalog metadata).
+       Shape geometries are not checked: their bounds are only known after reading the shapefile."""
+
+    errors = []
+    if not isinstance(geom, list):
+        return errors
+    for container in containers:
+        xmin, xmax, ymin, ymax = parse_envelope(container['spatial_envelope'])
+        if len(geom) == 2:
+            lonmin = lonmax = float(geom[0])
+            latmin = latmax = float(geom[1])
+            field, kind = 'lat', 'point'
+        else:
+            lonmin, lonmax, latmin, latmax = [float(value) for value in geom]
+            field, kind = 'latmin', 'bounding box'
+        # grids using longitudes in [0, 360]
+        if xmax > 180 and lonmin < 0:
+            lonmin, lonmax = lonmin+360, lonmax+360
+        if lonmax < xmin or lonmin > xmax or latmax < ymin or latmin > ymax:
+            errors.append( (field, 'The requested %s is outside the spatial extent of the dataset: longitude %s to %s, latitude %s to %s.'
+                            % (kind, xmin, xmax, ymin, ymax)) )
+            break
+    return errors
+
+
+class Validator(object):
+    """Resolves requests against the dataset configuration and the dataset catalog, so that requests
+       selecting no data are rejected before taking a worker slot."""
+
+    def __init__(self, datasets, catalogPath):
+        # configuration of the datasets (ncpp.config.ocgisDatasets)
+        self.datasets = datasets
+        # catalog of the datasets, or None if not available
+        self.estimator = Estimator(catalogPath)
+
+    def getDataset(self, category, dataset, variable):
+        """Returns the configuration of the requested dataset (or package), or None if not found."""
+
+        try:
+            jsonObject = self.datasets.datasets[category][dataset]
+            if jsonObject['type'] == 'datasets':
+                return jsonObject[variable]
+            return jsonObject
+        except (KeyError, TypeError):
+            return None
+
+    def validate(self, category, dataset, variable, geom, time_range, time_region):
+        """Returns the list of (field, message) errors of a request: field is the name of the offending job attribute.
+           The spatial selection is only checked if the datasets are catalogued."""
+
+        jsonData = self.getDataset(category, dataset, variable)
+        if jsonData is None:
+            return [ ('dataset', 'Unknown dataset: %s' % dataset) ]
+
+        errors = []
+        if jsonData.get('time_range'):
+            errors += check_time(time_range, time_region, parse_time_range(jsonData['time_range']))
+        if isinstance(geom, list):
+            # each dataset URI is a list of files: look up the first one
+            uris = [uri[0] if isinstance(uri, list) else uri for uri in jsonData['uri']]
+            containers = self.estimator.getContainers(uris)
+            if containers is not None:
+                errors += check_space(geom, containers)
+        return errors
@@ -1,3 +1,4 @@
 from common import *
 from climate_indexes import *
-from open_climate_gis import *
\ No newline at end of file
+from open_climate_gis import *
+from api import *
\ No newline at end of file
@@ -0,0 +1,80 @@
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+
+from ncpp.auth import api_login_required
+from ncpp.models.common import Job
+from ncpp.forms.open_climate_gis import OpenClimateGisForm1, OpenClimateGisForm2
+from ncpp.views.open_climate_gis import create_job
+from ncpp.constants import JOB_SUCCESS_STATUSES
+from ncpp.events import get_status, get_etag, STATUS_FIELDS
+
+def _json_response(data, status=200):
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json', status=status)
+
+def _get_status(job):
+    """Returns the JSON status document of a job."""
+
+    return dict( get_status(job),
+                 job_class=job.job_class,
+                 status_url=reverse('api_job_status', args=[job.id]),
+                 download_url=reverse('job_download', args=[job.id, job.job_class]) if job.status in JOB_SUCCESS_STATUSES else None )
+
+@api_login_required
+def api_submit_job(request):
+    '''Submits an Open Climate GIS job from the job fields given directly as a JSON object in the request body
+       (or as form-encoded parameters), without going through the steps of the wizard.
+       The fields are validated by the forms of the wizard; list fields (geometry_id, timeregion_month, calc_group) are JSON lists.
+       Returns the status of the new job, or the errors of each invalid field.'''
+
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if request.META.get('CONTENT_TYPE', '').startswith('application/json'):
+        try:
+            data = simplejson.loads(request.body)
+        except ValueError:
+            return _json_response({'errors': {'__all__': ['Invalid JSON document']}}, status=400)
+        if not isinstance(data, dict):
+            return _json_response({'errors': {'__all__': ['The JSON document must be an object of job fields']}}, status=400)
+    else:
+        data = request.POST
+
+    forms = [OpenClimateGisForm1(data), OpenClimateGisForm2(data)]
+    errors = {}
+    for form in forms:
+        if not form.is_valid():
+            errors.update( dict( (field, list(messages)) for field, messages in form.errors.items() ) )
+    if len(errors) > 0:
+        return _json_response({'errors': errors}, status=400)
+
+    form_data = {}
+    for form in forms:
+        form_data.update( form.cleaned_data )
+    job = create_job(form_data, request.user)
+    job.save()
+    # the job is rejected if it selects no data, or if its estimated cost exceeds the limits
+    job.submit()
+
+    response = _json_response(_get_status(job), status=201)
+    response['Location'] = request.build_absolute_uri( reverse('api_job_status', args=[job.id]) )
+    return response
+
+@api_login_required
+def api_job_status(request, job_id):
+    '''Returns the status of a job of any type as JSON, with an ETag validated by 'If-None-Match'.'''
+
+    try:
+        job = Job.objects.only(*(STATUS_FIELDS + ['user'])).get(pk=job_id)
+    except Job.DoesNotExist:
+        return _json_response({'error': 'Job not found'}, status=404)
+    if job.user_id != request.user.id and not request.user.is_staff:
+        return _json_response({'error': 'Only the owner of the job can access its status'}, status=403)
+    data = _get_status(job)
+    etag = get_etag(data)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = _json_response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
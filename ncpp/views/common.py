@@ -2,12 +2,19 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, render_to_response
 from django.conf import settings
 from django.template import RequestContext
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden, HttpResponseNotModified, Http404
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
+from django.utils import simplejson
+import os
 
 from ncpp.utils import get_class
 from ncpp.models.common import Job
+from ncpp.scheduler import get_queue_positions
+from ncpp.download import serve_file
+from ncpp.events import job_events, get_status, get_etag, parse_event_id, STATUS_FIELDS
+from ncpp.constants import JOB_SUCCESS_STATUSES
+from ncpp.config import ocgisConfig, Config
 
 # FIXME
 from owslib.wps import WPSExecution
@@ -25,9 +32,11 @@ def job_detail(request, job_id, job_class):
     
     # retrieve job-specific submission data
     job_data = job.getFormData()
+    # summary of the output of a preview
+    summary = job.get_summary() if job.is_preview() else None
 
     return render_to_response('ncpp/common/job_detail.html',
-                              {'job':job, 'job_data':job_data },
+                              {'job':job, 'job_data':job_data, 'summary':summary },
                               context_instance=RequestContext(request))
  
 @login_required(login_url=LOGIN_URL)   
@@ -59,8 +68,15 @@ def jobs_list(request, username, job_class):
     kls = get_class(job_class)
     jobs = kls.objects.filter(user=user).order_by('-submissionDateTime')
     
+    # position of the queued jobs in the scheduler queue
+    positions = get_queue_positions()
+    for job in jobs:
+        job.queue_position = positions.get(job.id)
+    # the status events are only followed while a listed job has not finished
+    active = len([job for job in jobs if job.is_active()]) > 0
+    
     return render_to_response('ncpp/common/jobs_list.html',
-                              {'jobs':jobs },
+                              {'jobs':jobs, 'active':active },
                               context_instance=RequestContext(request))
     
 @login_required(login_url=LOGIN_URL)
@@ -75,4 +91,109 @@ def job_check(request, job_id, job_class):
     
     # redirect to job listing
     return HttpResponseRedirect(reverse('jobs_list', args=[request.user.username, job_class]))
-        
+
+@login_required(login_url=LOGIN_URL)
+def job_cancel(request, job_id, job_class):
+    '''View to cancel a queued or running job.'''
+    
+    # retrieve job of specified type
+    job = get_object_or_404(get_class(job_class), pk=job_id)
+    if job.user != request.user and not request.user.is_staff:
+        return HttpResponseForbidden('Only the owner of the job can cancel it')
+    
+    # cancel the job, or request its worker to stop it
+    job.cancel()
+    
+    # redirect to job listing
+    return HttpResponseRedirect(reverse('jobs_list', args=[request.user.username, job_class]))
+
+@login_required(login_url=LOGIN_URL)
+def job_rerun(request, job_id, job_class):
+    '''View to submit again a job whose output has expired.'''
+    
+    # retrieve job of specified type
+    job = get_object_or_404(get_class(job_class), pk=job_id)
+    if job.user != request.user and not request.user.is_staff:
+        return HttpResponseForbidden('Only the owner of the job can re-run it')
+    
+    job.rerun()
+    
+    # redirect to job listing
+    return HttpResponseRedirect(reverse('jobs_list', args=[request.user.username, job_class]))
+
+@login_required(login_url=LOGIN_URL)
+def job_commit(request, job_id, job_class):
+    '''View to submit the full job previewed by a preview job.'''
+    
+    # retrieve job of specified type
+    job = get_object_or_404(get_class(job_class), pk=job_id)
+    if job.user != request.user and not request.user.is_staff:
+        return HttpResponseForbidden('Only the owner of the job can submit the full job')
+    if not job.is_preview():
+        raise Http404
+    
+    full_job = job.create_full_job()
+    full_job.save()
+    full_job.submit()
+    
+    # redirect to the page of the full job
+    return HttpResponseRedirect(reverse('job_detail', args=[full_job.id, job_class]))
+
+@login_required(login_url=LOGIN_URL)
+def job_download(request, job_id, job_class):
+    '''View to download the output of a job, streamed in chunks, with support for resuming interrupted downloads.'''
+    
+    # retrieve job of specified type
+    job = get_object_or_404(get_class(job_class), pk=job_id)
+    if job.user != request.user and not request.user.is_staff:
+        return HttpResponseForbidden('Only the owner of the job can download its output')
+    if job.status not in JOB_SUCCESS_STATUSES:
+        raise Http404
+    
+    # outputs stored on a remote server are downloaded from there
+    path = job.get_download_path()
+    if path is None:
+        return HttpResponseRedirect(job.url)
+    if not os.path.exists(path):
+        raise Http404
+    
+    response, nbytes = serve_file(request, path, ocgisConfig.get(Config.DEFAULT, 'rootDir'))
+    if nbytes > 0:
+        job.record_download(nbytes)
+    return response
+
+@login_required(login_url=LOGIN_URL)
+def job_status(request, job_id, job_class):
+    '''View to return the status and progress of a job as JSON, without rendering the full job page.
+       The response carries an ETag: clients polling with 'If-None-Match' receive an empty response until the status changes.'''
+    
+    # read only the status fields from the base table
+    job = get_object_or_404(Job.objects.only(*(STATUS_FIELDS + ['user'])), pk=job_id)
+    if job.user_id != request.user.id and not request.user.is_staff:
+        return HttpResponseForbidden('Only the owner of the job can access its status')
+    response_data = get_status(job)
+    etag = get_etag(response_data)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(simplejson.dumps(response_data), mimetype='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@login_required(login_url=LOGIN_URL)
+def jobs_events(request, username):
+    '''View streaming the changes of status and progress of the jobs of a user as Server-Sent Events,
+       so that the pages listing the jobs are updated without being reloaded.'''
+    
+    user = get_object_or_404(User, username=username)
+    if user != request.user and not request.user.is_staff:
+        return HttpResponseForbidden('Only the owner of the jobs can follow their status')
+    
+    # a reconnecting browser resumes after the last event it received
+    since = parse_event_id( request.META.get('HTTP_LAST_EVENT_ID') )
+    response = HttpResponse(job_events(user, since=since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # disable the buffering of the response by nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,13 +1,16 @@
 from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.contrib.formtools.wizard.views import SessionWizardView
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
 from django.contrib.auth.models import User
 
 from ncpp.models.common import JOB_STATUS
-from ncpp.models.open_climate_gis import OpenClimateGisJob
+from ncpp.models.open_climate_gis import OpenClimateGisJob, REQUEST_FIELDS
+from ncpp.models.batch import OpenClimateGisBatchJob
+from ncpp.forms.open_climate_gis import OpenClimateGisForm1
 from ncpp.config.open_climate_gis import ocgisChoices, Config, ocgisConfig, ocgisGeometries, ocgisCalculations
 from ncpp.config import ocgisDatasets
+from ncpp.auth import api_login_required
 from ncpp.utils import get_full_class_name, str2bool, hasText, formatListForDisplay
 from ncpp.utils import get_month_string
 from django.utils import simplejson  
@@ -17,6 +20,40 @@ from django.template import RequestContext
 from datetime import datetime
 import json
 
+def create_job(form_data, user):
+    """Returns a new (unsaved) job built from the merged cleaned data of the forms."""
+    
+    return OpenClimateGisJob(status=JOB_STATUS.UNKNOWN,
+                             user=user,
+                             dataset_category=form_data['dataset_category'],
+                             dataset=form_data['dataset'],
+                             variable=form_data['variable'],
+                             geometry=form_data['geometry'],
+                             # must transform list of integers into string
+                             geometry_id = ",".join(form_data['geometry_id']) if len(form_data['geometry_id'])>0 else None,
+                             latmin=form_data['latmin'],
+                             latmax=form_data['latmax'],
+                             lonmin=form_data['lonmin'],
+                             lonmax=form_data['lonmax'],
+                             lat=form_data['lat'],
+                             lon=form_data['lon'],
+                             datetime_start=form_data['datetime_start'],
+                             datetime_stop=form_data['datetime_stop'],
+                             timeregion_month=",".join(form_data['timeregion_month']),
+                             timeregion_year=form_data['timeregion_year'],
+                             calc=form_data['calc'],
+                             par1=form_data['par1'],
+                             par2=form_data['par2'],
+                             par3=form_data['par3'],
+                             calc_raw=form_data['calc_raw'],
+                             calc_group=",".join(form_data['calc_group']),
+                             spatial_operation=form_data['spatial_operation'],
+                             aggregate=bool(form_data['aggregate']),
+                             output_format=form_data['output_format'],
+                             prefix=form_data['prefix'],
+                             with_auxiliary_files=form_data['with_auxiliary_files'],
+                             preview=bool(form_data.get('preview', False)) )
+
 class OpenClimateGisWizard(SessionWizardView):
     '''Set of views to submit an Open Climate GIS request.'''
     
@@ -98,8 +135,19 @@ class OpenClimateGisWizard(SessionWizardView):
                         job_data['prefix'] = cleaned_data['prefix']    
                     if cleaned_data.has_key('with_auxiliary_files'):
                         job_data['with_auxiliary_files'] = bool(cleaned_data['with_auxiliary_files'])                       
+                    if cleaned_data.has_key('preview'):
+                        job_data['preview'] = bool(cleaned_data['preview'])
                             
             context.update({'job_data': job_data})
+            
+            # estimated cost of the job, and reasons to reject it
+            form_data = {}
+            for step in self.steps.all:
+                if step != self.steps.current:
+                    form_data.update( self.get_cleaned_data_for_step(step) )
+            job = create_job(form_data, self.request.user)
+            estimate = job.get_estimate()
+            context.update({'estimate': estimate, 'estimate_errors': job.estimator.check(estimate) })
                     
         return context
     
@@ -115,42 +163,73 @@ class OpenClimateGisWizard(SessionWizardView):
         user = self.request.user
             
         # persist job specification to database
-        job = OpenClimateGisJob.objects.create(status=JOB_STATUS.UNKNOWN,
-                                               user=user,
-                                               dataset_category=form_data['dataset_category'],
-                                               dataset=form_data['dataset'],
-                                               variable=form_data['variable'],
-                                               geometry=form_data['geometry'],
-                                               # must transform list of integers into string
-                                               geometry_id = ",".join(form_data['geometry_id']) if len(form_data['geometry_id'])>0 else None,
-                                               latmin=form_data['latmin'],
-                                               latmax=form_data['latmax'],
-                                               lonmin=form_data['lonmin'],
-                                               lonmax=form_data['lonmax'],
-                                               lat=form_data['lat'],
-                                               lon=form_data['lon'],
-                                               datetime_start=form_data['datetime_start'],
-                                               datetime_stop=form_data['datetime_stop'],
-                                               timeregion_month=",".join(form_data['timeregion_month']),
-                                               timeregion_year=form_data['timeregion_year'],
-                                               calc=form_data['calc'],
-                                               par1=form_data['par1'],
-                                               par2=form_data['par2'],
-                                               par3=form_data['par3'],
-                                               calc_raw=form_data['calc_raw'],
-                                               calc_group=",".join(form_data['calc_group']),
-                                               spatial_operation=form_data['spatial_operation'],
-                                               aggregate=bool(form_data['aggregate']),
-                                               output_format=form_data['output_format'],
-                                               prefix=form_data['prefix'],
-                                               with_auxiliary_files=form_data['with_auxiliary_files'] )
+        job = create_job(form_data, user)
+        job.save()
         
-        # submit OCG job
+        # submit OCG job (rejected if its estimated cost exceeds the limits)
         job.submit()
         
         # FIXME: pass OCG as additional argument to select jobs
         return HttpResponseRedirect(reverse('job_detail', args=[job.id, get_full_class_name(job)]))    
     
+def validate_request(request):
+    '''Dry-run validation of a request against the dataset metadata, with the same parameters as the first form.
+       Returns the errors of each invalid field, without creating any job.'''
+    
+    form = OpenClimateGisForm1(request.GET)
+    response_data = {}
+    response_data['valid'] = form.is_valid()
+    response_data['errors'] = dict( (field, list(errors)) for field, errors in form.errors.items() )
+    
+    return HttpResponse(simplejson.dumps(response_data), mimetype='application/json')
+    
+@api_login_required
+def submit_batch(request):
+    '''Submits a batch job from a JSON document in the request body:
+       {"template": {job fields}, "geometry_ids": [geometry identifiers], "datasets": [[category, dataset, variable], ...]}.
+       The template holds the fields of a single job request; the batch runs it for all the geometries of each dataset.'''
+    
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        document = json.loads(request.body)
+        template = document['template']
+        geometry_ids = [str(geometry_id) for geometry_id in document.get('geometry_ids', [])]
+        datasets = [list(dataset) for dataset in document.get('datasets', [])]
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Invalid batch document')
+    
+    # the request fields not given in the template take the default values of the forms
+    fields = {'dataset_category':'', 'dataset':'', 'variable':None, 'geometry':None, 'calc_group':'', 'calc_raw':False,
+              'spatial_operation':'intersects', 'aggregate':False, 'output_format':'csv', 'prefix':'ocgis_output',
+              'with_auxiliary_files':False}
+    unknown = [key for key in template.keys() if key not in REQUEST_FIELDS]
+    if len(unknown) > 0:
+        return HttpResponseBadRequest('Unknown template fields: %s' % ', '.join(unknown))
+    fields.update(template)
+    if len(geometry_ids) > 0 and not hasText(fields['geometry']):
+        return HttpResponseBadRequest('The template must select a shape type for the batch geometries')
+    if not hasText(fields['dataset']) and len(datasets) == 0:
+        return HttpResponseBadRequest('The batch must select at least one dataset')
+    if len([dataset for dataset in datasets if len(dataset) != 3]) > 0:
+        return HttpResponseBadRequest('Each dataset must be given as [category, dataset, variable]')
+    
+    job = OpenClimateGisBatchJob(status=JOB_STATUS.UNKNOWN, user=request.user,
+                                 template=OpenClimateGisBatchJob.encode_template(fields),
+                                 geometry_ids=json.dumps(geometry_ids),
+                                 datasets=json.dumps(datasets) if len(datasets) > 0 else None)
+    try:
+        job.get_template()
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date time in the template: use YYYY-MM-DD HH:MM:SS')
+    job.save()
+    job.submit()
+    
+    response_data = {'id':job.id, 'job_class':get_full_class_name(job), 'status':job.status, 'error':job.error,
+                     'detail':reverse('job_detail', args=[job.id, get_full_class_name(job)]),
+                     'status_url':reverse('job_status', args=[job.id, get_full_class_name(job)])}
+    return HttpResponse(simplejson.dumps(response_data), mimetype='application/json')
+    
 def get_geometries(request):
     
     type = request.GET.get('type', None)
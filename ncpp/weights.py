@@ -0,0 +1,119 @@
+# module containing the persistent store of the grid cells covered by each selection geometry
+import hashlib
+import json
+import math
+import os
+
+# version of the stored weights: increment to invalidate all stored weights
+WEIGHTS_VERSION = 2
+
+def get_grid(extent, resolution, nrows, ncols):
+    """Returns the description of a regular grid from its extent (xmin, ymin, xmax, ymax), resolution and shape.
+       The extent is either the outer edges of the cells, or the extent of the cell centers, as computed by ocgis
+       for the datasets without bounds variables: the grid is always described by the outer edges."""
+
+    xmin, ymin, xmax, ymax = [float(value) for value in extent]
+    resolution = float(resolution)
+    nrows, ncols = int(nrows), int(ncols)
+    # extent of the cell centers: half a cell short of the edges on each side
+    if abs((xmax-xmin) - (ncols-1)*resolution) < abs((xmax-xmin) - ncols*resolution):
+        xmin, xmax = xmin - resolution/2, xmax + resolution/2
+    if abs((ymax-ymin) - (nrows-1)*resolution) < abs((ymax-ymin) - nrows*resolution):
+        ymin, ymax = ymin - resolution/2, ymax + resolution/2
+    return {'extent':[round(value, 6) for value in (xmin, ymin, xmax, ymax)], 'resolution':round(resolution, 6),
+            'shape':[nrows, ncols]}
+
+def grid_fingerprint(grid):
+    """Returns the hash identifying a grid, shared by all the datasets on the same grid."""
+
+    return hashlib.sha1( json.dumps(dict(grid, version=WEIGHTS_VERSION), sort_keys=True) ).hexdigest()
+
+def get_cell_bounds(grid, row, col):
+    """Returns the bounds (xmin, ymin, xmax, ymax) of a grid cell, rows counted from the southern edge."""
+
+    xmin, ymin = grid['extent'][0:2]
+    resolution = grid['resolution']
+    return (xmin + col*resolution, ymin + row*resolution, xmin + (col+1)*resolution, ymin + (row+1)*resolution)
+
+def get_cell_centers(grid, weights):
+    """Returns the list of (x, y) centers of the cells listed in the given weights."""
+
+    centers = []
+    for row, col in zip(weights['rows'], weights['cols']):
+        xmin, ymin, xmax, ymax = get_cell_bounds(grid, row, col)
+        centers.append( ((xmin+xmax)/2.0, (ymin+ymax)/2.0) )
+    return centers
+
+def compute_weights(geometry, grid):
+    """Returns the cells of the grid intersecting the shapely geometry, including the cells touching it as selected
+       by the ocgis 'intersects' operation, as a dictionary of lists {'rows', 'cols'}."""
+
+    from shapely.geometry import box
+    from shapely.prepared import prep
+    from shapely.affinity import translate
+
+    xmin, ymin, xmax, ymax = grid['extent']
+    resolution = grid['resolution']
+    nrows, ncols = grid['shape']
+    # grids using longitudes in [0, 360]
+    if xmax > 180 and geometry.bounds[0] < 0:
+        geometry = translate(geometry, xoff=360)
+    gxmin, gymin, gxmax, gymax = geometry.bounds
+
+    prepared = prep(geometry)
+    weights = {'rows':[], 'cols':[]}
+    for row in range( max(0, int( math.floor((gymin-ymin)/resolution) )), min(nrows, int( math.floor((gymax-ymin)/resolution) )+1) ):
+        for col in range( max(0, int( math.floor((gxmin-xmin)/resolution) )), min(ncols, int( math.floor((gxmax-xmin)/resolution) )+1) ):
+            if prepared.intersects( box( *get_cell_bounds(grid, row, col) ) ):
+                weights['rows'].append(row)
+                weights['cols'].append(col)
+    return weights
+
+
+class WeightsStore(object):
+    """Store of the cells covered by the selection geometries, keyed on (geometry category, geometry identifier, grid).
+       The geometries and the grids almost never change, so the weights are computed once and reused across jobs
+       and across the datasets sharing the same grid."""
+
+    def __init__(self, storeDir):
+        # root directory of the store
+        self.storeDir = storeDir
+
+    def _getPath(self, category, ugid, fingerprint):
+        return os.path.join(self.storeDir, category, fingerprint[0:2], fingerprint, '%s.json' % ugid)
+
+    def lookup(self, category, ugid, fingerprint):
+        """Returns the weights stored for a geometry and a grid, or None if not found."""
+
+        try:
+            with open(self._getPath(category, ugid, fingerprint), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def store(self, category, ugid, fingerprint, weights):
+        """Stores the weights of a geometry on a grid."""
+
+        path = self._getPath(category, ugid, fingerprint)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by another worker
+                pass
+        # write a temporary file first, so that concurrent workers never read partial weights
+        tmpPath = "%s.tmp.%s" % (path, os.getpid())
+        with open(tmpPath, 'w') as f:
+            json.dump(weights, f)
+        os.rename(tmpPath, path)
+
+    def getWeights(self, category, ugid, grid, compute):
+        """Returns the weights of a geometry on a grid, calling compute() to calculate them if not stored yet."""
+
+        fingerprint = grid_fingerprint(grid)
+        weights = self.lookup(category, ugid, fingerprint)
+        if weights is None:
+            print 'Computing weights of geometry %s/%s on grid %s' % (category, ugid, fingerprint)
+            weights = compute()
+            self.store(category, ugid, fingerprint, weights)
+        return weights
@@ -0,0 +1,197 @@
+# module containing the pool of worker processes that execute the queued jobs
+from multiprocessing import Process, Event
+import os
+import resource
+import signal
+import socket
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+
+from ncpp.constants import JOB_STATUS
+from ncpp.models.common import Job
+from ncpp.scheduler import get_candidates
+from ncpp.utils import get_class
+
+# number of worker processes: use project setting or default to application specific value
+NUMBER_OF_WORKERS = getattr(settings, "NCPP_WORKERS", 4)
+# number of seconds a worker waits before polling an empty queue again
+POLL_INTERVAL = getattr(settings, "NCPP_WORKERS_POLL_INTERVAL", 2)
+# limits enforced on each job: CPU time in seconds, elapsed time in seconds, address space in MB (None for no limit)
+JOB_CPU_LIMIT = getattr(settings, "NCPP_JOB_CPU_LIMIT", None)
+JOB_WALLCLOCK_LIMIT = getattr(settings, "NCPP_JOB_WALLCLOCK_LIMIT", 6*3600)
+JOB_MEMORY_LIMIT = getattr(settings, "NCPP_JOB_MEMORY_LIMIT", None)
+# number of additional workers executing only the preview jobs, and elapsed time limit of the preview jobs in seconds
+PREVIEW_WORKERS = getattr(settings, "NCPP_PREVIEW_WORKERS", 1)
+PREVIEW_WALLCLOCK_LIMIT = getattr(settings, "NCPP_PREVIEW_WALLCLOCK_LIMIT", 300)
+# number of seconds between two checks of a running job
+JOB_CHECK_INTERVAL = 1
+
+
+def get_worker_prefix():
+    """Returns the prefix shared by the names of all workers running on this host."""
+
+    return "%s:" % socket.gethostname()
+
+def claim_job(worker_name, previews_only=False):
+    """Atomically claims the next job chosen by the scheduler on behalf of the given worker.
+       Returns the job as an instance of its specific subclass, or None if no job can be started."""
+
+    for job in get_candidates(previews_only=previews_only):
+        # the conditional update guarantees that only one worker can claim the job
+        if Job.objects.filter(pk=job.pk, status=JOB_STATUS.QUEUED).update(status=JOB_STATUS.STARTED, worker=worker_name,
+                                                                           updateDateTime=datetime.now()) == 1:
+            return get_class(job.job_class).objects.get(pk=job.pk)
+    return None
+
+def _execute_job(job, cpu_limit, memory_limit):
+    """Executes a claimed job inside the child process, recording a failure if the job raises an unexpected error."""
+
+    # run in a new process group, so that the job can be killed together with any process it started
+    os.setsid()
+    # the soft CPU limit delivers SIGXCPU, the hard limit SIGKILL
+    if cpu_limit is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit+10))
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit*1024*1024, memory_limit*1024*1024))
+    # drop, without closing, the database connection inherited from the worker: it still belongs to the worker
+    connection.connection = None
+
+    try:
+        job.execute()
+    except Exception as e:
+        print 'Job id=%s failed: %s' % (job.id, e)
+        job.status = JOB_STATUS.FAILED
+        job.error = e
+        job.save()
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.join()
+
+def run_job(job, cpu_limit=JOB_CPU_LIMIT, wallclock_limit=JOB_WALLCLOCK_LIMIT, memory_limit=JOB_MEMORY_LIMIT,
+            check_interval=JOB_CHECK_INTERVAL):
+    """Executes a claimed job in a child process subject to the given limits, 
+       stopping it if it exceeds its elapsed time or if the user requests its cancellation."""
+
+    process = Process(target=_execute_job, args=(job, cpu_limit, memory_limit), name='job-%s' % job.id)
+    process.start()
+    started = time.time()
+    status = None
+    while status is None:
+        process.join(check_interval)
+        if not process.is_alive():
+            break
+        if wallclock_limit is not None and time.time()-started > wallclock_limit:
+            status, error = JOB_STATUS.TIMEOUT, 'Job exceeded the elapsed time limit of %s seconds' % wallclock_limit
+        elif Job.objects.filter(pk=job.pk, cancel_requested=True).exists():
+            status, error = JOB_STATUS.CANCELLED, 'Job cancelled by user'
+        if status is not None:
+            _kill(process)
+
+    # the job process died without recording its outcome
+    if status is None and process.exitcode != 0:
+        if process.exitcode == -signal.SIGXCPU:
+            status, error = JOB_STATUS.TIMEOUT, 'Job exceeded the CPU time limit of %s seconds' % cpu_limit
+        else:
+            status, error = JOB_STATUS.FAILED, 'Job process terminated with exit code=%s' % process.exitcode
+
+    if status is not None:
+        get_class(job.job_class).objects.get(pk=job.pk).terminate(status, error)
+
+def requeue_orphans():
+    """Places back on the queue the jobs left running by workers of this host that are no longer alive,
+       for example because the pool was restarted. Returns the number of re-queued jobs."""
+
+    return Job.objects.filter(status=JOB_STATUS.STARTED,
+                              worker__startswith=get_worker_prefix()).update(status=JOB_STATUS.QUEUED, worker=None)
+
+
+class Worker(Process):
+    """Long-lived process that repeatedly claims jobs from the queue and executes them."""
+
+    def __init__(self, name, stop_event, poll_interval=POLL_INTERVAL, previews_only=False):
+        Process.__init__(self, name=name)
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        # flag for the workers reserved for the preview jobs
+        self.previews_only = previews_only
+
+    def run(self):
+
+        # the parent process shuts down the workers through the stop event
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        # never share the database connection inherited from the parent process
+        connection.close()
+        # import the ocgis library once, so that it stays loaded for all subsequent jobs
+        try:
+            import ocgis
+        except ImportError:
+            print 'Worker %s: ocgis library not available' % self.name
+
+        print 'Worker %s started' % self.name
+        while not self.stop_event.is_set():
+            job = claim_job(self.name, previews_only=self.previews_only)
+            if job is None:
+                self.stop_event.wait(self.poll_interval)
+            else:
+                print 'Worker %s running job id=%s' % (self.name, job.id)
+                run_job(job, wallclock_limit=PREVIEW_WALLCLOCK_LIMIT if job.is_preview() else JOB_WALLCLOCK_LIMIT)
+        print 'Worker %s stopped' % self.name
+
+
+class WorkerPool(object):
+    """Fixed-size pool of worker processes, restarting any worker that terminates unexpectedly.
+       The last 'previews' workers only execute the preview jobs, so that previews never wait for long jobs."""
+
+    def __init__(self, size=NUMBER_OF_WORKERS, poll_interval=POLL_INTERVAL, previews=PREVIEW_WORKERS):
+        self.size = size
+        self.previews = previews
+        self.poll_interval = poll_interval
+        self.stop_event = Event()
+        self.workers = []
+
+    def _start_worker(self, index):
+        worker = Worker("%s%s-%s" % (get_worker_prefix(), os.getpid(), index), self.stop_event, poll_interval=self.poll_interval,
+                        previews_only=index >= self.size)
+        worker.start()
+        return worker
+
+    def start(self):
+
+        njobs = requeue_orphans()
+        if njobs > 0:
+            print 'Re-queued %s jobs left running by a previous pool' % njobs
+        # close the connection before forking, each worker opens its own
+        connection.close()
+        self.workers = [self._start_worker(i) for i in range(self.size + self.previews)]
+
+    def stop(self):
+
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join()
+
+    def serve_forever(self):
+        """Starts the workers and supervises them until the process receives SIGTERM or SIGINT."""
+
+        def _shutdown(signum, frame):
+            self.stop_event.set()
+        signal.signal(signal.SIGTERM, _shutdown)
+        signal.signal(signal.SIGINT, _shutdown)
+
+        self.start()
+        while not self.stop_event.is_set():
+            for i, worker in enumerate(self.workers):
+                if not worker.is_alive():
+                    print 'Worker %s exited with code=%s, restarting' % (worker.name, worker.exitcode)
+                    Job.objects.filter(status=JOB_STATUS.STARTED, worker=worker.name).update(status=JOB_STATUS.QUEUED, worker=None)
+                    self.workers[i] = self._start_worker(i)
+            time.sleep(self.poll_interval)
+        self.stop()
@@ -0,0 +1,203 @@
+# module containing the client of the remote WPS servers shared by the climate index jobs: the HTTP connections are kept alive
+# and reused, and the capabilities and process descriptions, which almost never change, are cached across jobs
+from django.conf import settings
+import hashlib
+import httplib
+import os
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+
+# directory of the cached capabilities and process descriptions, shared by all the processes of the host
+WPS_CACHE_DIR = getattr(settings, "NCPP_WPS_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'ncpp_wps_cache'))
+# seconds after which a cached document is requested again from the server
+WPS_CACHE_TTL = getattr(settings, "NCPP_WPS_CACHE_TTL", 24*3600)
+# seconds before an unanswered request fails
+WPS_TIMEOUT = 60
+
+class WPSClientError(Exception):
+    """Error raised when a WPS server returns an HTTP error."""
+
+    def __init__(self, url, status, reason):
+        Exception.__init__(self, 'HTTP error %s (%s) from %s' % (status, reason, url))
+        self.status = status
+
+
+class DocumentCache(object):
+    """Cache of the XML documents returned by GET requests, held in memory and in a directory, for 'ttl' seconds."""
+
+    def __init__(self, cacheDir=WPS_CACHE_DIR, ttl=WPS_CACHE_TTL):
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+        # (time stored, document) of each URL
+        self.documents = {}
+
+    def _getPath(self, url):
+        return os.path.join(self.cacheDir, '%s.xml' % hashlib.sha1(url).hexdigest())
+
+    def lookup(self, url):
+        """Returns the document cached for a URL, or None if not cached or expired."""
+
+        now = time.time()
+        if url in self.documents and now - self.documents[url][0] < self.ttl:
+            return self.documents[url][1]
+        if self.cacheDir is not None:
+            path = self._getPath(url)
+            try:
+                mtime = os.path.getmtime(path)
+                if now - mtime < self.ttl:
+                    with open(path, 'rb') as f:
+                        document = f.read()
+                    self.documents[url] = (mtime, document)
+                    return document
+            except (IOError, OSError):
+                pass
+        return None
+
+    def store(self, url, document):
+        self.documents[url] = (time.time(), document)
+        if self.cacheDir is not None:
+            path = self._getPath(url)
+            # the document is renamed once written, so that other processes never read a partial document
+            tmpPath = "%s.tmp.%s" % (path, os.getpid())
+            try:
+                if not os.path.exists(self.cacheDir):
+                    os.makedirs(self.cacheDir)
+                with open(tmpPath, 'wb') as f:
+                    f.write(document)
+                os.rename(tmpPath, path)
+            except (IOError, OSError) as e:
+                print 'Cannot cache WPS document %s: %s' % (url, e)
+
+
+class WPSClient(object):
+    """Client of a WPS server, built on the owslib objects: the requests are sent on persistent HTTP connections,
+       one per host and thread, and the documents describing the service are read from the cache.
+       The client is shared by all the jobs of a process (see get_client)."""
+
+    def __init__(self, url, cache=None, timeout=WPS_TIMEOUT, verbose=False):
+        self.url = url
+        self.cache = cache or DocumentCache()
+        self.timeout = timeout
+        self.verbose = verbose
+        # open connections of each thread, keyed by (scheme, host)
+        self.local = threading.local()
+        # number of connections opened, and of requests sent to the servers
+        self.connections = 0
+        self.requests = 0
+
+    def _getConnections(self):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        return self.local.connections
+
+    def _getConnection(self, scheme, host):
+        connections = self._getConnections()
+        if (scheme, host) not in connections:
+            connectionClass = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+            connections[(scheme, host)] = connectionClass(host, timeout=self.timeout)
+            self.connections += 1
+        return connections[(scheme, host)]
+
+    def _closeConnection(self, scheme, host):
+        connection = self._getConnections().pop((scheme, host), None)
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """Closes the connections opened by the current thread."""
+
+        for scheme, host in self._getConnections().keys():
+            self._closeConnection(scheme, host)
+
+    def request(self, url, data=None):
+        """Sends a GET request, or a POST request of an XML document, and returns the body of the response.
+           A request failing on a connection that was already used is sent again once on a new connection,
+           since the server may have closed it in the meantime."""
+
+        scheme, host, path, query, fragment = urlparse.urlsplit(url)
+        selector = path + ('?' + query if query else '')
+        headers = {'Connection': 'keep-alive'}
+        if data is not None:
+            headers['Content-Type'] = 'text/xml'
+        for attempt in range(2):
+            reused = (scheme, host) in self._getConnections()
+            connection = self._getConnection(scheme, host)
+            try:
+                connection.request('POST' if data is not None else 'GET', selector or '/', data, headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, IOError):
+                self._closeConnection(scheme, host)
+                if reused and attempt == 0:
+                    continue
+                raise
+            self.requests += 1
+            if response.will_close:
+                self._closeConnection(scheme, host)
+            if response.status >= 400:
+                raise WPSClientError(url, response.status, response.reason)
+            return body
+
+    def get_document(self, params):
+        """Returns a document of the service, from the cache if possible."""
+
+        url = '%s%s%s' % (self.url, '&' if '?' in self.url else '?', urllib.urlencode(sorted(params.items())))
+        document = self.cache.lookup(url)
+        if document is None:
+            document = self.request(url)
+            self.cache.store(url, document)
+        return document
+
+    def get_service(self):
+        """Returns the owslib service, populated from the cached capabilities document."""
+
+        from owslib.wps import WebProcessingService, WPS_DEFAULT_VERSION
+        service = WebProcessingService(self.url, verbose=self.verbose, skip_caps=True)
+        service.getcapabilities( xml=self.get_document({'service':'WPS', 'request':'GetCapabilities', 'version':WPS_DEFAULT_VERSION}) )
+        return service
+
+    def describe_process(self, identifier):
+        """Returns the owslib description of a process, populated from the cached DescribeProcess document."""
+
+        from owslib.wps import WebProcessingService, WPS_DEFAULT_VERSION
+        service = WebProcessingService(self.url, verbose=self.verbose, skip_caps=True)
+        return service.describeprocess( identifier, xml=self.get_document({'service':'WPS', 'request':'DescribeProcess',
+                                                                           'version':WPS_DEFAULT_VERSION, 'identifier':identifier}) )
+
+    def execute(self, identifier, inputs, output=None):
+        """Submits a process execution, and returns the owslib execution holding the request and the first response."""
+
+        from owslib.wps import WebProcessingService, WPSExecution
+        from owslib.etree import etree
+        request = etree.tostring( WPSExecution(url=self.url).buildRequest(identifier, inputs, output) )
+        response = self.request(self.url, request)
+        service = WebProcessingService(self.url, verbose=self.verbose, skip_caps=True)
+        execution = service.execute(identifier, inputs, output=output, request=request, response=response)
+        execution.request = request
+        execution.response = response
+        return execution
+
+    def check_status(self, url):
+        """Returns the owslib execution read from a status location URL."""
+
+        from owslib.wps import WPSExecution
+        execution = WPSExecution(url=self.url, verbose=self.verbose)
+        execution.checkStatus(response=self.request(url), sleepSecs=0)
+        execution.statusLocation = url
+        return execution
+
+
+# clients of the process, keyed by service URL
+_clients = {}
+_lock = threading.Lock()
+
+def get_client(url):
+    """Returns the client of a WPS server shared by all the jobs and threads of the process."""
+
+    with _lock:
+        if url not in _clients:
+            _clients[url] = WPSClient(url)
+        return _clients[url]
@@ -0,0 +1,126 @@
+# module containing the generation of ZIP archives streamed while the files are read, without a temporary copy on disk
+import os
+import struct
+import time
+import zlib
+
+# extensions of the files stored without compression, because they are already compressed (NetCDF-4 with deflate)
+# or hardly compressible
+STORED_EXTENSIONS = ['.nc', '.zip', '.gz', '.png', '.jpg']
+# number of bytes read from disk at once
+ZIP_CHUNK_SIZE = 64*1024
+# sizes and offsets from which the ZIP64 extensions are used (the limit of the classic format is 0xFFFFFFFF,
+# but deflated data may grow slightly beyond the size of the original file)
+ZIP64_LIMIT = (1 << 31) - 1
+
+_MAX_UINT32 = 0xFFFFFFFF
+_MAX_UINT16 = 0xFFFF
+# general purpose flags: sizes and CRC in a data descriptor after the data, UTF-8 file names
+_FLAGS = 0x08 | 0x800
+
+def _dos_datetime(timestamp):
+    """Returns the (time, date) of a timestamp in MS-DOS format."""
+
+    t = time.localtime(timestamp)
+    year = max(1980, t.tm_year)
+    return ( (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+             ((year-1980) << 9) | (t.tm_mon << 5) | t.tm_mday )
+
+
+class ZipStream(object):
+    """Iterable producing a ZIP archive of the given files, entry by entry, as the files are read.
+       Since the sizes and checksums are only known after each file has been read, they are written
+       in a data descriptor after the data of each entry, and in the central directory at the end."""
+
+    def __init__(self, files, stored_extensions=STORED_EXTENSIONS, chunk_size=ZIP_CHUNK_SIZE, zip64_limit=ZIP64_LIMIT):
+        # list of tuples (file path, name in the archive)
+        self.files = files
+        self.stored_extensions = stored_extensions
+        self.chunk_size = chunk_size
+        self.zip64_limit = zip64_limit
+
+    def getSize(self):
+        """Returns the total size of the files to archive."""
+
+        return sum([os.path.getsize(path) for path, arcname in self.files])
+
+    def _entry(self, path, arcname, offset, directory):
+        """Yields the local header, data and data descriptor of one file, and appends its record to the central directory."""
+
+        stat = os.stat(path)
+        name = arcname.encode('utf8') if isinstance(arcname, unicode) else arcname
+        dostime, dosdate = _dos_datetime(stat.st_mtime)
+        stored = os.path.splitext(path)[1].lower() in self.stored_extensions
+        method = 0 if stored else 8
+        zip64 = stat.st_size >= self.zip64_limit
+        version = 45 if zip64 else 20
+
+        # local file header: sizes and CRC are unknown yet, zip64 entries reserve an extra field for them
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else ''
+        yield struct.pack('<IHHHHHIIIHH', 0x04034b50, version, _FLAGS, method, dostime, dosdate, 0,
+                          _MAX_UINT32 if zip64 else 0, _MAX_UINT32 if zip64 else 0, len(name), len(extra)) + name + extra
+
+        # file data
+        crc = 0
+        size = 0
+        compressed_size = 0
+        compressor = None if stored else zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                if compressor is not None:
+                    data = compressor.compress(data)
+                compressed_size += len(data)
+                if data:
+                    yield data
+        if compressor is not None:
+            data = compressor.flush()
+            compressed_size += len(data)
+            yield data
+        crc &= _MAX_UINT32
+
+        # data descriptor
+        if zip64:
+            yield struct.pack('<IIQQ', 0x08074b50, crc, compressed_size, size)
+        else:
+            yield struct.pack('<IIII', 0x08074b50, crc, compressed_size, size)
+
+        # central directory record, with the zip64 fields that do not fit in 32 bits
+        fields = []
+        if zip64:
+            fields = [size, compressed_size]
+        if offset >= self.zip64_limit:
+            fields.append(offset)
+            version = 45
+        extra = struct.pack('<HH', 0x0001, 8*len(fields)) + struct.pack('<%sQ' % len(fields), *fields) if fields else ''
+        directory.append( struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, _FLAGS, method, dostime, dosdate, crc,
+                          _MAX_UINT32 if zip64 else compressed_size, _MAX_UINT32 if zip64 else size,
+                          len(name), len(extra), 0, 0, 0, (stat.st_mode & 0xFFFF) << 16,
+                          _MAX_UINT32 if offset >= self.zip64_limit else offset) + name + extra )
+
+    def __iter__(self):
+
+        offset = 0
+        directory = []
+        for path, arcname in self.files:
+            for data in self._entry(path, arcname, offset, directory):
+                offset += len(data)
+                yield data
+
+        # central directory, and end of central directory records
+        cd_offset = offset
+        cd_size = sum([len(record) for record in directory])
+        for record in directory:
+            yield record
+        nentries = len(directory)
+        if nentries >= _MAX_UINT16 or cd_offset >= self.zip64_limit or cd_size >= self.zip64_limit:
+            zip64_offset = cd_offset + cd_size
+            yield struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, nentries, nentries, cd_size, cd_offset)
+            yield struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1)
+            yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, _MAX_UINT16, _MAX_UINT16, _MAX_UINT32, _MAX_UINT32, 0)
+        else:
+            yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, nentries, nentries, cd_size, cd_offset, 0)
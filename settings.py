@@ -105,4 +105,43 @@ STATIC_ROOT = "./static"
 
 # login settings
 LOGIN_URL = '/ncpp/login/'
-LOGIN_REDIRECT_URL='/ncpp/'
\ No newline at end of file
+LOGIN_REDIRECT_URL='/ncpp/'
+
+# number of worker processes executing the queued jobs (see 'python manage.py ncpp_workers')
+NCPP_WORKERS = 4
+# limits enforced on each job: CPU time (seconds), elapsed time (seconds), memory (MB); None for no limit
+NCPP_JOB_CPU_LIMIT = None
+NCPP_JOB_WALLCLOCK_LIMIT = 6*3600
+NCPP_JOB_MEMORY_LIMIT = None
+# additional workers reserved for the preview jobs, and elapsed time limit (seconds) of the preview jobs
+NCPP_PREVIEW_WORKERS = 1
+NCPP_PREVIEW_WALLCLOCK_LIMIT = 300
+# scheduling of the queued jobs: running jobs and running previews per user, submissions per minute and burst per user,
+# maximum estimated runtime (seconds) of interactive jobs, minimum estimated runtime of jobs deferred to the off-peak hours (start, stop) or None
+NCPP_SCHEDULER_USER_CONCURRENCY = 2
+NCPP_SCHEDULER_PREVIEW_CONCURRENCY = 1
+NCPP_SCHEDULER_SUBMISSION_RATE = 6
+NCPP_SCHEDULER_SUBMISSION_BURST = 10
+NCPP_SCHEDULER_INTERACTIVE_COST = 100
+NCPP_SCHEDULER_OFFPEAK_COST = 10000
+NCPP_SCHEDULER_OFFPEAK_HOURS = None
+# download of the job outputs: size of the chunks streamed by django, or transfer delegated
+# to the front-end server with 'sendfile' (X-Sendfile) or 'accel' (nginx X-Accel-Redirect to NCPP_DOWNLOAD_ACCEL_PREFIX)
+NCPP_DOWNLOAD_CHUNK_SIZE = 64*1024
+NCPP_DOWNLOAD_OFFLOAD = None
+
+# streams of the job status changes (Server-Sent Events): seconds between two reads of the statuses,
+# and seconds after which a stream is closed and re-opened by the browser
+NCPP_EVENTS_POLL_INTERVAL = 1
+NCPP_EVENTS_TIMEOUT = 300
+
+# central poller of the remote WPS executions: concurrent status requests, and bounds of the interval between two checks of an execution
+NCPP_WPS_POLLER_THREADS = 8
+NCPP_WPS_POLL_MIN_INTERVAL = 4
+NCPP_WPS_POLL_MAX_INTERVAL = 300
+# seconds during which the capabilities and process descriptions of the WPS servers are read from the cache (NCPP_WPS_CACHE_DIR)
+NCPP_WPS_CACHE_TTL = 24*3600
+# geometries of the CSC regions sent to the WPS server: full resolution (default), or precomputed simplified version
+#NCPP_CSC_REGIONS_FILEPATH = rel('ncpp', 'static', 'ncpp', 'gml', 'CSCregions_simplified.xml')
+# maximum number of queued climate index jobs (CSV statistics over different regions) submitted as a single WPS execution
+NCPP_CLIMATE_INDEX_GROUP_SIZE = 20
\ No newline at end of file
@@ -0,0 +1,56 @@
+import db
+import os
+from ncpp.climatology import get_climatology_calcs, get_climatology_groupings, encode_grouping
+from ncpp.config import ocgisConfig, ocgisCalculations, Config
+
+
+## run from the top-level directory: python -m util.data_scanner.climatology
+DB_PATH = '/usr/NCPP/database/datasets.sqlite'
+DIR_OUTPUT = '/usr/NCPP/climatology'
+
+
+def get_cube_prefix(field,func,grouping):
+    return('{0}_{1}_{2}_fid{3}'.format(field.name,func,'_'.join(grouping),field.fid))
+
+def compute_cube(field,func,grouping,dir_output):
+    '''
+    Computes the climatology cube of a catalogued field over its whole grid and time range.
+
+    :returns: The path of the NetCDF cube, and the cube field.
+    '''
+
+    import ocgis
+
+    rd = ocgis.RequestDataset(**field.get_request_dataset_kwargs())
+    ops = ocgis.OcgOperations(dataset=rd,calc=[{'func':func,'name':func}],calc_grouping=grouping,
+                              output_format='nc',dir_output=dir_output,prefix=get_cube_prefix(field,func,grouping))
+    path = ops.execute()
+    cube = ocgis.RequestDataset(uri=path,variable=func).get()
+    return(path,cube)
+
+def main(db_path=DB_PATH,dir_output=DIR_OUTPUT):
+    db.connect(db_path)
+    ## create the climatology table in catalogs harvested before it existed
+    db.metadata.create_all()
+    if not os.path.exists(dir_output):
+        os.makedirs(dir_output)
+
+    funcs = get_climatology_calcs(ocgisCalculations.calcs)
+    groups = ocgisConfig.options(Config.CALCULATION_GROUP)
+    with db.session_scope(commit=True) as session:
+        for field in session.query(db.Field).filter(db.Field.type == 'variable'):
+            for func in funcs:
+                for grouping in get_climatology_groupings(groups,field.container.time_frequency):
+                    calc_grouping = encode_grouping(grouping)
+                    kwds = dict(fid=field.fid,func=func,calc_grouping=calc_grouping)
+                    if session.query(db.Climatology).filter_by(**kwds).count() > 0:
+                        continue
+                    print('computing climatology: {0} {1} {2}'.format(field.name,func,calc_grouping))
+                    path,cube = compute_cube(field,func,grouping,dir_output)
+                    session.add(db.Climatology(field,func,calc_grouping,path,func,cube))
+                    session.commit()
+
+
+if __name__ == '__main__':
+    main()
+    print('success.')
@@ -266,3 +266,40 @@ class Field(Base,DictConversion):
 
 assoc_dp_rv = Table('assoc_dp_rv',Base.metadata,Column('dpid',ForeignKey(DataPackage.dpid)),
                     Column('fid',ForeignKey(Field.fid)))
+
+
+class Climatology(Base):
+    __tablename__ = 'climatology'
+    __table_args__ = (UniqueConstraint('fid','func','calc_grouping'),)
+    clid = Column(Integer,primary_key=True)
+    fid = Column(Integer,ForeignKey(Field.fid),nullable=False)
+    func = Column(String,nullable=False)
+    calc_grouping = Column(String,nullable=False)
+    uri = Column(String,nullable=False)
+    variable = Column(String,nullable=False)
+    time_start = Column(DateTime,nullable=False)
+    time_stop = Column(DateTime,nullable=False)
+    time_res_days = Column(Float,nullable=False)
+    time_units = Column(String,nullable=False)
+    time_calendar = Column(String,nullable=False)
+    spatial_envelope = Column(String,nullable=False)
+    spatial_res = Column(String,nullable=False)
+    field_shape = Column(String,nullable=False)
+    
+    field = relationship(Field,backref='climatology')
+    
+    def __init__(self,field,func,calc_grouping,uri,variable,cube):
+        self.field = field
+        self.func = func
+        self.calc_grouping = calc_grouping
+        self.uri = uri
+        self.variable = variable
+        ## the cube covers the time range and the grid of the source container
+        self.time_start = field.container.time_start
+        self.time_stop = field.container.time_stop
+        self.time_res_days = cube.temporal.resolution
+        self.time_units = cube.temporal.units
+        self.time_calendar = cube.temporal.calendar
+        self.spatial_envelope = field.container.spatial_envelope
+        self.spatial_res = field.container.spatial_res
+        self.field_shape = str(cube.shape)